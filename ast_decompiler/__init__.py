@@ -7,3 +7,19 @@ Generate Python code given an AST.
 __version__ = "0.7.0"
 
 from .decompiler import decompile as decompile
+from .decompiler import decompile_iter as decompile_iter
+from .decompiler import decompile_to as decompile_to
+from .decompiler import decompile_with_stats as decompile_with_stats
+from .decompiler import decompile_with_source_map as decompile_with_source_map
+from .decompiler import LayoutStats as LayoutStats
+from .source_map import Position as Position
+from .source_map import SourceMap as SourceMap
+from .cache import CacheStats as CacheStats
+from .cache import DecompileCache as DecompileCache
+from .incremental import decompile_incremental as decompile_incremental
+from .incremental import IncrementalState as IncrementalState
+from .passthrough import decompile_with_source as decompile_with_source
+from .passthrough import ParsedSource as ParsedSource
+from .parallel import DecompileError as DecompileError
+from .parallel import DecompileResult as DecompileResult
+from .parallel import decompile_many as decompile_many
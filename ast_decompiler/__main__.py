@@ -0,0 +1,172 @@
+"""
+
+Command-line interface: decompiles Python files after parsing them.
+
+    python -m ast_decompiler [options] path ...
+
+"""
+
+import argparse
+import ast
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import sys
+import time
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+from . import __version__
+from .cache import write_atomically
+from .check import find_difference
+from .decompiler import OUTPUT_VERSION, decompile
+from .files import find_files
+
+
+class _Options(NamedTuple):
+    indentation: int
+    line_length: int
+    check: bool
+    cache_dir: Optional[str]
+
+
+class _FileResult(NamedTuple):
+    path: str
+    # decompiled code, or None if there was an error
+    code: Optional[str]
+    error: Optional[str]
+    cached: bool
+    source_size: int
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ast_decompiler",
+        description=(
+            "Parse Python files and decompile them. The code is written to standard output"
+            " unless --check is given. Throughput statistics are written to standard"
+            " error."
+        ),
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="files, directories (searched for .py files), or globs"
+    )
+    parser.add_argument("--line-length", type=int, default=100)
+    parser.add_argument("--indentation", type=int, default=4)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="check that the decompiled code parses to the same AST instead of printing it",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory for caching results, keyed by a hash of the file contents",
+    )
+    args = parser.parse_args(argv)
+
+    paths = list(find_files(args.paths))
+    options = _Options(
+        indentation=args.indentation,
+        line_length=args.line_length,
+        check=args.check,
+        cache_dir=args.cache_dir,
+    )
+
+    start = time.perf_counter()
+    if args.jobs == 1:
+        results: Iterable[_FileResult] = (_process(path, options) for path in paths)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        results = executor.map(_process, paths, [options] * len(paths), chunksize=4)
+    num_errors = num_cached = total_size = 0
+    try:
+        for result in results:
+            total_size += result.source_size
+            num_cached += result.cached
+            if result.error is not None:
+                num_errors += 1
+                print(f"{result.path}: {result.error}", file=sys.stderr)
+            elif not options.check:
+                assert result.code is not None
+                sys.stdout.write(result.code)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print(
+        f"{len(paths)} files ({num_cached} cached, {num_errors} failed),"
+        f" {total_size / 1e6:.2f} MB in {elapsed:.2f} s:"
+        f" {len(paths) / elapsed:.1f} files/s, {total_size / 1e6 / elapsed:.2f} MB/s",
+        file=sys.stderr,
+    )
+    return 1 if num_errors else 0
+
+
+def _process(path: str, options: _Options) -> _FileResult:
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError as e:
+        return _FileResult(path, None, str(e), False, 0)
+
+    cache_path = None
+    if options.cache_dir is not None:
+        # Look the file up before parsing it, so that unchanged files cost only a hash. With
+        # --check, an entry is only written once the code has been verified, so the
+        # verification result is cached too.
+        key = hashlib.sha256(
+            repr(
+                (
+                    __version__,
+                    OUTPUT_VERSION,
+                    options.indentation,
+                    options.line_length,
+                    options.check,
+                )
+            ).encode()
+        )
+        key.update(source)
+        digest = key.hexdigest()
+        # spread the files over subdirectories, to keep directories small
+        cache_path = os.path.join(options.cache_dir, digest[:2], digest)
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                code = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            return _FileResult(path, code, None, True, len(source))
+
+    try:
+        tree = ast.parse(source, filename=path)
+        code = decompile(
+            tree, indentation=options.indentation, line_length=options.line_length
+        )
+        if options.check:
+            difference = find_difference(tree, ast.parse(code))
+            if difference is not None:
+                return _FileResult(
+                    path,
+                    None,
+                    f"decompiled code differs at {difference[0]}",
+                    False,
+                    len(source),
+                )
+    except Exception as e:
+        return _FileResult(path, None, f"{type(e).__name__}: {e}", False, len(source))
+
+    if options.check:
+        # the code is not printed, so neither store it nor send it back from a worker process
+        code = ""
+    if cache_path is not None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        write_atomically(cache_path, code)
+    return _FileResult(path, code, None, False, len(source))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+
+Splitting source code into the lines of parsed statements, for the modules that copy code
+instead of rendering it.
+
+"""
+
+import ast
+from typing import List, Union
+
+# A compound statement with a single block
+Block = Union[
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.If,
+    ast.For,
+    ast.AsyncFor,
+    ast.While,
+    ast.With,
+    ast.AsyncWith,
+]
+
+
+def split_lines(code: str) -> List[str]:
+    """Splits code into lines, keeping the line breaks."""
+    # not str.splitlines(), which also splits on characters that the parser does not treat as
+    # line breaks, such as form feeds
+    lines = [line + "\n" for line in code.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines
+
+
+def first_line(statement: ast.stmt) -> int:
+    """Returns the line number of the first line of a parsed statement, or of its decorators."""
+    return min(
+        [statement.lineno]
+        + [decorator.lineno for decorator in getattr(statement, "decorator_list", ())]
+    )
+
+
+def header_end(lines: List[str], statement: Block) -> int:
+    """Returns the index of the line after the header of a parsed compound statement."""
+    # the blank lines before the first statement are part of its code
+    end = first_line(statement.body[0]) - 1
+    while not lines[end - 1].strip():
+        end -= 1
+    return end
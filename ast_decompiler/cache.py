@@ -0,0 +1,180 @@
+"""
+
+Caching of decompiled code, keyed by the structure of the tree.
+
+"""
+
+import ast
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from . import __version__
+from .decompiler import OUTPUT_VERSION, decompile
+from .hashing import structural_hash
+
+
+class CacheStats:
+    """Counters for a DecompileCache."""
+
+    __slots__ = ("hits", "disk_hits", "misses", "evictions", "disk_writes")
+
+    def __init__(self) -> None:
+        # lookups found in memory
+        self.hits = 0
+        # lookups not found in memory, but found on disk
+        self.disk_hits = 0
+        # lookups that had to decompile the tree
+        self.misses = 0
+        # entries dropped from memory because it was full
+        self.evictions = 0
+        # entries written to disk
+        self.disk_writes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups that did not have to decompile the tree."""
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_writes": self.disk_writes,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class DecompileCache:
+    """Cache in front of decompile(), for trees that are decompiled repeatedly.
+
+    Entries are keyed by a hash of the structure of the tree, ignoring positions, and of the
+    options, so equal trees share an entry even if they are different objects. The most recently
+    used entries are kept in memory. If a directory is given, entries are also stored there,
+    one file per entry; files are written atomically, so processes can share the directory.
+
+    Usage:
+
+        cache = DecompileCache(maxsize=10000, directory=".decompile-cache")
+        code = decompile(tree, cache=cache)
+
+    """
+
+    def __init__(self, maxsize: int = 1024, directory: Optional[str] = None) -> None:
+        self.maxsize = maxsize
+        self.directory = directory
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(
+        self,
+        tree: ast.AST,
+        indentation: int = 4,
+        line_length: int = 100,
+        starting_indentation: int = 0,
+    ) -> str:
+        """Returns the key of the entry for a tree, as a hexadecimal string."""
+        key = hashlib.sha256(
+            repr(
+                (
+                    __version__,
+                    OUTPUT_VERSION,
+                    indentation,
+                    line_length,
+                    starting_indentation,
+                )
+            ).encode()
+        )
+        key.update(structural_hash(tree).encode())
+        return key.hexdigest()
+
+    def decompile(
+        self,
+        tree: ast.AST,
+        indentation: int = 4,
+        line_length: int = 100,
+        starting_indentation: int = 0,
+        workers: Optional[int] = 1,
+    ) -> str:
+        """Returns the code for a tree from the cache, decompiling it if it is not there."""
+        key = self.key(tree, indentation, line_length, starting_indentation)
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return code
+
+        code = self._read(key)
+        if code is not None:
+            with self._lock:
+                self.stats.disk_hits += 1
+        else:
+            code = decompile(
+                tree,
+                indentation=indentation,
+                line_length=line_length,
+                starting_indentation=starting_indentation,
+                workers=workers,
+            )
+            with self._lock:
+                self.stats.misses += 1
+            self._write(key, code)
+
+        with self._lock:
+            self._entries[key] = code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+        return code
+
+    def clear(self) -> None:
+        """Removes all entries from memory. Entries on disk are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def _path(self, key: str) -> str:
+        assert self.directory is not None
+        # spread the files over subdirectories, to keep directories small
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, key: str) -> Optional[str]:
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key: str, code: str) -> None:
+        if self.directory is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomically(path, code)
+        with self._lock:
+            self.stats.disk_writes += 1
+
+
+def write_atomically(path: str, text: str) -> None:
+    """Writes a file so that concurrent readers never see it partially written."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -1,6 +1,6 @@
 import ast
 from ast_decompiler import decompile
-import difflib
+from typing import Any, List, Optional, Tuple
 
 
 def check(code: str, line_length=100) -> None:
@@ -22,12 +22,68 @@ def check(code: str, line_length=100) -> None:
             print(line)
         raise
 
-    dumped = ast.dump(ast.parse(code))
-    new_dumped = ast.dump(new_tree)
-
-    if dumped != new_dumped:
+    difference = find_difference(tree, new_tree)
+    if difference is not None:
+        path, old, new = difference
         print(code)
         print(new_code)
-        for line in difflib.unified_diff(dumped.split(), new_dumped.split()):
-            print(line)
-        assert False, f"{dumped} != {new_dumped}"
+        assert False, f"difference at {path}: {_describe(old)} != {_describe(new)}"
+
+
+def find_difference(left: Any, right: Any) -> Optional[Tuple[str, Any, Any]]:
+    """Compares two ASTs, ignoring positions, as ast.dump() would.
+
+    Returns None if they are the same. Otherwise, returns the path to the first difference
+    (such as "body[0].value.args[1]") and the differing values from each tree.
+
+    """
+    # pairs of values to compare, with their path as a linked list of (parent path, field)
+    stack: List[Tuple[Any, Any, Any]] = [(None, left, right)]
+    while stack:
+        path, left, right = stack.pop()
+        if type(left) is not type(right):
+            return _format_path(path), left, right
+        if isinstance(left, ast.AST):
+            # push in reverse, so that the first difference in source order is found first
+            for field in reversed(left._fields):
+                stack.append(
+                    (
+                        (path, field),
+                        getattr(left, field, None),
+                        getattr(right, field, None),
+                    )
+                )
+        elif isinstance(left, list):
+            if len(left) != len(right):
+                return _format_path(path), left, right
+            for i in reversed(range(len(left))):
+                stack.append(((path, i), left[i], right[i]))
+        elif isinstance(left, (float, complex)):
+            # distinguishes -0.0 from 0.0 and treats NaN as equal to itself, like ast.dump()
+            if repr(left) != repr(right):
+                return _format_path(path), left, right
+        elif left != right:
+            return _format_path(path), left, right
+    return None
+
+
+def _format_path(path: Any) -> str:
+    parts = []
+    while path is not None:
+        path, part = path
+        if isinstance(part, int):
+            parts.append(f"[{part}]")
+        elif path is None:
+            parts.append(part)
+        else:
+            parts.append(f".{part}")
+    return "".join(reversed(parts))
+
+
+def _describe(value: Any) -> str:
+    if isinstance(value, ast.AST):
+        return ast.dump(value)
+    elif isinstance(value, list):
+        return f"[{', '.join(map(_describe, value))}]"
+    else:
+        return repr(value)
@@ -6,10 +6,40 @@ Implementation of the decompiler class.
 
 import ast
 import cmath
+import codecs
+import enum
+import io
 from contextlib import contextmanager
 import math
 import sys
-from typing import Any, Dict, Generator, Iterable, Optional, Sequence, Type, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+    Union,
+)
+
+from .literals import StringRenderer
+from .profiling import Profile
+from .source_map import SourceMap, SourceMapRecorder
+
+if TYPE_CHECKING:
+    from .cache import DecompileCache
+
+# Version of the format of the decompiled code, which is part of the keys of cached code. It
+# must be increased whenever the code produced for some tree changes.
+OUTPUT_VERSION = 2
 
 _OP_TO_STR = {
     ast.Add: "+",
@@ -83,11 +113,125 @@ _PRECEDENCE: Dict[Type[ast.AST], int] = {
 }
 
 
+def precedence_of_node(node: Optional[ast.AST]) -> int:
+    if node is None:
+        return -1
+    if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.BoolOp)):
+        return _PRECEDENCE[type(node.op)]
+    return _PRECEDENCE.get(type(node), -1)
+
+
+def _boolop_needs_parens(node: ast.AST, parent: Optional[ast.AST]) -> bool:
+    return precedence_of_node(node) <= precedence_of_node(parent)
+
+
+def _unaryop_needs_parens(node: ast.AST, parent: Optional[ast.AST]) -> bool:
+    return precedence_of_node(node) < precedence_of_node(parent)
+
+
+def _binop_needs_parens(node: ast.BinOp, parent: Optional[ast.AST]) -> bool:
+    my_prec = precedence_of_node(node)
+    parent_prec = precedence_of_node(parent)
+    if my_prec < parent_prec:
+        return True
+    elif my_prec == parent_prec and isinstance(parent, ast.BinOp):
+        if isinstance(node.op, ast.Pow):
+            return node is parent.left
+        else:
+            return node is parent.right
+    else:
+        return False
+
+
+def _lambda_needs_parens(node: ast.Lambda, parent: Optional[ast.AST]) -> bool:
+    return isinstance(
+        parent,
+        (
+            ast.BinOp,
+            ast.UnaryOp,
+            ast.Compare,
+            ast.IfExp,
+            ast.Attribute,
+            ast.Subscript,
+            ast.Call,
+            ast.BoolOp,
+        ),
+    ) or (
+        # Parens are required in 3.9+, but let's just always add them.
+        isinstance(parent, ast.comprehension)
+        and node in parent.ifs
+    )
+
+
+def _ifexp_needs_parens(node: ast.IfExp, parent: Optional[ast.AST]) -> bool:
+    if isinstance(
+        parent,
+        (
+            ast.BinOp,
+            ast.UnaryOp,
+            ast.Compare,
+            ast.Attribute,
+            ast.Subscript,
+            ast.Call,
+            ast.BoolOp,
+            ast.comprehension,
+        ),
+    ):
+        return True
+    return isinstance(parent, ast.IfExp) and (
+        node is parent.test or node is parent.body
+    )
+
+
+def _yield_needs_parens(node: ast.AST, parent: Optional[ast.AST]) -> bool:
+    return not isinstance(parent, (ast.Expr, ast.Assign, ast.AugAssign))
+
+
+def _tuple_needs_parens(node: ast.Tuple, parent: Optional[ast.AST]) -> bool:
+    if isinstance(parent, ast.comprehension) and node is parent.target:
+        return False
+    if isinstance(parent, ast.Subscript) and node is parent.slice:
+        return False
+    return not isinstance(
+        parent, (ast.Expr, ast.Assign, ast.AugAssign, ast.Return, ast.Yield, ast.Index)
+    )
+
+
+_NEEDS_PARENS: Dict[Type[ast.AST], Callable[[Any, Optional[ast.AST]], bool]] = {
+    ast.BoolOp: _boolop_needs_parens,
+    ast.Compare: _boolop_needs_parens,
+    ast.UnaryOp: _unaryop_needs_parens,
+    ast.BinOp: _binop_needs_parens,
+    ast.Lambda: _lambda_needs_parens,
+    ast.IfExp: _ifexp_needs_parens,
+    ast.Await: _yield_needs_parens,
+    ast.Yield: _yield_needs_parens,
+    ast.YieldFrom: _yield_needs_parens,
+    ast.Tuple: _tuple_needs_parens,
+}
+
+
+def needs_parens(node: ast.AST, parent: Optional[ast.AST]) -> bool:
+    """Returns whether an expression must be parenthesized when rendered inside parent.
+
+    parent is the node that is rendered around the expression, which may be one of the helper
+    nodes created while rendering (such as _CallArgs for the arguments of a call).
+
+    """
+    try:
+        rule = _NEEDS_PARENS[node.__class__]
+    except KeyError:
+        return False
+    return rule(node, parent)
+
+
 def decompile(
     ast: ast.AST,
     indentation: int = 4,
     line_length: int = 100,
     starting_indentation: int = 0,
+    workers: Optional[int] = 1,
+    cache: Optional["DecompileCache"] = None,
 ) -> str:
     """Decompiles an AST into Python code.
 
@@ -97,8 +241,29 @@ def decompile(
     - line_length: if lines become longer than this length, ast_decompiler will try to break them up
       (but it will not necessarily succeed in all cases)
     - starting_indentation: indentation level at which to start producing code
+    - workers: maximum number of processes used to render the top-level statements of a large
+      module in parallel (None for the number of CPUs). The code produced is the same.
+    - cache: a DecompileCache to look the code up in, and to store it in
 
     """
+    if cache is not None:
+        return cache.decompile(
+            ast,
+            indentation=indentation,
+            line_length=line_length,
+            starting_indentation=starting_indentation,
+            workers=workers,
+        )
+    if workers != 1:
+        from .parallel import decompile_module
+
+        return decompile_module(
+            ast,
+            workers=workers,
+            indentation=indentation,
+            line_length=line_length,
+            starting_indentation=starting_indentation,
+        )
     decompiler = Decompiler(
         indentation=indentation,
         line_length=line_length,
@@ -107,6 +272,144 @@ def decompile(
     return decompiler.run(ast)
 
 
+def decompile_iter(
+    ast: ast.AST,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+) -> Iterator[str]:
+    """Decompiles an AST into Python code, yielding the code for each top-level statement.
+
+    Takes the same arguments as decompile(). Joining the chunks produces the same code as
+    decompile(), but only the code for one statement is held in memory at a time.
+
+    """
+    decompiler = Decompiler(
+        indentation=indentation,
+        line_length=line_length,
+        starting_indentation=starting_indentation,
+    )
+    return decompiler.run_iter(ast)
+
+
+class LayoutStats(NamedTuple):
+    """Statistics about how code was rendered, as returned by decompile_with_stats()."""
+
+    # number of expression lists broken over multiple lines because they did not fit on one
+    multiline_groups: int
+    # maximum depth of the stack of nodes being rendered, including helper nodes
+    max_depth: int
+    # number of times a node was rendered; nodes that appear more than once in the tree may be
+    # rendered more than once
+    nodes_visited: int
+    # number of distinct nodes rendered; the parser reuses the same operator nodes throughout
+    # the tree
+    unique_nodes: int
+    # number of renderings of nodes that were reused from the render cache
+    render_cache_hits: int
+    # number of code fragments written to the output buffer
+    fragments: int
+    # number of lines of code produced
+    lines: int
+
+
+def decompile_with_stats(
+    ast: ast.AST,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+) -> Tuple[str, LayoutStats]:
+    """Decompiles an AST into Python code, and also returns statistics about the layout.
+
+    Takes the same arguments as decompile(). Collecting the statistics makes decompilation
+    somewhat slower.
+
+    """
+    decompiler = Decompiler(
+        indentation=indentation,
+        line_length=line_length,
+        starting_indentation=starting_indentation,
+    )
+    return decompiler.run_with_stats(ast)
+
+
+def decompile_with_source_map(
+    ast: ast.AST,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+) -> Tuple[str, SourceMap]:
+    """Decompiles an AST into Python code, and also returns where the code for each node is.
+
+    Takes the same arguments as decompile(). The SourceMap gives the position of each node in
+    the code, as ast.parse() would set it, so the code does not have to be parsed again to find
+    the nodes in it. Recording the positions makes decompilation somewhat slower.
+
+    """
+    decompiler = Decompiler(
+        indentation=indentation,
+        line_length=line_length,
+        starting_indentation=starting_indentation,
+    )
+    return decompiler.run_with_source_map(ast)
+
+
+def decompile_to(
+    ast: ast.AST,
+    fp: Any,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+    encoding: str = "utf-8",
+    buffer_size: int = 64 * 1024,
+    binary: Optional[bool] = None,
+) -> None:
+    """Decompiles an AST into Python code and writes it to a file-like object.
+
+    fp may be a text file, a binary file (including compressed files such as those returned by
+    gzip.open() or lzma.open() in binary mode), or a socket. Code for binary files and sockets
+    is encoded with the given encoding. Whether fp is binary is detected from its type or its
+    mode, unless binary is given. Code is written as top-level statements are rendered, in
+    chunks of about buffer_size characters. The other arguments are the same as for
+    decompile().
+
+    """
+    write = fp.sendall if hasattr(fp, "sendall") else fp.write
+    if binary is None:
+        binary = _is_binary(fp)
+    pending: List[str] = []
+    pending_size = 0
+    for chunk in decompile_iter(
+        ast,
+        indentation=indentation,
+        line_length=line_length,
+        starting_indentation=starting_indentation,
+    ):
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= buffer_size:
+            code = "".join(pending)
+            write(code.encode(encoding) if binary else code)
+            pending.clear()
+            pending_size = 0
+    if pending:
+        code = "".join(pending)
+        write(code.encode(encoding) if binary else code)
+
+
+def _is_binary(fp: Any) -> bool:
+    """Returns whether a file-like object takes bytes rather than str."""
+    if hasattr(fp, "sendall"):
+        return True
+    # codecs streams take str, but delegate mode to the binary file they write to
+    if isinstance(fp, (io.TextIOBase, codecs.StreamWriter, codecs.StreamReaderWriter)):
+        return False
+    if isinstance(fp, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    mode = getattr(fp, "mode", None)
+    return isinstance(mode, str) and "b" in mode
+
+
 # helper ast nodes to make decompilation easier
 class KeyValuePair(ast.AST):
     """A key-value pair as used in a dictionary display."""
@@ -146,37 +449,511 @@ class KeywordArg(ast.AST):
         self.value = value
 
 
+class LineBuffer:
+    """Buffer that decompiled code is written into.
+
+    The length of the current line is kept up to date as code is written, so reading it takes
+    constant time. A checkpoint records the state of the buffer, and restoring it discards
+    everything written since in time proportional to the number of discarded fragments.
+
+    """
+
+    __slots__ = ("fragments", "column", "_indentation_cache")
+
+    def __init__(self) -> None:
+        self.fragments: List[str] = []
+        # length of the current line
+        self.column = 0
+        self._indentation_cache: Dict[int, str] = {}
+
+    def write(self, code: str) -> None:
+        self.fragments.append(code)
+        self.column += len(code)
+
+    def write_indentation(self, indentation: int) -> None:
+        try:
+            code = self._indentation_cache[indentation]
+        except KeyError:
+            code = self._indentation_cache[indentation] = " " * indentation
+        self.fragments.append(code)
+        self.column += indentation
+
+    def write_newline(self) -> None:
+        self.fragments.append("\n")
+        self.column = 0
+
+    def checkpoint(self) -> Tuple[int, int]:
+        return len(self.fragments), self.column
+
+    def restore(self, checkpoint: Tuple[int, int]) -> None:
+        num_fragments, self.column = checkpoint
+        del self.fragments[num_fragments:]
+
+    def getvalue(self) -> str:
+        return "".join(self.fragments)
+
+    def pop_value(self) -> str:
+        """Returns everything written so far and removes it from the buffer."""
+        value = "".join(self.fragments)
+        self.fragments.clear()
+        return value
+
+
+class _Group:
+    """A list of rendered expressions that may be broken up over multiple lines.
+
+    Layout is decided only once the outermost group has been rendered: a group is written on a
+    single line if it fits from the column where it starts, and with one item per line otherwise.
+    Because width is the precomputed single-line width of the group, this decision is made in
+    constant time.
+
+    """
+
+    __slots__ = (
+        "docs",
+        "separator",
+        "allow_newlines",
+        "need_parens",
+        "final_separator_if_multiline",
+        "width",
+        "simple",
+    )
+
+    def __init__(
+        self,
+        docs: Sequence["_Doc"],
+        width: int,
+        separator: str,
+        allow_newlines: bool,
+        need_parens: bool,
+        final_separator_if_multiline: bool,
+        simple: bool,
+    ) -> None:
+        self.docs = docs
+        self.separator = separator
+        self.allow_newlines = allow_newlines
+        self.need_parens = need_parens
+        self.final_separator_if_multiline = final_separator_if_multiline
+        self.width = width
+        # whether all docs are strings
+        self.simple = simple
+
+
+class _Layout(enum.Enum):
+    """Instructions used in laying out a group over multiple lines."""
+
+    newline = 1
+    indentation = 2
+    indent = 3
+    dedent = 4
+
+
+# A rendered expression: code fragments, groups whose layout has not been decided yet, nested
+# documents holding the cached rendering of a node, and markers for recording a source map.
+_Doc = List[Union[str, _Group, List[Any], object]]
+
+# State of a node that is being rendered: the generator rendering it, the node, the width
+# written before it, and its key in the render cache and position in the document if cached.
+_Frame = Tuple[Iterator[ast.AST], ast.AST, int, Optional[Tuple[Any, ...]], int]
+
+# Nodes that are cheaper to render again than to look up in the render cache.
+_UNCACHED_TYPES = (ast.Name, ast.Constant)
+
+# Nodes for f-strings and t-strings, and for the replacement fields inside them.
+if sys.version_info >= (3, 14):
+    _STRING_TYPES: Tuple[Type[ast.AST], ...] = (ast.JoinedStr, ast.TemplateStr)
+    _REPLACEMENT_FIELD_TYPES: Tuple[Type[ast.AST], ...] = (
+        ast.FormattedValue,
+        ast.Interpolation,
+    )
+else:
+    _STRING_TYPES = (ast.JoinedStr,)
+    _REPLACEMENT_FIELD_TYPES = (ast.FormattedValue,)
+
+# Try statements whose handlers are written as except*.
+if sys.version_info >= (3, 11):
+    _TRY_STAR_TYPES: Tuple[Type[ast.AST], ...] = (ast.TryStar,)
+else:
+    _TRY_STAR_TYPES = ()
+
+# Node types whose presence among the ancestors of the current node is tracked, so that it can
+# be checked in constant time.
+_ANCESTOR_TYPES: Tuple[Type[ast.AST], ...] = (
+    ast.FormattedValue,
+    ast.JoinedStr,
+    ast.Lambda,
+    ast.ListComp,
+    ast.SetComp,
+    ast.DictComp,
+    ast.GeneratorExp,
+    *_STRING_TYPES[1:],
+    *_REPLACEMENT_FIELD_TYPES[1:],
+)
+
+# Helper methods that are profiled separately from the visit methods calling them.
+_PROFILED_METHODS = (
+    "write_expression_list",
+    "write_doc",
+    "write_suite",
+    "write_constant",
+    "write_string",
+    "write_number",
+)
+
+# Function rendering a node; generators yield the children of the node.
+_Visitor = Callable[["Decompiler", Any], Optional[Iterator[ast.AST]]]
+
+# Helper nodes that are created anew for each rendering of their parent. Their children are
+# rendered the same way regardless of which instance is their parent.
+_HELPER_TYPES = (KeyValuePair, StarArg, DoubleStarArg, KeywordArg)
+
+
 class Decompiler(ast.NodeVisitor):
+    # visit method for each node class, built when the class is created
+    visitors: Dict[Type[ast.AST], _Visitor]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.visitors = cls.build_visitors()
+
+    @classmethod
+    def build_visitors(cls) -> Dict[Type[ast.AST], _Visitor]:
+        """Returns the visit method for each node class that currently exists."""
+        visitors = {}
+        node_classes = [ast.AST]
+        while node_classes:
+            node_class = node_classes.pop()
+            node_classes += node_class.__subclasses__()
+            visitors[node_class] = getattr(
+                cls, "visit_" + node_class.__name__, cls.generic_visit
+            )
+        return visitors
+
     def __init__(
-        self, indentation: int, line_length: int, starting_indentation: int
+        self,
+        indentation: int,
+        line_length: int,
+        starting_indentation: int,
+        profile: bool = False,
     ) -> None:
-        self.lines = []
-        self.current_line = []
+        self.buffer = LineBuffer()
         self.current_indentation = starting_indentation
         self.node_stack = []
+        # number of nodes of each of _ANCESTOR_TYPES with children on the node stack
+        self.ancestor_counts: Dict[Type[ast.AST], int] = dict.fromkeys(
+            _ANCESTOR_TYPES, 0
+        )
+        # document that expressions are currently rendered into, if inside write_expression_list
+        self.doc: Optional[_Doc] = None
+        # single-line width of everything written into documents so far
+        self.written_width = 0
+        # number of groups and cached renderings written into documents, which tells whether a
+        # document holds only code fragments without scanning it
+        self.written_objects = 0
+        # single-line width of each node with children rendered inside a document, recorded
+        # when it has been rendered, which tells whether a node appears more than once
+        self.flat_widths: Dict[ast.AST, int] = {}
+        # If statement in the else block of the If being rendered, which is rendered as an elif
+        self.elif_node: Optional[ast.If] = None
+        # rendering of nodes that appear more than once in the tree, keyed by node and context
+        self.render_cache: Dict[Tuple[ast.AST, object, bool], Tuple[_Doc, int]] = {}
+        self.render_cache_hits = 0
+        self.render_cache_misses = 0
+        # number of groups that were broken over multiple lines
+        self.multiline_groups = 0
+        # renderings of string literals, which are reused for repeated values
+        self.strings = StringRenderer()
         self.indentation = indentation
         self.max_line_length = line_length
+        # time and output per node type and method, if profiling is enabled
+        self.profile: Optional[Profile] = None
+        # positions of the nodes rendered, while running run_with_source_map()
+        self.source_map: Optional[SourceMapRecorder] = None
+        if profile:
+            self.enable_profiling()
+
+    def enable_profiling(self) -> None:
+        """Records a Profile of everything rendered from now on in self.profile.
+
+        Visit methods and the helper methods in _PROFILED_METHODS are wrapped for this
+        instance only, so decompilers without profiling run at full speed.
+
+        """
+        profile = self.profile = Profile()
+        self.visitors = {
+            node_class: profile.wrap_visitor(visitor)
+            for node_class, visitor in type(self).visitors.items()
+        }
+        for name in _PROFILED_METHODS:
+            setattr(self, name, profile.wrap_method(getattr(self, name)))
+        self.write = profile.wrap_write(self.write)
+        write_indentation = self.write_indentation
+        write_newline = self.write_newline
+
+        def profiled_write_indentation() -> None:
+            profile.bytes_written += self.current_indentation
+            write_indentation()
+
+        def profiled_write_newline() -> None:
+            profile.bytes_written += 1
+            write_newline()
+
+        self.write_indentation = profiled_write_indentation
+        self.write_newline = profiled_write_newline
 
     def run(self, ast: ast.AST) -> str:
         self.visit(ast)
-        if self.current_line:
-            self.lines.append("".join(self.current_line))
-            self.current_line = []
-        return "".join(self.lines)
-
-    def visit(self, node: ast.AST) -> None:
-        self.node_stack.append(node)
+        return self.buffer.getvalue()
+
+    def run_with_stats(self, tree: ast.AST) -> Tuple[str, LayoutStats]:
+        """Decompiles a tree, collecting LayoutStats while doing so."""
+        nodes_visited = 0
+        unique_nodes: Set[ast.AST] = set()
+        max_depth = 0
+        node_stack = self.node_stack
+
+        def wrap(visitor: _Visitor) -> _Visitor:
+            def counting_visitor(
+                decompiler: Decompiler, node: ast.AST
+            ) -> Optional[Iterator[ast.AST]]:
+                nonlocal nodes_visited, max_depth
+                nodes_visited += 1
+                unique_nodes.add(node)
+                max_depth = max(max_depth, len(node_stack))
+                return visitor(decompiler, node)
+
+            return counting_visitor
+
+        visitors = self.visitors
+        self.visitors = {
+            node_class: wrap(visitor) for node_class, visitor in visitors.items()
+        }
+        try:
+            code = self.run(tree)
+        finally:
+            self.visitors = visitors
+        stats = LayoutStats(
+            multiline_groups=self.multiline_groups,
+            max_depth=max_depth,
+            nodes_visited=nodes_visited,
+            unique_nodes=len(unique_nodes),
+            render_cache_hits=self.render_cache_hits,
+            fragments=len(self.buffer.fragments),
+            lines=code.count("\n"),
+        )
+        return code, stats
+
+    def run_with_source_map(self, tree: ast.AST) -> Tuple[str, SourceMap]:
+        """Decompiles a tree, recording where the code for each node is in a SourceMap."""
+        recorder = self.source_map = SourceMapRecorder(self.buffer.fragments)
+        visitors = self.visitors
+        self.visitors = {
+            node_class: (
+                visitor
+                if issubclass(node_class, _HELPER_TYPES)
+                else recorder.wrap_visitor(visitor)
+            )
+            for node_class, visitor in visitors.items()
+        }
+        try:
+            self.run(tree)
+        finally:
+            self.visitors = visitors
+            self.source_map = None
+        source_map = recorder.build()
+        return source_map.code, source_map
+
+    def run_iter(self, tree: ast.AST) -> Iterator[str]:
+        """Yields the code for each top-level statement as soon as it has been rendered."""
+        if not isinstance(tree, (ast.Module, ast.Interactive)):
+            yield self.run(tree)
+            return
+        self.node_stack.append(tree)
         try:
-            super().visit(node)
+            for statement in tree.body:
+                self.visit(statement)
+                # nodes in later statements are different from the ones in this statement,
+                # unless the tree reuses nodes, so don't keep these around; strings are
+                # forgotten too, so memory is bounded by the largest statement
+                self.flat_widths.clear()
+                self.render_cache.clear()
+                self.strings.clear()
+                code = self.buffer.pop_value()
+                if code:
+                    yield code
         finally:
             self.node_stack.pop()
 
+    def visit(self, node: ast.AST) -> None:
+        """Renders a node.
+
+        Handlers for nodes with children are generators that yield each child in turn. The
+        children are rendered by the loop here before the handler is resumed, instead of through
+        recursive calls, so trees of any depth can be rendered.
+
+        """
+        node_stack = self.node_stack
+        push_node = node_stack.append
+        pop_node = node_stack.pop
+        ancestor_counts = self.ancestor_counts
+        flat_widths = self.flat_widths
+        visitors = self.visitors
+        depth = len(node_stack)
+        frames: List[_Frame] = []
+        push_frame = frames.append
+        try:
+            while True:
+                # start rendering the node
+                if (
+                    node in flat_widths
+                    and self.doc is not None
+                    and isinstance(node, ast.expr)
+                    and not isinstance(node, _UNCACHED_TYPES)
+                ):
+                    # the node appears more than once in the tree
+                    key = self.render_cache_key(node)
+                    if self.write_cached(node, key):
+                        node = None
+                else:
+                    key = None
+                if node is not None:
+                    push_node(node)
+                    try:
+                        visitor = visitors[node.__class__]
+                    except KeyError:
+                        visitor = self.get_visitor(node)
+                    if key is None:
+                        children = visitor(self, node)
+                        if children is None:
+                            pop_node()
+                        else:
+                            # visitors that have children only write once they are resumed
+                            push_frame((children, node, self.written_width, None, 0))
+                            if node.__class__ in ancestor_counts:
+                                ancestor_counts[node.__class__] += 1
+                    else:
+                        start_width = self.written_width
+                        doc_start = len(self.doc)
+                        children = visitor(self, node)
+                        if children is None:
+                            pop_node()
+                            flat_widths[node] = self.written_width - start_width
+                            self.cache_rendering(node, key, doc_start)
+                        else:
+                            push_frame((children, node, start_width, key, doc_start))
+                            if node.__class__ in ancestor_counts:
+                                ancestor_counts[node.__class__] += 1
+
+                # resume rendering the parent of the node
+                while frames:
+                    node = next(frames[-1][0], None)
+                    if node is not None:
+                        break
+                    _, done, start_width, key, doc_start = frames.pop()
+                    pop_node()
+                    if done.__class__ in ancestor_counts:
+                        ancestor_counts[done.__class__] -= 1
+                    if self.doc is not None:
+                        flat_widths[done] = self.written_width - start_width
+                        if key is not None:
+                            self.cache_rendering(done, key, doc_start)
+                else:
+                    return
+        except BaseException:
+            for frame in reversed(frames):
+                # visitors may return iterators that are not generators
+                children_close = getattr(frame[0], "close", None)
+                if children_close is not None:
+                    children_close()
+                if frame[1].__class__ in ancestor_counts:
+                    ancestor_counts[frame[1].__class__] -= 1
+            del node_stack[depth:]
+            raise
+
+    def get_visitor(self, node: ast.AST) -> _Visitor:
+        """Returns the visit method for a node class created after the dispatch table."""
+        cls = type(self)
+        visitor = cls.visitors[node.__class__] = getattr(
+            cls, "visit_" + node.__class__.__name__, cls.generic_visit
+        )
+        if self.profile is not None:
+            visitor = self.visitors[node.__class__] = self.profile.wrap_visitor(visitor)
+        if self.source_map is not None and not isinstance(node, _HELPER_TYPES):
+            visitor = self.visitors[node.__class__] = self.source_map.wrap_visitor(
+                visitor
+            )
+        return visitor
+
+    def render_cache_key(self, node: ast.AST) -> Tuple[ast.AST, object, bool]:
+        return (
+            node,
+            self.render_context(node),
+            self.has_parent_of_type(ast.FormattedValue),
+        )
+
+    def write_cached(self, node: ast.AST, key: Tuple[ast.AST, object, bool]) -> bool:
+        """Writes the cached rendering of a node, if there is one."""
+        try:
+            rendered, width = self.render_cache[key]
+        except KeyError:
+            self.render_cache_misses += 1
+            return False
+        self.render_cache_hits += 1
+        assert self.doc is not None
+        self.doc.append(rendered)
+        self.written_objects += 1
+        self.written_width += width
+        self.flat_widths[node] = width
+        if self.profile is not None:
+            self.profile.record_cached(node, width)
+        return True
+
+    def cache_rendering(
+        self, node: ast.AST, key: Tuple[ast.AST, object, bool], doc_start: int
+    ) -> None:
+        """Stores the rendering of a node that starts at doc_start in the current document."""
+        doc = self.doc
+        assert doc is not None
+        rendered = doc[doc_start:]
+        del doc[doc_start:]
+        doc.append(rendered)
+        self.render_cache[key] = (rendered, self.flat_widths[node])
+
+    def render_context(self, node: ast.AST) -> object:
+        """Returns the part of the current context that affects how a child node is rendered.
+
+        This is what needs_parens() and the visit methods look at: the type of the parent, its
+        operator, and which of its children the node is. Besides this, the rendering only
+        depends on whether we are inside an f-string. Documents are laid out after they are
+        rendered, so the indentation does not matter.
+
+        """
+        if not self.node_stack:
+            return None
+        parent = self.node_stack[-1]
+        parent_type = type(parent)
+        if parent_type is _CallArgs:
+            # a generator expression is not parenthesized if it is the only argument
+            return (_CallArgs, len(parent.args) == 1)
+        if parent_type is ast.BinOp:
+            return (
+                ast.BinOp,
+                type(parent.op),
+                node is parent.left,
+                node is parent.right,
+            )
+        if parent_type is ast.UnaryOp or parent_type is ast.BoolOp:
+            return (parent_type, type(parent.op))
+        if parent_type is ast.IfExp:
+            return (ast.IfExp, node is parent.test, node is parent.body)
+        if parent_type is ast.Subscript:
+            return (ast.Subscript, node is parent.slice)
+        if parent_type is ast.comprehension:
+            return (ast.comprehension, node is parent.target, node in parent.ifs)
+        return parent_type
+
     def precedence_of_node(self, node: Optional[ast.AST]) -> int:
-        if node is None:
-            return -1
-        if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.BoolOp)):
-            return _PRECEDENCE[type(node.op)]
-        return _PRECEDENCE.get(type(node), -1)
+        return precedence_of_node(node)
 
     def get_parent_node(self) -> Optional[ast.AST]:
         try:
@@ -185,22 +962,28 @@ class Decompiler(ast.NodeVisitor):
             return None
 
     def has_parent_of_type(self, node_type: Type[ast.AST]) -> bool:
-        return any(isinstance(parent, node_type) for parent in self.node_stack)
+        try:
+            return self.ancestor_counts[node_type] > 0
+        except KeyError:
+            return any(isinstance(parent, node_type) for parent in self.node_stack)
 
     def write(self, code: str) -> None:
         assert isinstance(code, str), f"invalid code {code!r}"
-        self.current_line.append(code)
+        doc = self.doc
+        if doc is None:
+            self.buffer.write(code)
+        else:
+            self.written_width += len(code)
+            doc.append(code)
 
     def write_indentation(self) -> None:
-        self.write(" " * self.current_indentation)
+        self.buffer.write_indentation(self.current_indentation)
 
     def write_newline(self) -> None:
-        line = "".join(self.current_line) + "\n"
-        self.lines.append(line)
-        self.current_line = []
+        self.buffer.write_newline()
 
     def current_line_length(self) -> int:
-        return sum(map(len, self.current_line))
+        return self.buffer.column
 
     def write_expression_list(
         self,
@@ -210,7 +993,7 @@ class Decompiler(ast.NodeVisitor):
         allow_newlines: bool = True,
         need_parens: bool = True,
         final_separator_if_multiline: bool = True,
-    ) -> None:
+    ) -> Iterator[ast.AST]:
         """Writes a list of nodes, separated by separator.
 
         If allow_newlines, will write the expression over multiple lines if necessary to say within
@@ -218,49 +1001,171 @@ class Decompiler(ast.NodeVisitor):
         If final_separator_if_multiline, will write a separator at the end of the list if it is
         divided over multiple lines.
 
-        """
-        first = True
-        last_line = len(self.lines)
-        current_line = list(self.current_line)
-        for node in nodes:
-            if first:
-                first = False
-            else:
-                self.write(separator)
-            self.visit(node)
-            if allow_newlines and (
-                self.current_line_length() > self.max_line_length
-                or last_line != len(self.lines)
-            ):
-                break
-        else:
-            return  # stayed within the limit
-
-        # reset state
-        del self.lines[last_line:]
-        self.current_line = current_line
+        The nodes are rendered into a _Group and the decision whether to break it up is deferred
+        until the outermost list has been rendered, so that every node is visited only once.
 
-        separator = separator.rstrip()
-        if need_parens:
-            self.write("(")
-        self.write_newline()
-        with self.add_indentation():
-            num_nodes = len(nodes)
+        """
+        outer_doc = self.doc
+        if outer_doc is None and not allow_newlines:
+            # the layout is already decided, so write the nodes out directly
             for i, node in enumerate(nodes):
-                self.write_indentation()
-                self.visit(node)
-                if final_separator_if_multiline or i < num_nodes - 1:
+                if i:
                     self.write(separator)
-                self.write_newline()
+                yield node
+            return
 
-        self.write_indentation()
-        if need_parens:
-            self.write(")")
+        docs = []
+        width = 0
+        # whether no item contains a group
+        simple = True
+        try:
+            for node in nodes:
+                self.doc = doc = []
+                start_width = self.written_width
+                written_objects = self.written_objects
+                yield node
+                width += self.written_width - start_width
+                if self.written_objects == written_objects:
+                    try:
+                        docs.append("".join(doc))
+                        continue
+                    except TypeError:
+                        # the document holds markers for a source map
+                        pass
+                docs.append(doc)
+                simple = False
+        finally:
+            self.doc = outer_doc
+        if len(nodes) > 1:
+            # separators are written only when the group is laid out
+            separators_width = len(separator) * (len(nodes) - 1)
+            width += separators_width
+            if outer_doc is not None:
+                self.written_width += separators_width
+            if self.profile is not None:
+                self.profile.bytes_written += separators_width
+        group = _Group(
+            docs,
+            width,
+            separator,
+            allow_newlines,
+            need_parens,
+            final_separator_if_multiline,
+            simple,
+        )
+        if outer_doc is not None:
+            self.written_objects += 1
+            outer_doc.append(group)
+        elif self.buffer.column + width <= self.max_line_length:
+            # the common case, which does not need the full layout algorithm
+            if simple:
+                self.buffer.write(separator.join(docs))
+            else:
+                self.write_flat(group)
+        else:
+            self.write_doc([group])
+
+    def write_doc(self, doc: _Doc) -> None:
+        """Writes out a rendered document, deciding the layout of the groups it contains."""
+        write = self.buffer.write
+        # iterators over the documents being written
+        stack = [iter(doc)]
+        while stack:
+            for item in stack[-1]:
+                if item.__class__ is str:
+                    write(item)
+                elif item.__class__ is list:
+                    stack.append(iter(item))
+                    break
+                elif isinstance(item, _Group):
+                    if self.buffer.column + item.width <= self.max_line_length:
+                        # the groups inside it fit as well
+                        self.write_flat(item)
+                        continue
+                    stack.append(iter(self.layout_group(item)))
+                    break
+                elif item is _Layout.newline:
+                    self.buffer.write_newline()
+                elif item is _Layout.indentation:
+                    self.buffer.write_indentation(self.current_indentation)
+                elif item is _Layout.indent:
+                    self.current_indentation += self.indentation
+                elif item is _Layout.dedent:
+                    self.current_indentation -= self.indentation
+                else:
+                    # documents only hold markers when a source map is recorded
+                    assert self.source_map is not None
+                    self.source_map.resolve(item)
+            else:
+                stack.pop()
 
-    def write_suite(self, nodes: Iterable[ast.AST]) -> None:
+    def write_flat(self, group: _Group) -> None:
+        """Writes a group on a single line, together with all the groups it contains."""
+        if self.source_map is not None:
+            # markers in the documents must be resolved where they are written
+            self.write_doc(self.layout_group(group))
+            return
+        parts = []
+        # items still to be written, in reverse order
+        stack: List[Any] = [group]
+        while stack:
+            item = stack.pop()
+            if item.__class__ is str:
+                parts.append(item)
+            elif item.__class__ is list:
+                stack += reversed(item)
+            else:
+                assert isinstance(item, _Group)
+                if item.simple:
+                    parts.append(item.separator.join(item.docs))
+                elif item.docs:
+                    separator = item.separator
+                    for doc in reversed(item.docs[1:]):
+                        stack.append(doc)
+                        stack.append(separator)
+                    stack.append(item.docs[0])
+        self.buffer.write("".join(parts))
+
+    def layout_group(self, group: _Group) -> List[Any]:
+        """Returns the items to write for a group.
+
+        The group is written on one line if it fits, and broken up with one element per line
+        otherwise.
+
+        """
+        if (
+            not group.allow_newlines
+            or not group.docs
+            or self.buffer.column + group.width <= self.max_line_length
+        ):
+            items = []
+            for doc in group.docs:
+                if items:
+                    items.append(group.separator)
+                items.append(doc)
+            return items
+
+        self.multiline_groups += 1
+        separator = group.separator.rstrip()
+        items = []
+        if group.need_parens:
+            items.append("(")
+        items += [_Layout.newline, _Layout.indent]
+        num_docs = len(group.docs)
+        for i, doc in enumerate(group.docs):
+            items += [_Layout.indentation, doc]
+            if group.final_separator_if_multiline or i < num_docs - 1:
+                items.append(separator)
+            items.append(_Layout.newline)
+        items += [_Layout.dedent, _Layout.indentation]
+        if group.need_parens:
+            items.append(")")
+        return items
+
+    def write_suite(self, nodes: Iterable[ast.AST]) -> Iterator[ast.AST]:
         with self.add_indentation():
             for line in nodes:
-                self.visit(line)
+                yield line
 
     @contextmanager
     def add_indentation(self) -> Generator[None, None, None]:
@@ -291,281 +1196,311 @@ class Decompiler(ast.NodeVisitor):
     def generic_visit(self, node: ast.AST) -> None:
         raise NotImplementedError(f"missing visit method for {node!r}")
 
-    def visit_Module(self, node: Union[ast.Module, ast.Interactive]) -> None:
+    def visit_Module(
+        self, node: Union[ast.Module, ast.Interactive]
+    ) -> Iterator[ast.AST]:
         for line in node.body:
-            self.visit(line)
+            yield line
 
     visit_Interactive = visit_Module
 
-    def visit_Expression(self, node: ast.Expression) -> None:
-        self.visit(node.body)
+    def visit_Expression(self, node: ast.Expression) -> Iterator[ast.AST]:
+        yield node.body
 
     # Multi-line statements
 
     def visit_FunctionDef(
         self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef]
-    ) -> None:
+    ) -> Iterator[ast.AST]:
         self.write_newline()
         for decorator in node.decorator_list:
             self.write_indentation()
             self.write("@")
-            self.visit(decorator)
+            yield decorator
             self.write_newline()
 
         self.write_indentation()
         if isinstance(node, ast.AsyncFunctionDef):
             self.write("async ")
         self.write(f"def {node.name}")
-        if sys.version_info >= (3, 12) and node.type_params:
-            self.write("[")
-            self.write_expression_list(node.type_params, need_parens=False)
-            self.write("]")
+        yield from self.write_type_params(node)
         self.write("(")
-        self.visit(node.args)
+        yield node.args
         self.write(")")
         if node.returns is not None:
             self.write(" -> ")
-            self.visit(node.returns)
+            yield node.returns
         self.write(":")
         self.write_newline()
 
-        self.write_suite(node.body)
+        yield from self.write_suite(node.body)
 
     visit_AsyncFunctionDef = visit_FunctionDef
 
-    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+    if sys.version_info >= (3, 12):
+
+        def _write_type_params(
+            self, node: Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]
+        ) -> Iterator[ast.AST]:
+            if node.type_params:
+                self.write("[")
+                yield from self.write_expression_list(
+                    node.type_params, need_parens=False
+                )
+                self.write("]")
+
+    # version-specific methods are bound once, when the class is created
+    write_type_params = (
+        _write_type_params
+        if sys.version_info >= (3, 12)
+        else lambda self, node: iter(())
+    )
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> Iterator[ast.AST]:
         self.write_newline()
         self.write_newline()
         for decorator in node.decorator_list:
             self.write_indentation()
             self.write("@")
-            self.visit(decorator)
+            yield decorator
             self.write_newline()
 
         self.write_indentation()
         self.write(f"class {node.name}")
-        if sys.version_info >= (3, 12) and node.type_params:
-            self.write("[")
-            self.write_expression_list(node.type_params, need_parens=False)
-            self.write("]")
+        yield from self.write_type_params(node)
         self.write("(")
         exprs = node.bases + node.keywords
-        self.write_expression_list(exprs, need_parens=False)
+        yield from self.write_expression_list(exprs, need_parens=False)
         self.write("):")
         self.write_newline()
-        self.write_suite(node.body)
+        yield from self.write_suite(node.body)
 
-    def visit_For(self, node: Union[ast.For, ast.AsyncFor]) -> None:
+    def visit_For(self, node: Union[ast.For, ast.AsyncFor]) -> Iterator[ast.AST]:
         self.write_indentation()
         if isinstance(node, ast.AsyncFor):
             self.write("async ")
         self.write("for ")
-        self.visit(node.target)
+        yield node.target
         self.write(" in ")
-        self.visit(node.iter)
+        yield node.iter
         self.write(":")
         self.write_newline()
-        self.write_suite(node.body)
-        self.write_else(node.orelse)
+        yield from self.write_suite(node.body)
+        yield from self.write_else(node.orelse)
 
     visit_AsyncFor = visit_For
 
-    def visit_While(self, node: ast.While) -> None:
+    def visit_While(self, node: ast.While) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("while ")
-        self.visit(node.test)
+        yield node.test
         self.write(":")
         self.write_newline()
-        self.write_suite(node.body)
-        self.write_else(node.orelse)
+        yield from self.write_suite(node.body)
+        yield from self.write_else(node.orelse)
 
-    def visit_If(self, node: ast.If) -> None:
+    def visit_If(self, node: ast.If) -> Iterator[ast.AST]:
         self.write_indentation()
-        self.write("if ")
-        self.visit(node.test)
+        if node is self.elif_node:
+            self.elif_node = None
+            self.write("elif ")
+        else:
+            self.write("if ")
+        yield node.test
         self.write(":")
         self.write_newline()
-        self.write_suite(node.body)
-        while (
-            node.orelse and len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If)
-        ):
-            node = node.orelse[0]
-            self.write_indentation()
-            self.write("elif ")
-            self.visit(node.test)
-            self.write(":")
-            self.write_newline()
-            self.write_suite(node.body)
-        self.write_else(node.orelse)
+        yield from self.write_suite(node.body)
+        if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+            self.elif_node = node.orelse[0]
+            yield node.orelse[0]
+        else:
+            yield from self.write_else(node.orelse)
 
-    def write_else(self, orelse: Sequence[ast.AST]) -> None:
+    def write_else(self, orelse: Sequence[ast.AST]) -> Iterator[ast.AST]:
         if orelse:
             self.write_indentation()
             self.write("else:")
             self.write_newline()
-            self.write_suite(orelse)
+            yield from self.write_suite(orelse)
 
-    def visit_With(self, node: Union[ast.With, ast.AsyncWith]) -> None:
+    def visit_With(self, node: Union[ast.With, ast.AsyncWith]) -> Iterator[ast.AST]:
         self.write_indentation()
         if isinstance(node, ast.AsyncWith):
             self.write("async ")
         self.write("with ")
-        self.write_expression_list(node.items, allow_newlines=False)
+        yield from self.write_expression_list(node.items, allow_newlines=False)
         self.write(":")
         self.write_newline()
-        self.write_suite(node.body)
+        yield from self.write_suite(node.body)
 
     visit_AsyncWith = visit_With
 
-    def visit_withitem(self, node: ast.withitem) -> None:
-        self.visit(node.context_expr)
+    def visit_withitem(self, node: ast.withitem) -> Iterator[ast.AST]:
+        yield node.context_expr
         if node.optional_vars:
             self.write(" as ")
-            self.visit(node.optional_vars)
+            yield node.optional_vars
 
-    def visit_Try(self, node: Union[ast.Try, "ast.TryStar"]) -> None:
+    def visit_Try(self, node: Union[ast.Try, "ast.TryStar"]) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("try:")
         self.write_newline()
-        self.write_suite(node.body)
-        is_trystar = sys.version_info >= (3, 11) and isinstance(node, ast.TryStar)
-        for handler in node.handlers:
-            self.visit_ExceptHandler(handler, is_trystar=is_trystar)
-        self.write_else(node.orelse)
+        yield from self.write_suite(node.body)
+        yield from node.handlers
+        yield from self.write_else(node.orelse)
         if node.finalbody:
-            self.write_finalbody(node.finalbody)
+            yield from self.write_finalbody(node.finalbody)
 
     visit_TryStar = visit_Try
 
-    def write_finalbody(self, body: Sequence[ast.AST]) -> None:
+    def write_finalbody(self, body: Sequence[ast.AST]) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("finally:")
         self.write_newline()
-        self.write_suite(body)
+        yield from self.write_suite(body)
 
     # One-line statements
 
-    def visit_Return(self, node: ast.Return) -> None:
+    def visit_Return(self, node: ast.Return) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("return")
         if node.value:
             self.write(" ")
-            self.visit(node.value)
+            yield node.value
         self.write_newline()
 
-    def visit_Delete(self, node: ast.Delete) -> None:
+    def visit_Delete(self, node: ast.Delete) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("del ")
-        self.write_expression_list(node.targets, allow_newlines=False)
+        yield from self.write_expression_list(node.targets, allow_newlines=False)
         self.write_newline()
 
-    def visit_Assign(self, node: ast.Assign) -> None:
+    def visit_Assign(self, node: ast.Assign) -> Iterator[ast.AST]:
         self.write_indentation()
-        self.write_expression_list(node.targets, separator=" = ", allow_newlines=False)
+        yield from self.write_expression_list(
+            node.targets, separator=" = ", allow_newlines=False
+        )
         self.write(" = ")
-        self.visit(node.value)
+        yield node.value
         self.write_newline()
 
-    def visit_AugAssign(self, node: ast.AugAssign) -> None:
+    def visit_AugAssign(self, node: ast.AugAssign) -> Iterator[ast.AST]:
         self.write_indentation()
-        self.visit(node.target)
+        yield node.target
         self.write(" ")
-        self.visit(node.op)
+        yield node.op
         self.write("= ")
-        self.visit(node.value)
+        yield node.value
         self.write_newline()
 
     if sys.version_info >= (3, 12):
 
-        def visit_TypeAlias(self, node: ast.TypeAlias) -> None:
+        def visit_TypeAlias(self, node: ast.TypeAlias) -> Iterator[ast.AST]:
             self.write_indentation()
             self.write("type ")
-            self.visit(node.name)
+            yield node.name
             if node.type_params:
                 self.write("[")
-                self.write_expression_list(node.type_params, need_parens=False)
+                yield from self.write_expression_list(
+                    node.type_params, need_parens=False
+                )
                 self.write("]")
             self.write(" = ")
-            self.visit(node.value)
+            yield node.value
             self.write_newline()
 
-        def visit_TypeVar(self, node: ast.TypeVar) -> None:
+        def visit_TypeVar(self, node: ast.TypeVar) -> Iterator[ast.AST]:
             self.write(node.name)
             if node.bound:
                 self.write(": ")
-                self.visit(node.bound)
-            if sys.version_info >= (3, 13) and node.default_value:
-                self.write(" = ")
-                self.visit(node.default_value)
+                yield node.bound
+            yield from self.write_type_param_default(node)
 
-        def visit_TypeVarTuple(self, node: ast.TypeVarTuple) -> None:
+        def visit_TypeVarTuple(self, node: ast.TypeVarTuple) -> Iterator[ast.AST]:
             self.write("*")
             self.write(node.name)
-            if sys.version_info >= (3, 13) and node.default_value:
-                self.write(" = ")
-                self.visit(node.default_value)
+            yield from self.write_type_param_default(node)
 
-        def visit_ParamSpec(self, node: ast.ParamSpec) -> None:
+        def visit_ParamSpec(self, node: ast.ParamSpec) -> Iterator[ast.AST]:
             self.write("**")
             self.write(node.name)
-            if sys.version_info >= (3, 13) and node.default_value:
-                self.write(" = ")
-                self.visit(node.default_value)
+            yield from self.write_type_param_default(node)
+
+        if sys.version_info >= (3, 13):
+
+            def _write_type_param_default(
+                self, node: Union[ast.TypeVar, ast.TypeVarTuple, ast.ParamSpec]
+            ) -> Iterator[ast.AST]:
+                if node.default_value:
+                    self.write(" = ")
+                    yield node.default_value
+
+        write_type_param_default = (
+            _write_type_param_default
+            if sys.version_info >= (3, 13)
+            else lambda self, node: iter(())
+        )
 
-    def visit_AnnAssign(self, node: ast.AnnAssign) -> None:
+    def visit_AnnAssign(self, node: ast.AnnAssign) -> Iterator[ast.AST]:
         self.write_indentation()
         if not node.simple:
             self.write("(")
-        self.visit(node.target)
+        yield node.target
         if not node.simple:
             self.write(")")
         self.write(": ")
-        self.visit(node.annotation)
+        yield node.annotation
         if node.value is not None:
             self.write(" = ")
-            self.visit(node.value)
+            yield node.value
         self.write_newline()
 
-    def visit_Raise(self, node: ast.Raise) -> None:
+    def visit_Raise(self, node: ast.Raise) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("raise")
         if node.exc is not None:
             self.write(" ")
-            self.visit(node.exc)
+            yield node.exc
             if node.cause is not None:
                 self.write(" from ")
-                self.visit(node.cause)
+                yield node.cause
         self.write_newline()
 
-    def visit_Assert(self, node: ast.Assert) -> None:
+    def visit_Assert(self, node: ast.Assert) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("assert ")
-        self.visit(node.test)
+        yield node.test
         if node.msg:
             self.write(", ")
-            self.visit(node.msg)
+            yield node.msg
         self.write_newline()
 
-    def visit_Import(self, node: ast.Import) -> None:
+    def visit_Import(self, node: ast.Import) -> Iterator[ast.AST]:
         self.write_indentation()
-        if sys.version_info >= (3, 15) and node.is_lazy:
-            self.write("lazy ")
+        self.write_lazy(node)
         self.write("import ")
-        self.write_expression_list(node.names, allow_newlines=False)
+        yield from self.write_expression_list(node.names, allow_newlines=False)
         self.write_newline()
 
-    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> Iterator[ast.AST]:
         self.write_indentation()
         dots = "." * (node.level or 0)
-        if sys.version_info >= (3, 15) and node.is_lazy:
-            self.write("lazy ")
+        self.write_lazy(node)
         self.write(f"from {dots}")
         if node.module:
             self.write(node.module)
         self.write(" import ")
-        self.write_expression_list(node.names)
+        yield from self.write_expression_list(node.names)
         self.write_newline()
 
+    if sys.version_info >= (3, 15):
+
+        def _write_lazy(self, node: Union[ast.Import, ast.ImportFrom]) -> None:
+            if node.is_lazy:
+                self.write("lazy ")
+
+    write_lazy = _write_lazy if sys.version_info >= (3, 15) else lambda self, node: None
+
     def visit_Global(self, node: ast.Global) -> None:
         self.write_indentation()
         self.write(f"global {', '.join(node.names)}")
@@ -576,9 +1511,9 @@ class Decompiler(ast.NodeVisitor):
         self.write(f"nonlocal {', '.join(node.names)}")
         self.write_newline()
 
-    def visit_Expr(self, node: ast.Expr) -> None:
+    def visit_Expr(self, node: ast.Expr) -> Iterator[ast.AST]:
         self.write_indentation()
-        self.visit(node.value)
+        yield node.value
         self.write_newline()
 
     def visit_Pass(self, node: ast.Pass) -> None:
@@ -598,154 +1533,131 @@ class Decompiler(ast.NodeVisitor):
 
     # Expressions
 
-    def visit_BoolOp(self, node: ast.BoolOp) -> None:
-        my_prec = self.precedence_of_node(node)
-        parent_prec = self.precedence_of_node(self.get_parent_node())
-        with self.parenthesize_if(my_prec <= parent_prec):
-            op = "and" if isinstance(node.op, ast.And) else "or"
-            self.write_expression_list(
-                node.values, separator=f" {op} ", final_separator_if_multiline=False
-            )
-
-    def visit_BinOp(self, node: ast.BinOp) -> None:
-        parent_node = self.get_parent_node()
-        my_prec = self.precedence_of_node(node)
-        parent_prec = self.precedence_of_node(parent_node)
-        if my_prec < parent_prec:
-            should_parenthesize = True
-        elif my_prec == parent_prec and isinstance(parent_node, ast.BinOp):
-            if isinstance(node.op, ast.Pow):
-                should_parenthesize = node == parent_node.left
-            else:
-                should_parenthesize = node == parent_node.right
-        else:
-            should_parenthesize = False
+    def visit_BoolOp(self, node: ast.BoolOp) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        op = "and" if isinstance(node.op, ast.And) else "or"
+        yield from self.write_expression_list(
+            node.values, separator=f" {op} ", final_separator_if_multiline=False
+        )
+        if parens:
+            self.write(")")
 
-        with self.parenthesize_if(should_parenthesize):
-            self.visit(node.left)
-            self.write(" ")
-            self.visit(node.op)
-            self.write(" ")
-            self.visit(node.right)
+    def visit_BinOp(self, node: ast.BinOp) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        yield node.left
+        self.write(" ")
+        yield node.op
+        self.write(" ")
+        yield node.right
+        if parens:
+            self.write(")")
 
-    def visit_UnaryOp(self, node: ast.UnaryOp) -> None:
-        my_prec = self.precedence_of_node(node)
-        parent_prec = self.precedence_of_node(self.get_parent_node())
-        with self.parenthesize_if(my_prec < parent_prec):
-            self.visit(node.op)
-            self.visit(node.operand)
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        yield node.op
+        yield node.operand
+        if parens:
+            self.write(")")
 
-    def visit_Lambda(self, node: ast.Lambda) -> None:
-        parent_node = self.get_parent_node()
-        should_parenthesize = isinstance(
-            parent_node,
-            (
-                ast.BinOp,
-                ast.UnaryOp,
-                ast.Compare,
-                ast.IfExp,
-                ast.Attribute,
-                ast.Subscript,
-                ast.Call,
-                ast.BoolOp,
-            ),
-        ) or (
-            # Parens are required in 3.9+, but let's just always add them.
-            isinstance(parent_node, ast.comprehension)
-            and node in parent_node.ifs
-        )
-        with self.parenthesize_if(should_parenthesize):
-            self.write("lambda")
-            if (
-                node.args.posonlyargs
-                or node.args.args
-                or node.args.vararg
-                or node.args.kwonlyargs
-                or node.args.kwarg
-            ):
-                self.write(" ")
-            self.visit(node.args)
-            self.write(": ")
-            self.visit(node.body)
+    def visit_Lambda(self, node: ast.Lambda) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        self.write("lambda")
+        if (
+            node.args.posonlyargs
+            or node.args.args
+            or node.args.vararg
+            or node.args.kwonlyargs
+            or node.args.kwarg
+        ):
+            self.write(" ")
+        yield node.args
+        self.write(": ")
+        yield node.body
+        if parens:
+            self.write(")")
 
-    def visit_NamedExpr(self, node: "ast.NamedExpr") -> None:
+    def visit_NamedExpr(self, node: "ast.NamedExpr") -> Iterator[ast.AST]:
         self.write("(")
-        self.visit(node.target)
+        yield node.target
         self.write(" := ")
         # := has the lowest precedence, so we should never need to parenthesize this
-        self.visit(node.value)
+        yield node.value
         self.write(")")
 
-    def visit_IfExp(self, node: ast.IfExp) -> None:
-        parent_node = self.get_parent_node()
-        if isinstance(
-            parent_node,
-            (
-                ast.BinOp,
-                ast.UnaryOp,
-                ast.Compare,
-                ast.Attribute,
-                ast.Subscript,
-                ast.Call,
-                ast.BoolOp,
-                ast.comprehension,
-            ),
-        ):
-            should_parenthesize = True
-        elif isinstance(parent_node, ast.IfExp) and (
-            node is parent_node.test or node is parent_node.body
-        ):
-            should_parenthesize = True
-        else:
-            should_parenthesize = False
-
-        with self.parenthesize_if(should_parenthesize):
-            self.visit(node.body)
-            self.write(" if ")
-            self.visit(node.test)
-            self.write(" else ")
-            self.visit(node.orelse)
+    def visit_IfExp(self, node: ast.IfExp) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        yield node.body
+        self.write(" if ")
+        yield node.test
+        self.write(" else ")
+        yield node.orelse
+        if parens:
+            self.write(")")
 
-    def visit_Dict(self, node: ast.Dict) -> None:
+    def visit_Dict(self, node: ast.Dict) -> Iterator[ast.AST]:
         self.write("{")
         items = [KeyValuePair(key, value) for key, value in zip(node.keys, node.values)]
-        self.write_expression_list(items, need_parens=False)
+        yield from self.write_expression_list(items, need_parens=False)
         self.write("}")
 
-    def visit_KeyValuePair(self, node: KeyValuePair) -> None:
+    def visit_KeyValuePair(self, node: KeyValuePair) -> Iterator[ast.AST]:
         if node.key is None:
-            self.write_double_starred(node.value)
+            yield from self.write_double_starred(node.value)
         else:
-            self.visit(node.key)
+            yield node.key
             self.write(": ")
-            self.visit(node.value)
+            yield node.value
 
-    def write_double_starred(self, node: ast.AST) -> None:
+    def write_double_starred(self, node: ast.AST) -> Iterator[ast.AST]:
         self.write("**")
         with self.parenthesize_if(isinstance(node, (ast.IfExp, ast.Lambda))):
-            self.visit(node)
+            yield node
 
-    def visit_Set(self, node: ast.Set) -> None:
+    def visit_Set(self, node: ast.Set) -> Iterator[ast.AST]:
         self.write("{")
-        self.write_expression_list(node.elts, need_parens=False)
+        yield from self.write_expression_list(node.elts, need_parens=False)
         self.write("}")
 
-    def visit_ListComp(self, node: ast.ListComp) -> None:
-        self.visit_comp(node, "[", "]")
+    def visit_ListComp(self, node: ast.ListComp) -> Iterator[ast.AST]:
+        yield from self.visit_comp(node, "[", "]")
+
+    def visit_SetComp(self, node: ast.SetComp) -> Iterator[ast.AST]:
+        yield from self.visit_comp(node, "{", "}")
+
+    if sys.version_info >= (3, 15):
 
-    def visit_SetComp(self, node: ast.SetComp) -> None:
-        self.visit_comp(node, "{", "}")
+        def _visit_DictComp_unpacking(self, node: ast.DictComp) -> Iterator[ast.AST]:
+            # {**d for d in ds} has no value
+            if node.value is None:
+                elts = [KeyValuePair(None, node.key)] + node.generators
+            else:
+                elts = [KeyValuePair(node.key, node.value)] + node.generators
+            yield from self.write_dict_comp(elts)
+
+    def _visit_DictComp(self, node: ast.DictComp) -> Iterator[ast.AST]:
+        elts = [KeyValuePair(node.key, node.value)] + node.generators
+        yield from self.write_dict_comp(elts)
+
+    visit_DictComp = (
+        _visit_DictComp_unpacking if sys.version_info >= (3, 15) else _visit_DictComp
+    )
 
-    def visit_DictComp(self, node: ast.DictComp) -> None:
+    def write_dict_comp(self, elts: Sequence[ast.AST]) -> Iterator[ast.AST]:
         self.write("{")
-        if sys.version_info >= (3, 15) and node.value is None:
-            elts = [KeyValuePair(None, node.key)] + node.generators
-        else:
-            elts = [KeyValuePair(node.key, node.value)] + node.generators
-        self.write_expression_list(elts, separator=" ", need_parens=False)
+        yield from self.write_expression_list(elts, separator=" ", need_parens=False)
         self.write("}")
 
-    def visit_GeneratorExp(self, node: ast.GeneratorExp) -> None:
+    def visit_GeneratorExp(self, node: ast.GeneratorExp) -> Iterator[ast.AST]:
         parent_node = self.get_parent_node()
         # if this is the only argument to a function, omit the extra parentheses
         if (
@@ -757,96 +1669,95 @@ class Decompiler(ast.NodeVisitor):
         else:
             start = "("
             end = ")"
-        self.visit_comp(node, start, end)
+        yield from self.visit_comp(node, start, end)
 
     def visit_comp(
         self,
         node: Union[ast.GeneratorExp, ast.ListComp, ast.SetComp],
         start: str,
         end: str,
-    ) -> None:
+    ) -> Iterator[ast.AST]:
         self.write(start)
-        self.write_expression_list(
+        yield from self.write_expression_list(
             [node.elt] + node.generators, separator=" ", need_parens=False
         )
         self.write(end)
 
-    def visit_Await(self, node: ast.Await) -> None:
-        with self.parenthesize_if(
-            not isinstance(
-                self.get_parent_node(), (ast.Expr, ast.Assign, ast.AugAssign)
-            )
-        ):
-            self.write("await ")
-            with self.parenthesize_if(
-                not isinstance(
-                    node.value, (ast.Name, ast.Attribute, ast.Call, ast.Constant)
-                )
-            ):
-                self.visit(node.value)
-
-    def visit_Yield(self, node: ast.Yield) -> None:
-        with self.parenthesize_if(
-            not isinstance(
-                self.get_parent_node(), (ast.Expr, ast.Assign, ast.AugAssign)
-            )
-        ):
-            self.write("yield")
-            if node.value:
-                self.write(" ")
-                self.visit(node.value)
-
-    def visit_YieldFrom(self, node: ast.YieldFrom) -> None:
+    def visit_Await(self, node: ast.Await) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        self.write("await ")
         with self.parenthesize_if(
             not isinstance(
-                self.get_parent_node(), (ast.Expr, ast.Assign, ast.AugAssign)
+                node.value, (ast.Name, ast.Attribute, ast.Call, ast.Constant)
             )
         ):
-            self.write("yield from ")
-            self.visit(node.value)
-
-    def visit_Compare(self, node: ast.Compare) -> None:
-        my_prec = self.precedence_of_node(node)
-        parent_prec = self.precedence_of_node(self.get_parent_node())
-        with self.parenthesize_if(my_prec <= parent_prec):
-            self.visit(node.left)
-            for op, expr in zip(node.ops, node.comparators):
-                self.write(" ")
-                self.visit(op)
-                self.write(" ")
-                self.visit(expr)
+            yield node.value
+        if parens:
+            self.write(")")
 
-    def visit_Call(self, node: ast.Call) -> None:
-        self.visit(node.func)
-        self.write("(")
+    def visit_Yield(self, node: ast.Yield) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        self.write("yield")
+        if node.value:
+            self.write(" ")
+            yield node.value
+        if parens:
+            self.write(")")
 
-        args = node.args + node.keywords
-        self.node_stack.append(_CallArgs(args))
-        try:
-            if args:
-                self.write_expression_list(
-                    args,
-                    need_parens=False,
-                    final_separator_if_multiline=False,  # it's illegal after *args and **kwargs
-                )
+    def visit_YieldFrom(self, node: ast.YieldFrom) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        self.write("yield from ")
+        yield node.value
+        if parens:
+            self.write(")")
 
+    def visit_Compare(self, node: ast.Compare) -> Iterator[ast.AST]:
+        parens = needs_parens(node, self.get_parent_node())
+        if parens:
+            self.write("(")
+        yield node.left
+        for op, expr in zip(node.ops, node.comparators):
+            self.write(" ")
+            yield op
+            self.write(" ")
+            yield expr
+        if parens:
             self.write(")")
-        finally:
+
+    def visit_Call(self, node: ast.Call) -> Iterator[ast.AST]:
+        yield node.func
+        self.write("(")
+        if node.args or node.keywords:
+            args = node.args + node.keywords
+            # if rendering fails, visit() removes this from the stack
+            self.node_stack.append(_CallArgs(args))
+            yield from self.write_expression_list(
+                args,
+                need_parens=False,
+                final_separator_if_multiline=False,  # it's illegal after *args and **kwargs
+            )
             self.node_stack.pop()
+        self.write(")")
 
-    def visit_StarArg(self, node: StarArg) -> None:
+    def visit_StarArg(self, node: StarArg) -> Iterator[ast.AST]:
         self.write("*")
-        self.visit(node.arg)
+        yield node.arg
 
-    def visit_DoubleStarArg(self, node: DoubleStarArg) -> None:
+    def visit_DoubleStarArg(self, node: DoubleStarArg) -> Iterator[ast.AST]:
         self.write("**")
-        self.visit(node.arg)
+        yield node.arg
 
-    def visit_KeywordArg(self, node: KeywordArg) -> None:
-        self.visit(node.arg)
+    def visit_KeywordArg(self, node: KeywordArg) -> Iterator[ast.AST]:
+        yield node.arg
         if node.value is not None:
             self.write("=")
-            self.visit(node.value)
+            yield node.value
 
     def write_number(self, number: Union[int, float, complex]) -> None:
         should_parenthesize = (
@@ -884,28 +1795,19 @@ class Decompiler(ast.NodeVisitor):
     def write_string(self, string_value: str, kind: Optional[str] = None) -> None:
         if kind is not None:
             self.write(kind)
-        if isinstance(self.get_parent_node(), ast.Expr) and '"""' not in string_value:
-            self.write('"""')
-            s = string_value.encode("unicode-escape").decode("ascii")
-            s = s.replace("\\n", "\n")
-            self.write(s)
-            self.write('"""')
-            return
+        if isinstance(self.get_parent_node(), ast.Expr):
+            docstring = self.strings.docstring(string_value)
+            if docstring is not None:
+                self.write(docstring)
+                return
         if self.has_parent_of_type(ast.FormattedValue):
-            delimiter = '"'
+            # the f-string is in single quotes
+            self.write(self.strings.quoted_literal(string_value, '"'))
         else:
-            delimiter = "'"
-        self.write(delimiter)
-        s = string_value.encode("unicode-escape").decode("ascii")
-        s = s.replace(delimiter, "\\" + delimiter)
-        self.write(s)
-        self.write(delimiter)
-
-    def visit_FormattedValue(self, node: ast.FormattedValue) -> None:
-        has_parent = isinstance(self.get_parent_node(), ast.JoinedStr) or (
-            sys.version_info >= (3, 14)
-            and isinstance(self.get_parent_node(), ast.TemplateStr)
-        )
+            self.write(self.strings.literal(string_value))
+
+    def visit_FormattedValue(self, node: ast.FormattedValue) -> Iterator[ast.AST]:
+        has_parent = isinstance(self.get_parent_node(), _STRING_TYPES)
         with self.f_literalise_if(not has_parent):
             self.write("{")
             if isinstance(node.value, ast.JoinedStr):
@@ -918,7 +1820,7 @@ class Decompiler(ast.NodeVisitor):
             if add_space:
                 self.write(" ")
             with self.parenthesize_if(isinstance(node.value, ast.Lambda)):
-                self.visit(node.value)
+                yield node.value
             if add_space:
                 self.write(" ")
             if node.conversion != -1:
@@ -926,7 +1828,7 @@ class Decompiler(ast.NodeVisitor):
             if node.format_spec is not None:
                 self.write(":")
                 if isinstance(node.format_spec, ast.JoinedStr):
-                    self.visit(node.format_spec)
+                    yield node.format_spec
                 elif isinstance(node.format_spec, ast.Constant) and isinstance(
                     node.format_spec.value, str
                 ):
@@ -937,37 +1839,27 @@ class Decompiler(ast.NodeVisitor):
                     )
             self.write("}")
 
-    def visit_JoinedStr(self, node: ast.JoinedStr) -> None:
-        has_parent = isinstance(self.get_parent_node(), ast.FormattedValue) or (
-            sys.version_info >= (3, 14)
-            and isinstance(self.get_parent_node(), ast.Interpolation)
-        )
+    def visit_JoinedStr(self, node: ast.JoinedStr) -> Iterator[ast.AST]:
+        has_parent = isinstance(self.get_parent_node(), _REPLACEMENT_FIELD_TYPES)
         with self.f_literalise_if(not has_parent):
             for value in node.values:
-                self._write_tf_string_part(value)
+                yield from self._write_tf_string_part(value)
 
-    def _write_tf_string_part(self, value: ast.expr) -> None:
+    def _write_tf_string_part(self, value: ast.expr) -> Iterator[ast.AST]:
         if isinstance(value, ast.Constant) and isinstance(value.value, str):
-            # always escape '
-            self.write(
-                value.value.encode("unicode-escape")
-                .decode("ascii")
-                .replace("'", r"\'")
-                .replace("{", "{{")
-                .replace("}", "}}")
-            )
+            self.write(self.strings.f_string_part(value.value))
         else:
-            self.visit(value)
+            yield value
 
     if sys.version_info >= (3, 14):
 
-        def visit_TemplateStr(self, node: ast.TemplateStr) -> None:
+        def visit_TemplateStr(self, node: ast.TemplateStr) -> Iterator[ast.AST]:
             self.write("t'")
             for value in node.values:
-                self._write_tf_string_part(value)
+                yield from self._write_tf_string_part(value)
             self.write("'")
 
-        def visit_Interpolation(self, node: ast.Interpolation) -> None:
+        def visit_Interpolation(self, node: ast.Interpolation) -> Iterator[ast.AST]:
             self.write("{")
             if isinstance(node.value, ast.JoinedStr):
                 raise NotImplementedError(
@@ -979,7 +1871,7 @@ class Decompiler(ast.NodeVisitor):
                 )
                 if add_space:
                     self.write(" ")
-                self.visit(node.value)
+                yield node.value
                 if add_space:
                     self.write(" ")
             else:
@@ -989,7 +1881,7 @@ class Decompiler(ast.NodeVisitor):
             if node.format_spec is not None:
                 self.write(":")
                 if isinstance(node.format_spec, ast.JoinedStr):
-                    self.visit(node.format_spec)
+                    yield node.format_spec
                 elif isinstance(node.format_spec, ast.Constant) and isinstance(
                     node.format_spec.value, str
                 ):
@@ -1021,17 +1913,17 @@ class Decompiler(ast.NodeVisitor):
         else:
             raise NotImplementedError(repr(value))
 
-    def visit_Attribute(self, node: ast.Attribute) -> None:
-        self.visit(node.value)
+    def visit_Attribute(self, node: ast.Attribute) -> Iterator[ast.AST]:
+        yield node.value
         self.write(f".{node.attr}")
 
-    def visit_Subscript(self, node: ast.Subscript) -> None:
-        self.visit(node.value)
+    def visit_Subscript(self, node: ast.Subscript) -> Iterator[ast.AST]:
+        yield node.value
         self.write("[")
-        self.visit(node.slice)
+        yield node.slice
         self.write("]")
 
-    def visit_Starred(self, node: ast.Starred) -> None:
+    def visit_Starred(self, node: ast.Starred) -> Iterator[ast.AST]:
         self.write("*")
 
         with self.parenthesize_if(
@@ -1039,74 +1931,61 @@ class Decompiler(ast.NodeVisitor):
                 node.value, (ast.Name, ast.Attribute, ast.Call, ast.Constant)
             )
         ):
-            self.visit(node.value)
+            yield node.value
 
     def visit_Name(self, node: ast.Name) -> None:
         self.write(node.id)
 
-    def visit_List(self, node: ast.List) -> None:
+    def visit_List(self, node: ast.List) -> Iterator[ast.AST]:
         self.write("[")
-        self.write_expression_list(node.elts, need_parens=False)
+        yield from self.write_expression_list(node.elts, need_parens=False)
         self.write("]")
 
-    def visit_Tuple(self, node: ast.Tuple) -> None:
+    def visit_Tuple(self, node: ast.Tuple) -> Iterator[ast.AST]:
         if not node.elts:
             self.write("()")
         else:
             parent_node = self.get_parent_node()
-            allow_parens = True
-            should_parenthesize = not isinstance(
-                parent_node,
-                (ast.Expr, ast.Assign, ast.AugAssign, ast.Return, ast.Yield, ast.Index),
-            )
-            if (
-                isinstance(parent_node, ast.comprehension)
-                and node is parent_node.target
-            ):
-                should_parenthesize = False
-            # Only relevant on 3.9+, where the ExtSlice class no longer exists.
-            if isinstance(parent_node, ast.Subscript) and node is parent_node.slice:
-                should_parenthesize = False
-                allow_parens = False
-            # https://bugs.python.org/issue32117
-            if (
-                isinstance(parent_node, (ast.Return, ast.Yield))
-                and any(isinstance(elt, ast.Starred) for elt in node.elts)
-                and sys.version_info < (3, 8)
-            ):
-                should_parenthesize = True
-            with self.parenthesize_if(should_parenthesize):
-                if len(node.elts) == 1:
-                    self.visit(node.elts[0])
-                    self.write(",")
-                else:
-                    self.write_expression_list(
-                        node.elts, need_parens=allow_parens and not should_parenthesize
-                    )
+            parens = needs_parens(node, parent_node)
+            if parens:
+                self.write("(")
+            if len(node.elts) == 1:
+                yield node.elts[0]
+                self.write(",")
+            else:
+                # Only relevant on 3.9+, where the ExtSlice class no longer exists.
+                in_slice = (
+                    isinstance(parent_node, ast.Subscript) and node is parent_node.slice
+                )
+                yield from self.write_expression_list(
+                    node.elts, need_parens=not parens and not in_slice
+                )
+            if parens:
+                self.write(")")
 
     # slice
 
-    def visit_Slice(self, node: ast.Slice) -> None:
+    def visit_Slice(self, node: ast.Slice) -> Iterator[ast.AST]:
         if node.lower:
-            self.visit(node.lower)
+            yield node.lower
         self.write(":")
         if node.upper:
-            self.visit(node.upper)
+            yield node.upper
         if node.step:
             self.write(":")
-            self.visit(node.step)
+            yield node.step
 
     if sys.version_info < (3, 9):
         # Any to avoid version-dependent errors from pyanalyze.
-        def visit_ExtSlice(self, node: Any) -> None:
+        def visit_ExtSlice(self, node: Any) -> Iterator[ast.AST]:
             if len(node.dims) == 1:
-                self.visit(node.dims[0])
+                yield node.dims[0]
                 self.write(",")
             else:
-                self.write_expression_list(node.dims, need_parens=False)
+                yield from self.write_expression_list(node.dims, need_parens=False)
 
-        def visit_Index(self, node: Any) -> None:
-            self.visit(node.value)
+        def visit_Index(self, node: Any) -> Iterator[ast.AST]:
+            yield node.value
 
     # operators
     for op, string in _OP_TO_STR.items():
@@ -1118,36 +1997,34 @@ class Decompiler(ast.NodeVisitor):
         visit_Param
     ) = lambda self, node: None
 
-    def visit_comprehension(self, node: ast.comprehension) -> None:
+    def visit_comprehension(self, node: ast.comprehension) -> Iterator[ast.AST]:
         if node.is_async:
             self.write("async ")
         self.write("for ")
-        self.visit(node.target)
+        yield node.target
         self.write(" in ")
         with self.parenthesize_if(isinstance(node.iter, ast.Lambda)):
-            self.visit(node.iter)
+            yield node.iter
         for expr in node.ifs:
             self.write(" if ")
-            self.visit(expr)
+            yield expr
 
-    def visit_ExceptHandler(
-        self, node: ast.ExceptHandler, *, is_trystar: bool = False
-    ) -> None:
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("except")
-        if is_trystar:
+        if isinstance(self.get_parent_node(), _TRY_STAR_TYPES):
             self.write("*")
         if node.type:
             self.write(" ")
-            self.visit(node.type)
+            yield node.type
             if node.name:
                 self.write(" as ")
                 self.write(node.name)
         self.write(":")
         self.write_newline()
-        self.write_suite(node.body)
+        yield from self.write_suite(node.body)
 
-    def visit_arguments(self, node: ast.arguments) -> None:
+    def visit_arguments(self, node: ast.arguments) -> Iterator[ast.AST]:
         args = []
         positional_args = [*node.posonlyargs, *node.args]
         num_defaults = len(node.defaults)
@@ -1187,69 +2064,69 @@ class Decompiler(ast.NodeVisitor):
         if args:
             # lambdas can't have a multiline arglist
             allow_newlines = not isinstance(self.get_parent_node(), ast.Lambda)
-            self.write_expression_list(
+            yield from self.write_expression_list(
                 args,
                 allow_newlines=allow_newlines,
                 need_parens=False,
                 final_separator_if_multiline=False,  # illegal after **kwargs
             )
 
-    def visit_arg(self, node: ast.arg) -> None:
+    def visit_arg(self, node: ast.arg) -> Iterator[ast.AST]:
         self.write(node.arg)
         if node.annotation:
             self.write(": ")
             # TODO precedence
-            self.visit(node.annotation)
+            yield node.annotation
 
-    def visit_keyword(self, node: ast.keyword) -> None:
+    def visit_keyword(self, node: ast.keyword) -> Iterator[ast.AST]:
         if node.arg is None:
             # in py3, **kwargs is a keyword whose arg is None
-            self.write_double_starred(node.value)
+            yield from self.write_double_starred(node.value)
         else:
             self.write(node.arg + "=")
-            self.visit(node.value)
+            yield node.value
 
     def visit_alias(self, node: ast.alias) -> None:
         self.write(node.name)
         if node.asname is not None:
             self.write(f" as {node.asname}")
 
-    def visit_Match(self, node: "ast.Match") -> None:
+    def visit_Match(self, node: "ast.Match") -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("match ")
-        self.visit(node.subject)
+        yield node.subject
         self.write(":")
         self.write_newline()
-        self.write_suite(node.cases)
+        yield from self.write_suite(node.cases)
 
-    def visit_match_case(self, node: "ast.match_case") -> None:
+    def visit_match_case(self, node: "ast.match_case") -> Iterator[ast.AST]:
         self.write_indentation()
         self.write("case ")
-        self.visit(node.pattern)
+        yield node.pattern
         if node.guard is not None:
             self.write(" if ")
-            self.visit(node.guard)
+            yield node.guard
         self.write(":")
         self.write_newline()
-        self.write_suite(node.body)
+        yield from self.write_suite(node.body)
 
-    def visit_MatchValue(self, node: "ast.MatchValue") -> None:
-        self.visit(node.value)
+    def visit_MatchValue(self, node: "ast.MatchValue") -> Iterator[ast.AST]:
+        yield node.value
 
     def visit_MatchSingleton(self, node: "ast.MatchSingleton") -> None:
         self.write_constant(node.value)
 
-    def visit_MatchSequence(self, node: "ast.MatchSequence") -> None:
+    def visit_MatchSequence(self, node: "ast.MatchSequence") -> Iterator[ast.AST]:
         self.write("[")
-        self.write_expression_list(node.patterns, need_parens=False)
+        yield from self.write_expression_list(node.patterns, need_parens=False)
         self.write("]")
 
-    def visit_MatchMapping(self, node: "ast.MatchMapping") -> None:
+    def visit_MatchMapping(self, node: "ast.MatchMapping") -> Iterator[ast.AST]:
         self.write("{")
         items = [
             KeyValuePair(key, value) for key, value in zip(node.keys, node.patterns)
         ]
-        self.write_expression_list(
+        yield from self.write_expression_list(
             items, need_parens=False, final_separator_if_multiline=node.rest is None
         )
         if node.rest is not None:
@@ -1258,8 +2135,8 @@ class Decompiler(ast.NodeVisitor):
             self.write(f"**{node.rest}")
         self.write("}")
 
-    def visit_MatchClass(self, node: "ast.MatchClass") -> None:
-        self.visit(node.cls)
+    def visit_MatchClass(self, node: "ast.MatchClass") -> Iterator[ast.AST]:
+        yield node.cls
         self.write("(")
         patterns = [
             *node.patterns,
@@ -1268,10 +2145,10 @@ class Decompiler(ast.NodeVisitor):
                 for attr, pattern in zip(node.kwd_attrs, node.kwd_patterns)
             ),
         ]
-        self.write_expression_list(patterns, need_parens=False)
+        yield from self.write_expression_list(patterns, need_parens=False)
         self.write(")")
 
-    def visit_MatchAs(self, node: "ast.MatchAs") -> None:
+    def visit_MatchAs(self, node: "ast.MatchAs") -> Iterator[ast.AST]:
         if node.pattern is None:
             if node.name is None:
                 self.write("_")
@@ -1282,14 +2159,14 @@ class Decompiler(ast.NodeVisitor):
             with self.parenthesize_if(
                 isinstance(parent_node, (ast.MatchOr, ast.MatchAs))
             ):
-                self.visit(node.pattern)
+                yield node.pattern
                 self.write(" as ")
                 self.write(node.name)
 
-    def visit_MatchOr(self, node: "ast.MatchOr") -> None:
+    def visit_MatchOr(self, node: "ast.MatchOr") -> Iterator[ast.AST]:
         parent_node = self.get_parent_node()
         with self.parenthesize_if(isinstance(parent_node, ast.MatchOr)):
-            self.write_expression_list(
+            yield from self.write_expression_list(
                 node.patterns,
                 need_parens=True,
                 separator=" | ",
@@ -1302,3 +2179,6 @@ class Decompiler(ast.NodeVisitor):
             self.write("_")
         else:
             self.write(node.name)
+
+
+Decompiler.visitors = Decompiler.build_visitors()
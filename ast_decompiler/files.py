@@ -0,0 +1,36 @@
+"""
+
+Finding the Python files given on the command line.
+
+"""
+
+import glob
+import os
+from typing import Iterable, Iterator
+
+
+def find_files(patterns: Iterable[str]) -> Iterator[str]:
+    """Yields the paths to the files given by command-line arguments.
+
+    Each argument is a file, a directory, which is searched recursively for .py files, or a
+    glob. Directories matched by a glob are searched in the same way. Paths that do not exist
+    and are not globs are yielded as they are, so that the error is reported when they are read.
+
+    """
+    for pattern in patterns:
+        if os.path.exists(pattern) or not glob.has_magic(pattern):
+            yield from _expand(pattern)
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                yield from _expand(path)
+
+
+def _expand(path: str) -> Iterator[str]:
+    if not os.path.isdir(path):
+        yield path
+        return
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                yield os.path.join(dirpath, filename)
@@ -0,0 +1,140 @@
+"""
+
+Structural hashing of trees.
+
+The hash of a node covers its type and the values of its fields, but not its position (lineno,
+col_offset and the end positions), so a tree hashes the same however its code was formatted.
+Hashes only depend on the tree, so unlike hash() they are the same across processes and runs,
+and they can be used as file names.
+
+The tree is encoded in a single iterative pass. Each node with fields is hashed as soon as it
+ends and its encoding is replaced by its digest, like in a Merkle tree, so the hash of a node
+covers the hashes of its children and every byte of the encoding is hashed only once, however
+deep the tree is.
+
+"""
+
+import ast
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+# Size of a digest in bytes; hexadecimal hashes are twice as long.
+DIGEST_SIZE = 16
+
+# Markers for the end of a node and of a list on the stack of _hash_tree().
+_NODE_END = object()
+_LIST_END = object()
+
+# For each node type: the encoding of its start, its fields in reverse order (None if it has
+# none), and whether it is a statement. None for types of other values.
+_Kind = Optional[Tuple[bytes, Optional[Tuple[str, ...]], bool]]
+_KINDS: Dict[Type[Any], _Kind] = {}
+
+
+def structural_hash(tree: ast.AST) -> str:
+    """Returns the structural hash of a tree, as a hexadecimal string."""
+    return _hash_tree(tree, None).hex()
+
+
+def subtree_hashes(tree: ast.AST, statements_only: bool = False) -> Dict[ast.AST, str]:
+    """Returns the structural hash of each node in a tree, as hexadecimal strings.
+
+    The hash of the tree itself is included. Nodes are looked up by identity; a node that
+    occurs more than once in the tree, such as an operator, has the same hash everywhere.
+    With statements_only, only the hashes of the tree and of statements are returned, which
+    is faster.
+
+    """
+    digests: Dict[ast.AST, bytes] = {}
+    _hash_tree(tree, digests, statements_only)
+    return {node: digest.hex() for node, digest in digests.items()}
+
+
+def _get_kind(cls: Type[Any]) -> _Kind:
+    kind: _Kind
+    if issubclass(cls, ast.AST):
+        fields = cls._fields
+        if fields:
+            kind = (
+                f"{cls.__name__}(".encode(),
+                fields[::-1],
+                issubclass(cls, ast.stmt),
+            )
+        else:
+            kind = (f"{cls.__name__}()".encode(), None, issubclass(cls, ast.stmt))
+    else:
+        kind = None
+    _KINDS[cls] = kind
+    return kind
+
+
+def _hash_tree(
+    tree: ast.AST,
+    digests: Optional[Dict[ast.AST, bytes]],
+    statements_only: bool = False,
+) -> bytes:
+    """Returns the digest of a tree, storing the digests of its nodes in digests if given.
+
+    In the encoding, each value starts with a different byte, so that it is unambiguous:
+    a node starts with the name of its type, a list with "[", a digest with a zero byte
+    followed by the fixed number of bytes of the digest, and any other value is the repr()
+    of the value between the bytes 1 and 2, which repr() always escapes.
+
+    """
+    parts: List[bytes] = []
+    stack: List[Any] = [tree]
+    # local aliases, because this loop runs for every value in the tree
+    append = parts.append
+    push = stack.append
+    pop = stack.pop
+    kinds = _KINDS
+    # whether to store the digests of all nodes, or only of statements and of the tree
+    store_all = not statements_only
+    while stack:
+        value = pop()
+        try:
+            kind = kinds[value.__class__]
+        except KeyError:
+            kind = _get_kind(value.__class__)
+        if kind is not None:
+            start, fields, is_statement = kind
+            if fields is None:
+                # the encoding is shorter than a digest, so it is not replaced
+                append(start)
+                if digests is not None and (store_all or is_statement):
+                    digests[value] = _digest([start])
+                continue
+            push(value)
+            push(is_statement or value is tree)
+            push(len(parts))
+            push(_NODE_END)
+            append(start)
+            for field in fields:
+                push(getattr(value, field, None))
+        elif value is _NODE_END:
+            start_index = pop()
+            is_stored = pop()
+            node = pop()
+            append(b")")
+            digest = _digest(parts[start_index:])
+            del parts[start_index:]
+            append(b"\x00" + digest)
+            if digests is not None and (store_all or is_stored):
+                digests[node] = digest
+        elif value.__class__ is list:
+            append(b"[")
+            push(_LIST_END)
+            stack.extend(value[::-1])
+        elif value is _LIST_END:
+            append(b"]")
+        else:
+            append(b"\x01" + repr(value).encode("utf-8", "surrogatepass") + b"\x02")
+    if parts[0].startswith(b"\x00"):
+        # the encoding of the tree has been replaced by its digest
+        return parts[0][1:]
+    # a node without fields
+    return _digest(parts)
+
+
+def _digest(parts: List[bytes]) -> bytes:
+    return hashlib.blake2b(b"".join(parts), digest_size=DIGEST_SIZE).digest()
@@ -0,0 +1,446 @@
+"""
+
+Decompiling an edited tree again, reusing the code for the statements that did not change.
+
+"""
+
+import ast
+import copy
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Union
+import weakref
+
+from .blocks import header_end, split_lines
+from .decompiler import decompile
+from .hashing import structural_hash, subtree_hashes
+
+# Statements whose bodies are spliced statement by statement when only their bodies changed.
+_SPLICED_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+_Spliced = Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]
+
+# Fields that hold nested statements, or the except handlers and match cases that hold them
+_BLOCK_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+
+
+class _Options(NamedTuple):
+    indentation: int
+    line_length: int
+    starting_indentation: int
+
+
+class _Statement(NamedTuple):
+    """The code for a statement, including the blank lines before it."""
+
+    node: ast.stmt
+    # None for a function or class nested in another one, whose code is only kept split up
+    code: Optional[str]
+    # for a function or class, its code split up, if it is known
+    definition: Optional["_Definition"] = None
+
+
+class _Definition(NamedTuple):
+    """The code for a function or class, split into its header and its body."""
+
+    # code up to the body
+    header: str
+    body: List[_Statement]
+
+
+class IncrementalState:
+    """The code for each statement of a tree, kept from one call to decompile_incremental() to
+    the next.
+
+    Pass the same state to successive calls, together with the statements that changed, so
+    that the code does not have to be parsed, and unchanged statements are neither hashed nor
+    rendered again. The state refers to the statements of the last tree and holds their code
+    until it is dropped.
+
+    """
+
+    def __init__(self) -> None:
+        self._options: Optional[_Options] = None
+        self._tree: Optional[ast.AST] = None
+        self._code: Optional[str] = None
+        self._statements: List[_Statement] = []
+        # the statement that each nested statement is in
+        self._parents: "weakref.WeakKeyDictionary[ast.stmt, ast.stmt]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _matches(self, tree: ast.AST, code: str, options: _Options) -> bool:
+        return self._tree is tree and self._code == code and self._options == options
+
+
+def decompile_incremental(
+    old_tree: ast.AST,
+    old_code: str,
+    new_tree: ast.AST,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+    state: Optional[IncrementalState] = None,
+    changed: Optional[Iterable[ast.stmt]] = None,
+) -> str:
+    """Decompiles an edited tree, reusing the code for the statements that did not change.
+
+    Arguments:
+    - old_tree: the tree before the edit
+    - old_code: the code that decompile() or decompile_incremental() produced for old_tree,
+      with the same options
+    - new_tree: the tree after the edit; it may be old_tree itself, modified in place
+    - state: an IncrementalState, which is updated with the code for the statements of
+      new_tree, to be passed to the next call along with the result of this one
+    - changed: the statements of old_tree that were modified in place since state was
+      updated, including those whose blocks had statements inserted, removed or replaced
+    - the other arguments are the same as for decompile()
+
+    If state holds the code for old_tree and old_code and changed is given, each statement of
+    new_tree that is the same object as a statement in the same block of old_tree, and that
+    is not in changed and does not contain a statement in changed, is copied without hashing
+    or rendering it; the other statements are rendered. A statement in changed is rendered
+    with everything in it, so list the innermost statements that were modified: listing a
+    function because one statement in its body changed renders the whole function. The time
+    taken then depends on the size of the edit rather than of the tree.
+
+    Otherwise, old_code is parsed, and statements are compared by their structural hash. The
+    code for each top-level statement of new_tree that is also in old_code is copied from
+    old_code, and functions and classes that only changed in their bodies are spliced in the
+    same way statement by statement. Only the other statements are rendered.
+
+    Either way, the result is the same code as decompile(new_tree) produces.
+
+    """
+    options = _Options(indentation, line_length, starting_indentation)
+    statements: List[_Statement] = []
+    if not isinstance(new_tree, ast.Module):
+        code = _render(new_tree, 0, options)
+    elif (
+        state is not None
+        and changed is not None
+        and state._matches(old_tree, old_code, options)
+    ):
+        changed = set(changed)
+        splicer = _Splicer(options, None, state._parents)
+        statements = splicer.update(
+            state._statements,
+            new_tree.body,
+            0,
+            None,
+            changed,
+            splicer.containing(changed),
+        )
+        code = "".join([_code(statement) for statement in statements])
+    else:
+        old_statements = _old_statements(old_tree, old_code, new_tree, options)
+        if state is not None:
+            state._parents = weakref.WeakKeyDictionary()
+        splicer = _Splicer(
+            options,
+            subtree_hashes(new_tree, statements_only=True),
+            None if state is None else state._parents,
+        )
+        if old_statements is None:
+            old_statements = _OldStatements([], {})
+        statements = splicer.splice(old_statements, new_tree.body, 0, None)
+        code = "".join([_code(statement) for statement in statements])
+    if state is not None:
+        state._options = options
+        state._tree = new_tree
+        state._code = code
+        state._statements = statements
+    return code
+
+
+class _OldStatements(NamedTuple):
+    """The statements parsed from old code."""
+
+    statements: List[_Statement]
+    hashes: Dict[ast.AST, str]
+
+
+def _old_statements(
+    old_tree: ast.AST, old_code: str, new_tree: ast.AST, options: _Options
+) -> Optional[_OldStatements]:
+    if not isinstance(old_tree, ast.Module):
+        return None
+    # indented code parses as the body of a block
+    prefix = "if 1:\n" if options.starting_indentation else ""
+    try:
+        parsed_tree = ast.parse(prefix + old_code)
+    except SyntaxError:
+        return None
+    parsed_body = parsed_tree.body
+    if prefix:
+        block = parsed_body[0]
+        assert isinstance(block, ast.If)
+        parsed_body = block.body
+    if old_tree is not new_tree and len(parsed_body) != len(old_tree.body):
+        # the code is not for this tree; if the tree was modified in place, it may have more
+        # or fewer statements now
+        return None
+    statements = _split_statements(
+        split_lines(prefix + old_code), parsed_body, 1 if prefix else 0
+    )
+    return _OldStatements(statements, subtree_hashes(parsed_tree, statements_only=True))
+
+
+def _split_statements(
+    lines: List[str], statements: Sequence[ast.stmt], start: int
+) -> List[_Statement]:
+    """Splits the lines of code, from index start, into the code for each parsed statement."""
+    result = []
+    for statement in statements:
+        definition = None
+        if isinstance(statement, _SPLICED_TYPES):
+            end = header_end(lines, statement)
+            definition = _Definition(
+                "".join(lines[start:end]), _split_statements(lines, statement.body, end)
+            )
+        assert statement.end_lineno is not None
+        code = "".join(lines[start : statement.end_lineno])
+        result.append(_Statement(statement, code, definition))
+        start = statement.end_lineno
+    return result
+
+
+class _Splicer:
+    def __init__(
+        self,
+        options: _Options,
+        new_hashes: Optional[Dict[ast.AST, str]],
+        parents: "Optional[weakref.WeakKeyDictionary[ast.stmt, ast.stmt]]",
+    ) -> None:
+        self.options = options
+        self.new_hashes = new_hashes
+        # the statement that each nested statement is in, if it is recorded for a state
+        self.parents = parents
+
+    def update(
+        self,
+        old_statements: Sequence[_Statement],
+        new_statements: Sequence[ast.stmt],
+        depth: int,
+        parent: Optional[ast.stmt],
+        changed: Set[ast.stmt],
+        containing: Set[ast.stmt],
+    ) -> List[_Statement]:
+        """Returns the code for new_statements, reusing old statements that are the same objects.
+
+        changed holds the statements that were modified, and containing the statements that
+        contain one of them.
+
+        """
+        by_node = {statement.node: statement for statement in old_statements}
+        result = []
+        for node in new_statements:
+            statement = by_node.get(node)
+            if statement is not None and node in changed:
+                # anything in a changed statement may have changed, including the statements
+                # in the body of a definition
+                statement = None
+            elif statement is not None and node in containing:
+                definition = statement.definition
+                if definition is None:
+                    statement = None
+                else:
+                    assert isinstance(node, _SPLICED_TYPES)
+                    body = self.update(
+                        definition.body, node.body, depth + 1, node, changed, containing
+                    )
+                    statement = self.join_definition(
+                        node, definition.header, body, depth
+                    )
+            if statement is None:
+                statement = self.render(node, depth, parent)
+            result.append(statement)
+        return result
+
+    def containing(self, statements: Iterable[ast.stmt]) -> Set[ast.stmt]:
+        """Returns the recorded statements that contain any of the statements."""
+        assert self.parents is not None
+        result: Set[ast.stmt] = set()
+        for statement in statements:
+            parent = self.parents.get(statement)
+            while parent is not None and parent not in result:
+                result.add(parent)
+                parent = self.parents.get(parent)
+        return result
+
+    def splice(
+        self,
+        old: _OldStatements,
+        new_statements: Sequence[ast.stmt],
+        depth: int,
+        parent: Optional[ast.stmt],
+    ) -> List[_Statement]:
+        """Returns the code for new_statements, reusing old statements with the same hash."""
+        assert self.new_hashes is not None
+        # The code for a statement only depends on the statement and its depth, so unchanged
+        # statements can be reused from anywhere in the same suite.
+        by_hash: Dict[str, List[int]] = {}
+        for i, statement in reversed(list(enumerate(old.statements))):
+            by_hash.setdefault(old.hashes[statement.node], []).append(i)
+        used: Set[int] = set()
+
+        result = []
+        for statement in new_statements:
+            statement_hash = self.new_hashes[statement]
+            indexes = by_hash.get(statement_hash)
+            while indexes and indexes[-1] in used:
+                indexes.pop()
+            if indexes:
+                index = indexes.pop()
+                used.add(index)
+                result.append(
+                    self.reuse(old.statements[index], statement, depth, parent)
+                )
+            elif isinstance(statement, _SPLICED_TYPES):
+                result.append(
+                    self.splice_definition(statement, old, used, depth, parent)
+                )
+            else:
+                result.append(self.render(statement, depth, parent))
+        return result
+
+    def splice_definition(
+        self,
+        statement: _Spliced,
+        old: _OldStatements,
+        used: Set[int],
+        depth: int,
+        parent: Optional[ast.stmt],
+    ) -> _Statement:
+        """Returns the code for a definition, reusing an old one that only differs in its body."""
+        header_hash = None
+        for index, old_statement in enumerate(old.statements):
+            old_node = old_statement.node
+            definition = old_statement.definition
+            if (
+                definition is None
+                or index in used
+                or type(old_node) is not type(statement)
+                or not isinstance(old_node, _SPLICED_TYPES)
+                or old_node.name != statement.name
+            ):
+                continue
+            if header_hash is None:
+                header_hash = _header_hash(statement)
+            if _header_hash(old_node) != header_hash:
+                continue
+            used.add(index)
+            self.record(statement, parent)
+            body = self.splice(
+                _OldStatements(definition.body, old.hashes),
+                statement.body,
+                depth + 1,
+                statement,
+            )
+            return self.join_definition(statement, definition.header, body, depth)
+        return self.render(statement, depth, parent)
+
+    def reuse(
+        self,
+        old_statement: _Statement,
+        node: ast.stmt,
+        depth: int,
+        parent: Optional[ast.stmt],
+    ) -> _Statement:
+        """Returns the code for a statement that is equal to a parsed one."""
+        if self.parents is None:
+            return old_statement
+        # refer to the statements of the new tree, so that later calls find them
+        self.record(node, parent)
+        definition = old_statement.definition
+        if definition is None:
+            self.record_nested(node)
+            return _Statement(node, old_statement.code)
+        assert isinstance(node, _SPLICED_TYPES)
+        body = [
+            self.reuse(old_child, child, depth + 1, node)
+            for old_child, child in zip(definition.body, node.body)
+        ]
+        return self.join_definition(node, definition.header, body, depth)
+
+    def render(
+        self, statement: ast.stmt, depth: int, parent: Optional[ast.stmt]
+    ) -> _Statement:
+        """Renders a statement, rendering the header and body of a definition separately."""
+        self.record(statement, parent)
+        if not isinstance(statement, _SPLICED_TYPES):
+            self.record_nested(statement)
+            return _Statement(statement, _render(statement, depth, self.options))
+        header = self.render_header(statement, depth)
+        body = [self.render(child, depth + 1, statement) for child in statement.body]
+        return self.join_definition(statement, header, body, depth)
+
+    def render_header(self, statement: _Spliced, depth: int) -> str:
+        header_statement = copy.copy(statement)
+        header_statement.body = [ast.Pass()]
+        code = _render(header_statement, depth, self.options)
+        # remove the line with the pass statement
+        return code[: code.rindex("\n", 0, -1) + 1]
+
+    def join_definition(
+        self, statement: _Spliced, header: str, body: List[_Statement], depth: int
+    ) -> _Statement:
+        definition = _Definition(header, body)
+        # the code for nested definitions is put together when it is needed, so that it is not
+        # kept at every level
+        code = _join_definition(definition) if depth == 0 else None
+        return _Statement(statement, code, definition)
+
+    def record(self, statement: ast.stmt, parent: Optional[ast.stmt]) -> None:
+        if self.parents is None:
+            return
+        if parent is None:
+            self.parents.pop(statement, None)
+        else:
+            self.parents[statement] = parent
+
+    def record_nested(self, statement: ast.stmt) -> None:
+        """Records the parents of the statements nested in a statement that is not spliced."""
+        if self.parents is None:
+            return
+        # nodes with blocks, and the statement they are in
+        stack = [(statement, statement)]
+        while stack:
+            node, enclosing = stack.pop()
+            for field in _BLOCK_FIELDS:
+                children = getattr(node, field, None)
+                if not isinstance(children, list):
+                    continue
+                for child in children:
+                    if isinstance(child, ast.stmt):
+                        self.parents[child] = enclosing
+                        stack.append((child, child))
+                    else:
+                        # an except handler or a match case
+                        stack.append((child, enclosing))
+
+
+def _code(statement: _Statement) -> str:
+    if statement.code is not None:
+        return statement.code
+    assert statement.definition is not None
+    return _join_definition(statement.definition)
+
+
+def _join_definition(definition: _Definition) -> str:
+    return definition.header + "".join([_code(child) for child in definition.body])
+
+
+def _header_hash(definition: _Spliced) -> str:
+    """Returns the structural hash of a definition without its body."""
+    header = copy.copy(definition)
+    header.body = []
+    return structural_hash(header)
+
+
+def _render(node: ast.AST, depth: int, options: _Options) -> str:
+    if isinstance(node, ast.stmt):
+        node = ast.Module(body=[node], type_ignores=[])
+    return decompile(
+        node,
+        indentation=options.indentation,
+        line_length=options.line_length,
+        starting_indentation=options.starting_indentation + depth * options.indentation,
+    )
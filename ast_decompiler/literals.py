@@ -0,0 +1,150 @@
+"""
+
+Rendering of string literals.
+
+Characters are escaped as the unicode-escape codec escapes them, so the code is always ASCII,
+and all escaping is done by a single call to str.translate().
+
+"""
+
+from typing import Dict, Optional
+
+
+def escape_character(char: str) -> str:
+    """Returns the escape sequence for a character, as the unicode-escape codec writes it."""
+    if char == "\\":
+        return "\\\\"
+    if char == "\t":
+        return "\\t"
+    if char == "\n":
+        return "\\n"
+    if char == "\r":
+        return "\\r"
+    code = ord(char)
+    if code < 0x100:
+        return f"\\x{code:02x}"
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+    return f"\\U{code:08x}"
+
+
+class _EscapeTable(Dict[int, object]):
+    """Table for str.translate(), which escapes characters as the unicode-escape codec does.
+
+    Entries for ASCII characters are filled in up front, and entries for other characters are
+    added when they are first used.
+
+    """
+
+    def __init__(self, replacements: Dict[str, str]) -> None:
+        super().__init__()
+        for code in range(0x80):
+            char = chr(code)
+            if char in replacements:
+                self[code] = replacements[char]
+            elif char.isprintable() and char != "\\":
+                self[code] = code
+            else:
+                self[code] = escape_character(char)
+
+    def __missing__(self, code: int) -> str:
+        escaped = self[code] = escape_character(chr(code))
+        return escaped
+
+
+_QUOTED_TABLES = {"'": _EscapeTable({"'": "\\'"}), '"': _EscapeTable({'"': '\\"'})}
+_DOCSTRING_TABLE = _EscapeTable({"\n": "\n"})
+_F_STRING_TABLE = _EscapeTable({"'": "\\'", "{": "{{", "}": "}}"})
+
+
+class StringRenderer:
+    """Renders string literals, remembering the rendering of each value.
+
+    Generated code tends to use the same strings over and over, so each Decompiler has its
+    own StringRenderer, and renders each distinct value only once in each context.
+
+    """
+
+    def __init__(self) -> None:
+        self._literals: Dict[str, str] = {}
+        self._quoted_literals: Dict[str, Dict[str, str]] = {"'": {}, '"': {}}
+        self._docstrings: Dict[str, Optional[str]] = {}
+        self._f_string_parts: Dict[str, str] = {}
+
+    def clear(self) -> None:
+        """Forgets the remembered renderings."""
+        self._literals.clear()
+        for literals in self._quoted_literals.values():
+            literals.clear()
+        self._docstrings.clear()
+        self._f_string_parts.clear()
+
+    def literal(self, value: str) -> str:
+        """Returns a literal for a string, in the quotes that need the fewest escapes."""
+        try:
+            return self._literals[value]
+        except KeyError:
+            pass
+        quote = '"' if value.count("'") > value.count('"') else "'"
+        literal = self._literals[value] = self.quoted_literal(value, quote)
+        return literal
+
+    def quoted_literal(self, value: str, quote: str) -> str:
+        """Returns a literal for a string in the given quote character."""
+        literals = self._quoted_literals[quote]
+        try:
+            return literals[value]
+        except KeyError:
+            pass
+        if (
+            value.isascii()
+            and value.isprintable()
+            and "\\" not in value
+            and quote not in value
+        ):
+            literal = quote + value + quote
+        else:
+            literal = quote + value.translate(_QUOTED_TABLES[quote]) + quote
+        literals[value] = literal
+        return literal
+
+    def docstring(self, value: str) -> Optional[str]:
+        """Returns a triple-quoted literal for a string, or None if it cannot be written as one.
+
+        Newlines are written as they are, so that docstrings stay readable.
+
+        """
+        try:
+            return self._docstrings[value]
+        except KeyError:
+            pass
+        if '"""' in value:
+            literal = None
+        else:
+            body = value.translate(_DOCSTRING_TABLE)
+            if body.endswith('"'):
+                # the quote would run into the closing quotes
+                body = body[:-1] + '\\"'
+            literal = '"""' + body + '"""'
+        self._docstrings[value] = literal
+        return literal
+
+    def f_string_part(self, value: str) -> str:
+        """Returns the code for a constant part of an f-string or t-string in single quotes."""
+        try:
+            return self._f_string_parts[value]
+        except KeyError:
+            pass
+        if (
+            value.isascii()
+            and value.isprintable()
+            and "\\" not in value
+            and "'" not in value
+            and "{" not in value
+            and "}" not in value
+        ):
+            code = value
+        else:
+            code = value.translate(_F_STRING_TABLE)
+        self._f_string_parts[value] = code
+        return code
@@ -0,0 +1,260 @@
+"""
+
+Decompiling in parallel: many modules at once, or the statements of a single large module.
+
+"""
+
+import ast
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import os
+from typing import (
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from .decompiler import decompile
+
+# Minimum number of top-level statements rendered by each worker in decompile_module(). Sending
+# statements to another process costs about as much as rendering them, so smaller shards are
+# rendered faster in the current process.
+MIN_STATEMENTS_PER_WORKER = 1000
+
+# Maximum number of chunks submitted to each worker in decompile_many() whose results have not
+# been yielded yet. Inputs are only read from the iterable as earlier chunks are completed, so
+# that neither the inputs nor the results pile up in memory.
+MAX_CHUNKS_PER_WORKER = 2
+
+# An input to decompile_many(): a tree, the path to a source file, or source code as bytes.
+Source = Union[ast.AST, str, "os.PathLike[str]", bytes]
+
+
+class DecompileError(Exception):
+    """An error raised while reading, parsing or decompiling an input to decompile_many().
+
+    Only the type name and message of the original exception are kept, because not all
+    exceptions can be sent back from a worker process.
+
+    """
+
+    def __init__(self, type_name: str, message: str) -> None:
+        super().__init__(type_name, message)
+        # name of the type of the original exception, qualified by its module unless it is a
+        # builtin
+        self.type_name = type_name
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"{self.type_name}: {self.message}"
+
+    @classmethod
+    def from_exception(cls, error: BaseException) -> "DecompileError":
+        error_type = type(error)
+        type_name = error_type.__qualname__
+        if error_type.__module__ != "builtins":
+            type_name = f"{error_type.__module__}.{type_name}"
+        return cls(type_name, str(error))
+
+
+class DecompileResult(NamedTuple):
+    """The result of decompiling one of the inputs to decompile_many()."""
+
+    # position of the input in the inputs to decompile_many()
+    position: int
+    # decompiled code, or None if there was an error
+    code: Optional[str]
+    # error raised while reading, parsing or decompiling the input
+    error: Optional[DecompileError]
+
+
+class _Options(NamedTuple):
+    indentation: int
+    line_length: int
+    starting_indentation: int
+
+
+def decompile_many(
+    sources: Iterable[Source],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    chunksize: int = 1,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+) -> Iterator[DecompileResult]:
+    """Decompiles many inputs in a pool of worker processes.
+
+    Arguments:
+    - sources: trees, paths to source files, or source code as bytes. Paths and source code are
+      parsed in the workers, so that trees do not have to be sent between processes.
+    - workers: number of worker processes; defaults to the number of CPUs. With a single worker,
+      the inputs are decompiled in the current process.
+    - ordered: whether to yield results in the order of the inputs, or as they are completed
+    - chunksize: number of inputs sent to a worker at a time
+    - the other arguments are the same as for decompile()
+
+    Yields a DecompileResult for each input. An error in one input is reported in its result
+    as a DecompileError, and does not stop the others from being decompiled. If a worker
+    process dies, the inputs that were pending in the pool are reported as BrokenProcessPool
+    errors, and the remaining inputs are decompiled in a new pool. At most
+    MAX_CHUNKS_PER_WORKER chunks per worker are read and decompiled ahead of the results that
+    have been yielded.
+
+    """
+    options = _Options(indentation, line_length, starting_indentation)
+    chunks = _chunk(enumerate(sources), chunksize)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            yield from _decompile_chunk(chunk, options)
+        return
+
+    max_pending = MAX_CHUNKS_PER_WORKER * workers
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending: Deque[_Pending] = deque()
+    try:
+        for chunk in chunks:
+            if len(pending) >= max_pending:
+                yield from _completed(pending, ordered)
+            try:
+                future = executor.submit(_decompile_chunk, chunk, options)
+            except BrokenProcessPool:
+                # a worker died, for example because it ran out of memory; the chunks that
+                # were pending in the pool are reported as errors, and the rest go to a new one
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(max_workers=workers)
+                future = executor.submit(_decompile_chunk, chunk, options)
+            pending.append((future, [position for position, _ in chunk]))
+        while pending:
+            yield from _completed(pending, ordered)
+    finally:
+        for future, _ in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+# A chunk submitted to the pool, and the positions of its inputs.
+_Pending = Tuple["Future[List[DecompileResult]]", List[int]]
+
+
+def _completed(pending: Deque[_Pending], ordered: bool) -> Iterator[DecompileResult]:
+    """Waits for the first pending chunk, or for any if not ordered, and yields its results."""
+    if ordered:
+        yield from _results(*pending.popleft())
+        return
+    done, _ = wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+    for item in list(pending):
+        if item[0] in done:
+            # there are few pending chunks, so removing them from the deque is cheap
+            pending.remove(item)
+            yield from _results(*item)
+
+
+def _results(
+    future: "Future[List[DecompileResult]]", positions: List[int]
+) -> List[DecompileResult]:
+    try:
+        return future.result()
+    except Exception as e:
+        # BrokenProcessPool if a worker died, or an error sending the chunk or its results
+        # between processes
+        error = DecompileError.from_exception(e)
+        return [DecompileResult(position, None, error) for position in positions]
+
+
+def _chunk(
+    items: Iterable[Tuple[int, Source]], chunksize: int
+) -> Iterator[List[Tuple[int, Source]]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decompile_chunk(
+    chunk: Sequence[Tuple[int, Source]], options: _Options
+) -> List[DecompileResult]:
+    return [_decompile_one(index, source, options) for index, source in chunk]
+
+
+def _decompile_one(index: int, source: Source, options: _Options) -> DecompileResult:
+    try:
+        if isinstance(source, ast.AST):
+            tree = source
+        else:
+            if not isinstance(source, bytes):
+                with open(source, "rb") as f:
+                    source = f.read()
+            tree = ast.parse(source)
+        code = decompile(
+            tree,
+            indentation=options.indentation,
+            line_length=options.line_length,
+            starting_indentation=options.starting_indentation,
+        )
+    except Exception as e:
+        return DecompileResult(index, None, DecompileError.from_exception(e))
+    return DecompileResult(index, code, None)
+
+
+def decompile_module(
+    tree: ast.AST,
+    workers: Optional[int] = None,
+    indentation: int = 4,
+    line_length: int = 100,
+    starting_indentation: int = 0,
+) -> str:
+    """Decompiles a module, rendering shards of its top-level statements in parallel.
+
+    Each top-level statement is rendered independently of the others, so the shards are
+    joined into the same code that decompile() produces. The number of workers is limited so
+    that each renders at least MIN_STATEMENTS_PER_WORKER statements; trees that are too small,
+    or that are not modules, are decompiled in the current process.
+
+    """
+    options = _Options(indentation, line_length, starting_indentation)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if isinstance(tree, ast.Module):
+        workers = min(workers, len(tree.body) // MIN_STATEMENTS_PER_WORKER)
+    else:
+        workers = 1
+    if workers <= 1:
+        return decompile(
+            tree,
+            indentation=indentation,
+            line_length=line_length,
+            starting_indentation=starting_indentation,
+        )
+
+    assert isinstance(tree, ast.Module)
+    body = tree.body
+    shard_size = -(-len(body) // workers)
+    shards = [body[i : i + shard_size] for i in range(0, len(body), shard_size)]
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        return "".join(executor.map(_decompile_shard, shards, [options] * len(shards)))
+    finally:
+        executor.shutdown()
+
+
+def _decompile_shard(statements: List[ast.stmt], options: _Options) -> str:
+    return decompile(
+        ast.Module(body=statements, type_ignores=[]),
+        indentation=options.indentation,
+        line_length=options.line_length,
+        starting_indentation=options.starting_indentation,
+    )
@@ -0,0 +1,250 @@
+"""
+
+Decompiling a tree that was parsed from source code and then partly modified, copying the code
+for the statements that did not change from the source.
+
+"""
+
+import ast
+import copy
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .blocks import Block, first_line, header_end, split_lines
+from .check import find_difference
+from .decompiler import decompile
+
+# Compound statements whose bodies are handled statement by statement when only their bodies
+# changed, provided that they have no other blocks, such as an else block.
+_SINGLE_BLOCK_TYPES = (
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.If,
+    ast.For,
+    ast.AsyncFor,
+    ast.While,
+    ast.With,
+    ast.AsyncWith,
+)
+
+
+class _Options(NamedTuple):
+    indentation: int
+    line_length: int
+
+
+class ParsedSource:
+    """Source code, parsed once so that it can be passed to decompile_with_source() for several
+    trees parsed from it.
+
+    Usage:
+
+        parsed = ParsedSource(source)
+        for tree in modified_trees:
+            code = decompile_with_source(tree, parsed)
+
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.lines = split_lines(source)
+        # None if the source does not parse
+        self.tree: Optional[ast.Module]
+        try:
+            self.tree = ast.parse(source)
+        except SyntaxError:
+            self.tree = None
+
+
+def decompile_with_source(
+    tree: ast.AST,
+    source: Union[str, ParsedSource],
+    indentation: int = 4,
+    line_length: int = 100,
+) -> str:
+    """Decompiles a tree parsed from source and then modified, copying unchanged code from source.
+
+    A statement of the tree is copied from the source, with the comments and blank lines
+    before it, if its position attributes are those of a statement in the same block of the
+    source that is on lines of its own, and find_difference() finds no difference between them. For
+    a compound statement that only changed in its body, the lines up to the body are copied
+    and the body is handled in the same way. Other statements are rendered by decompile(),
+    indented like the block they are in. Each statement of the source is matched to at most one
+    statement of the tree by these rules, and a statement that matches none, such as a new
+    statement given the position of another one, is rendered without the comments before
+    that one. If nothing changed, the result is the source itself.
+
+    Arguments:
+    - tree: the tree, which ast.parse(source) returned before it was modified
+    - source: the source code the tree was parsed from, or a ParsedSource for it, so that
+      decompiling several trees parsed from the same source only parses it once
+    - the other arguments are the same as for decompile(), and only affect rendered statements
+
+    """
+    options = _Options(indentation, line_length)
+    if not isinstance(tree, ast.Module):
+        return decompile(tree, indentation=indentation, line_length=line_length)
+    parsed = source if isinstance(source, ParsedSource) else ParsedSource(source)
+    if parsed.tree is None:
+        return decompile(tree, indentation=indentation, line_length=line_length)
+    copier = _Copier(parsed, options)
+    original_body = parsed.tree.body
+    if not original_body:
+        code = copier.copy_suite(tree.body, [], "", 0)
+        text = parsed.source
+        if code and text and not text.endswith("\n"):
+            text += "\n"
+        return text + code
+    # the comments before the first statement and after the last one are always kept
+    start = first_line(original_body[0]) - 1
+    return (
+        "".join(parsed.lines[:start])
+        + copier.copy_suite(tree.body, original_body, "", start)
+        + "".join(parsed.lines[original_body[-1].end_lineno :])
+    )
+
+
+class _Copier:
+    def __init__(self, source: ParsedSource, options: _Options) -> None:
+        self.source = source
+        self.options = options
+
+    def copy_suite(
+        self,
+        statements: Sequence[ast.stmt],
+        original_statements: Sequence[ast.stmt],
+        prefix: str,
+        start: int,
+    ) -> str:
+        """Returns the code for statements, which replace original_statements in a block.
+
+        prefix is the indentation of the block, and start the index of the line after the code
+        before the block in the source.
+
+        """
+        # index of each original statement by its position
+        originals: Dict[Tuple[int, int], int] = {
+            (original.lineno, original.col_offset): i
+            for i, original in enumerate(original_statements)
+        }
+        positions = [
+            originals.get(
+                (getattr(statement, "lineno", -1), getattr(statement, "col_offset", -1))
+            )
+            for statement in statements
+        ]
+        # each original is matched at most once, to a statement that is that original, so that
+        # a new statement given the position of another one does not take its place
+        matches: Dict[int, Tuple[int, bool]] = {}
+        matched = set()
+        for i, (statement, index) in enumerate(zip(statements, positions)):
+            if index is None or index in matched:
+                continue
+            original = original_statements[index]
+            if statement is original or find_difference(statement, original) is None:
+                matches[i] = (index, True)
+                matched.add(index)
+        # then the statements that only changed in their body
+        for i, (statement, index) in enumerate(zip(statements, positions)):
+            if index is None or index in matched or i in matches:
+                continue
+            if _can_splice(statement, original_statements[index]):
+                matches[i] = (index, False)
+                matched.add(index)
+        chunks = []
+        for i, statement in enumerate(statements):
+            if i not in matches:
+                chunks.append(self.render(statement, prefix))
+                continue
+            index, unchanged = matches[i]
+            original = original_statements[index]
+            # the line after the previous statement, so that the comments and blank lines
+            # before the statement are copied with it
+            code_start = original_statements[index - 1].end_lineno if index else start
+            assert code_start is not None
+            code = self.copy_statement(statement, original, code_start, unchanged)
+            if code is None:
+                # keep the comments and blank lines, instead of the blank lines that the
+                # decompiler puts before functions and classes
+                lines = self.source.lines[code_start : first_line(original) - 1]
+                code = "".join(lines) + self.render(statement, prefix).lstrip("\n")
+            chunks.append(code)
+        # only the last line of the source can lack a newline
+        return "".join(
+            [chunk if chunk.endswith("\n") else chunk + "\n" for chunk in chunks[:-1]]
+            + chunks[-1:]
+        )
+
+    def copy_statement(
+        self, statement: ast.stmt, original: ast.stmt, start: int, unchanged: bool
+    ) -> Optional[str]:
+        """Returns the code for a statement matched to original, if it can be copied.
+
+        unchanged is whether find_difference() found no difference between them.
+
+        """
+        lines = self.source.lines
+        if type(statement) is not type(original) or not _on_own_lines(lines, original):
+            return None
+        if unchanged:
+            assert original.end_lineno is not None
+            return "".join(lines[start : original.end_lineno])
+        if not _can_splice(statement, original):
+            return None
+        assert isinstance(statement, _SINGLE_BLOCK_TYPES) and isinstance(
+            original, _SINGLE_BLOCK_TYPES
+        )
+        body = original.body
+        first = body[0]
+        prefix = _prefix(lines[first.lineno - 1], first.col_offset)
+        if not prefix or prefix.strip(" ") or first.lineno == original.lineno:
+            # rendered statements could not be indented like the body
+            return None
+        end = header_end(lines, original)
+        return "".join(lines[start:end]) + self.copy_suite(
+            statement.body, body, prefix, end
+        )
+
+    def render(self, statement: ast.stmt, prefix: str) -> str:
+        return decompile(
+            ast.Module(body=[statement], type_ignores=[]),
+            indentation=self.options.indentation,
+            line_length=self.options.line_length,
+            starting_indentation=len(prefix),
+        )
+
+
+def _can_splice(statement: ast.stmt, original: ast.stmt) -> bool:
+    """Returns whether a statement only differs from the original in its body."""
+    return (
+        isinstance(statement, _SINGLE_BLOCK_TYPES)
+        and isinstance(original, _SINGLE_BLOCK_TYPES)
+        and not getattr(statement, "orelse", None)
+        and not getattr(original, "orelse", None)
+        and bool(statement.body)
+        and find_difference(_header(statement), _header(original)) is None
+    )
+
+
+def _header(statement: Block) -> Block:
+    """Returns a copy of a compound statement without its body."""
+    header = copy.copy(statement)
+    header.body = []
+    return header
+
+
+def _on_own_lines(lines: List[str], statement: ast.stmt) -> bool:
+    """Returns whether a parsed statement is on lines of its own, except for comments."""
+    assert statement.end_lineno is not None and statement.end_col_offset is not None
+    if _prefix(lines[statement.lineno - 1], statement.col_offset).strip():
+        return False
+    rest = lines[statement.end_lineno - 1].encode("utf-8")[statement.end_col_offset :]
+    rest = rest.strip()
+    return not rest or rest.startswith(b"#")
+
+
+def _prefix(line: str, col_offset: int) -> str:
+    """Returns the part of a line before a column, given as an offset in bytes."""
+    if line.isascii():
+        return line[:col_offset]
+    return line.encode("utf-8")[:col_offset].decode("utf-8", "replace")
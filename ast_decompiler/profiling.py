@@ -0,0 +1,200 @@
+"""
+
+Profiling of the time spent rendering each type of node.
+
+"""
+
+import ast
+import inspect
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class Stats:
+    """Statistics for one node type or method."""
+
+    __slots__ = ("count", "inclusive_time", "exclusive_time", "bytes_written")
+
+    def __init__(self) -> None:
+        self.count = 0
+        # time from the start to the end of a call, including child nodes
+        self.inclusive_time = 0.0
+        # time spent in the code of the call itself, excluding child nodes and profiled methods
+        self.exclusive_time = 0.0
+        # number of characters written, including child nodes
+        self.bytes_written = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "inclusive_time": self.inclusive_time,
+            "exclusive_time": self.exclusive_time,
+            "bytes_written": self.bytes_written,
+        }
+
+
+# Entries that a call is recorded in: pairs of a table and a key in it.
+_Names = Sequence[Tuple[Dict[str, Stats], str]]
+
+
+class Profile:
+    """Profile of a Decompiler, which records Stats per node type and per method.
+
+    Visit methods are recorded both under the type of the node and under the name of the
+    method. Other methods of the Decompiler can be profiled too, and are recorded under
+    their name. Line breaks and indentation inserted when laying out expressions over
+    multiple lines are not included in the number of characters written. Renderings reused
+    from the render cache are included in the characters written by the node type, but not in
+    its count or time.
+
+    """
+
+    def __init__(self) -> None:
+        self.node_types: Dict[str, Stats] = {}
+        self.methods: Dict[str, Stats] = {}
+        # number of characters written so far
+        self.bytes_written = 0
+        # time spent in profiled calls nested in each call that is currently running
+        self._nested_times: List[float] = []
+
+    def as_dict(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        return {
+            "node_types": {
+                name: stats.as_dict() for name, stats in self.node_types.items()
+            },
+            "methods": {name: stats.as_dict() for name, stats in self.methods.items()},
+        }
+
+    def report(self, limit: Optional[int] = None) -> str:
+        """Returns a plain-text report, with the entries that took longest first."""
+        lines = []
+        for title, table in (("node type", self.node_types), ("method", self.methods)):
+            lines.append(
+                f"{title:<32}{'count':>10}{'inclusive':>12}{'exclusive':>12}{'bytes':>12}"
+            )
+            entries = sorted(
+                table.items(), key=lambda item: item[1].exclusive_time, reverse=True
+            )
+            for name, stats in entries[:limit]:
+                lines.append(
+                    f"{name:<32}{stats.count:>10}{stats.inclusive_time:>12.6f}"
+                    f"{stats.exclusive_time:>12.6f}{stats.bytes_written:>12}"
+                )
+            lines.append("")
+        return "\n".join(lines)
+
+    def wrap_write(self, write: Callable[[str], None]) -> Callable[[str], None]:
+        def profiled_write(code: str) -> None:
+            self.bytes_written += len(code)
+            write(code)
+
+        return profiled_write
+
+    def record_cached(self, node: ast.AST, width: int) -> None:
+        """Records the characters written by reusing the cached rendering of a node."""
+        self.bytes_written += width
+        name = node.__class__.__name__
+        try:
+            stats = self.node_types[name]
+        except KeyError:
+            stats = self.node_types[name] = Stats()
+        stats.bytes_written += width
+
+    def wrap_visitor(self, visitor: Callable[[Any, ast.AST], Any]) -> Any:
+        """Wraps a visit method taking the Decompiler and the node."""
+        method_name = visitor.__name__
+
+        def profiled_visitor(decompiler: Any, node: ast.AST) -> Any:
+            names: _Names = [
+                (self.node_types, node.__class__.__name__),
+                (self.methods, method_name),
+            ]
+            return self._run(lambda: visitor(decompiler, node), names)
+
+        return profiled_visitor
+
+    def wrap_method(self, method: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps a bound method, which may return None or an iterator of child nodes."""
+        names: _Names = [(self.methods, method.__name__)]
+        if inspect.isgeneratorfunction(method):
+
+            def profiled_generator(*args: Any, **kwargs: Any) -> Any:
+                return self._run(lambda: method(*args, **kwargs), names)
+
+            return profiled_generator
+
+        def profiled_method(*args: Any, **kwargs: Any) -> Any:
+            start = perf_counter()
+            start_bytes = self.bytes_written
+            self._nested_times.append(0.0)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                exclusive_time = self._end_segment(start)
+                self._record(names, start, exclusive_time, start_bytes)
+
+        return profiled_method
+
+    def _run(self, call: Callable[[], Any], names: _Names) -> Any:
+        start = perf_counter()
+        start_bytes = self.bytes_written
+        self._nested_times.append(0.0)
+        try:
+            children = call()
+        finally:
+            exclusive_time = self._end_segment(start)
+        if children is None:
+            self._record(names, start, exclusive_time, start_bytes)
+            return None
+        return self._profile_children(
+            children, names, start, exclusive_time, start_bytes
+        )
+
+    def _profile_children(
+        self,
+        children: Iterator[ast.AST],
+        names: _Names,
+        start: float,
+        exclusive_time: float,
+        start_bytes: int,
+    ) -> Iterator[ast.AST]:
+        try:
+            while True:
+                segment_start = perf_counter()
+                self._nested_times.append(0.0)
+                try:
+                    child = next(children, None)
+                finally:
+                    exclusive_time += self._end_segment(segment_start)
+                if child is None:
+                    break
+                # child nodes are rendered while the generator is suspended here
+                yield child
+        finally:
+            children_close = getattr(children, "close", None)
+            if children_close is not None:
+                children_close()
+            self._record(names, start, exclusive_time, start_bytes)
+
+    def _end_segment(self, start: float) -> float:
+        """Ends a period of running code, returning the time not spent in nested calls."""
+        elapsed = perf_counter() - start
+        nested_time = self._nested_times.pop()
+        if self._nested_times:
+            self._nested_times[-1] += elapsed
+        return elapsed - nested_time
+
+    def _record(
+        self, names: _Names, start: float, exclusive_time: float, start_bytes: int
+    ) -> None:
+        inclusive_time = perf_counter() - start
+        bytes_written = self.bytes_written - start_bytes
+        for table, name in names:
+            try:
+                stats = table[name]
+            except KeyError:
+                stats = table[name] = Stats()
+            stats.count += 1
+            stats.inclusive_time += inclusive_time
+            stats.exclusive_time += exclusive_time
+            stats.bytes_written += bytes_written
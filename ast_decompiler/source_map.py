@@ -0,0 +1,300 @@
+"""
+
+Recording where the code for each node ends up in the decompiled code.
+
+"""
+
+import ast
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+import sys
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+# Nodes whose parentheses are part of their own syntax, and so part of their position when
+# parsed.
+if sys.version_info >= (3, 10):
+    _BRACKETED_TYPES = frozenset({ast.Tuple, ast.GeneratorExp, ast.MatchSequence})
+else:
+    _BRACKETED_TYPES = frozenset({ast.Tuple, ast.GeneratorExp})
+_DEFINITION_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class Position(NamedTuple):
+    """Where the code for a node is in the decompiled code.
+
+    Lines are numbered from 1. Columns and offsets are counted in characters, and the end
+    position is just past the last character of the node.
+
+    """
+
+    node: ast.AST
+    start_line: int
+    start_column: int
+    start_offset: int
+    end_line: int
+    end_column: int
+    end_offset: int
+
+
+class SourceMap:
+    """Positions of the code for each node rendered by the decompiler.
+
+    The positions are stored column by column in arrays, with a row for each rendering of a
+    node in the order the renderings start. A node that occurs more than once in the tree has
+    a row for each time it was rendered. Positions follow the conventions of the ast module:
+    they exclude parentheses added around an expression, and a decorated definition starts at
+    its def or class keyword. The parts of f-strings are the exception, because the positions
+    that the parser gives them differ between versions of Python.
+
+    """
+
+    __slots__ = (
+        "code",
+        "nodes",
+        "start_lines",
+        "start_columns",
+        "start_offsets",
+        "end_lines",
+        "end_columns",
+        "end_offsets",
+        "_rows",
+    )
+
+    def __init__(self, code: str) -> None:
+        self.code = code
+        self.nodes: List[ast.AST] = []
+        self.start_lines = array("l")
+        self.start_columns = array("l")
+        self.start_offsets = array("l")
+        self.end_lines = array("l")
+        self.end_columns = array("l")
+        self.end_offsets = array("l")
+        # row of the last rendering of each node, built when first needed
+        self._rows: Optional[Dict[ast.AST, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __getitem__(self, row: int) -> Position:
+        return Position(
+            self.nodes[row],
+            self.start_lines[row],
+            self.start_columns[row],
+            self.start_offsets[row],
+            self.end_lines[row],
+            self.end_columns[row],
+            self.end_offsets[row],
+        )
+
+    def __iter__(self) -> Iterator[Position]:
+        for row in range(len(self.nodes)):
+            yield self[row]
+
+    def find(self, node: ast.AST) -> Optional[Position]:
+        """Returns the position of the last rendering of a node, or None if it was not rendered."""
+        if self._rows is None:
+            self._rows = {node: row for row, node in enumerate(self.nodes)}
+        row = self._rows.get(node)
+        return None if row is None else self[row]
+
+    def apply(self) -> None:
+        """Sets lineno, col_offset, end_lineno and end_col_offset on the rendered nodes.
+
+        As in trees produced by ast.parse(), columns are set as offsets in bytes of the line
+        encoded as UTF-8. Nodes that have no position attributes are left alone.
+
+        """
+        code = self.code
+        line_starts = _line_starts(code)
+        for row, node in enumerate(self.nodes):
+            if "lineno" not in node._attributes:
+                continue
+            start_line = self.start_lines[row]
+            end_line = self.end_lines[row]
+            start_column = _byte_column(
+                code, line_starts[start_line - 1], self.start_offsets[row]
+            )
+            end_column = _byte_column(
+                code, line_starts[end_line - 1], self.end_offsets[row]
+            )
+            setattr(node, "lineno", start_line)
+            setattr(node, "col_offset", start_column)
+            setattr(node, "end_lineno", end_line)
+            setattr(node, "end_col_offset", end_column)
+
+
+# Marks the end of the node that started last, in the events of a SourceMapRecorder and in
+# documents. The start of a node is marked by the node itself.
+END = object()
+
+
+class SourceMapRecorder:
+    """Records the fragments of the output buffer that the code for each node spans.
+
+    Documents are laid out only after they are rendered, so the start and end of a node
+    rendered into a document are marked in the document, and recorded when it is written out.
+
+    """
+
+    def __init__(self, fragments: List[str]) -> None:
+        self.fragments = fragments
+        # pairs of a node starting or END, and the number of fragments written before it
+        self.events: List[Any] = []
+
+    def wrap_visitor(self, visitor: Callable[..., Any]) -> Callable[..., Any]:
+        fragments = self.fragments
+        append = self.events.append
+
+        def recording_visitor(decompiler: Any, node: ast.AST) -> Any:
+            doc = decompiler.doc
+            if doc is None:
+                append(node)
+                append(len(fragments))
+            else:
+                doc.append(node)
+            children = visitor(decompiler, node)
+            if children is not None:
+                return record_children(doc, children)
+            if doc is None:
+                append(END)
+                append(len(fragments))
+            else:
+                doc.append(END)
+            return None
+
+        def record_children(
+            doc: Optional[List[Any]], children: Iterator[ast.AST]
+        ) -> Iterator[ast.AST]:
+            yield from children
+            if doc is None:
+                append(END)
+                append(len(fragments))
+            else:
+                doc.append(END)
+
+        return recording_visitor
+
+    def resolve(self, marker: Any) -> None:
+        """Records a marker from a document at the current end of the output buffer."""
+        self.events.append(marker)
+        self.events.append(len(self.fragments))
+
+    def build(self) -> SourceMap:
+        fragments = self.fragments
+        events = self.events
+        # positions in events of the start of each node, and of its end
+        start_events = [
+            position
+            for position in range(0, len(events), 2)
+            if events[position] is not END
+        ]
+        nodes: List[ast.AST] = [events[position] for position in start_events]
+        end_events = [0] * len(nodes)
+        open_rows: List[int] = []
+        push = open_rows.append
+        pop = open_rows.pop
+        row = 0
+        for position in range(0, len(events), 2):
+            if events[position] is END:
+                end_events[pop()] = position
+            else:
+                push(row)
+                row += 1
+        # index of the first fragment of each node, and of the fragment after its last one
+        starts = [events[position + 1] for position in start_events]
+        ends = [events[position + 1] for position in end_events]
+
+        code = "".join(fragments)
+        offsets = list(accumulate(map(len, fragments), initial=0))
+        # so that the fragment at the start of a node that is empty at the end can be read
+        fragments = fragments + [""]
+        start_offsets = []
+        end_offsets = []
+        for row, node in enumerate(nodes):
+            start = starts[row]
+            end = ends[row]
+            if fragments[start] == "(" and node.__class__ not in _BRACKETED_TYPES:
+                # parentheses that the node wrote around itself, including those of an
+                # expression list broken over multiple lines
+                end_event = end_events[row]
+                if end_event == start_events[row] + 2:
+                    first_child_start = end
+                    last_child_end = start
+                else:
+                    first_child_start = starts[row + 1]
+                    last_child_end = events[end_event - 1]
+                while (
+                    start < first_child_start
+                    and end > last_child_end
+                    and fragments[start] == "("
+                    and fragments[end - 1] == ")"
+                ):
+                    start += 1
+                    end -= 1
+            start_offset = offsets[start]
+            end_offset = offsets[end]
+            if isinstance(node, _DEFINITION_TYPES) and node.decorator_list:
+                # the position of a definition starts after its decorators
+                decorator = node.decorator_list[-1]
+                decorator_row = row + 1
+                while nodes[decorator_row] is not decorator:
+                    decorator_row += 1
+                start_offset = code.index("\n", offsets[ends[decorator_row]])
+            # skip the blank lines and indentation before a statement and the newline after it
+            while start_offset < end_offset and code[start_offset] in " \n":
+                start_offset += 1
+            while end_offset > start_offset and code[end_offset - 1] in " \n":
+                end_offset -= 1
+            if node.__class__ is ast.GeneratorExp and fragments[start] != "(":
+                # the only argument of a call, whose parentheses it includes
+                start_offset = code.rindex("(", 0, start_offset)
+                end_offset = code.index(")", end_offset) + 1
+            start_offsets.append(start_offset)
+            end_offsets.append(end_offset)
+
+        line_starts = _line_starts(code)
+        start_lines = [bisect_left(line_starts, offset + 1) for offset in start_offsets]
+        # the line of the last character, or of the start for an empty node
+        end_lines = [
+            bisect_left(
+                line_starts, end_offset if end_offset > start_offset else end_offset + 1
+            )
+            for start_offset, end_offset in zip(start_offsets, end_offsets)
+        ]
+        source_map = SourceMap(code)
+        source_map.nodes = nodes
+        source_map.start_lines = array("l", start_lines)
+        source_map.start_columns = array(
+            "l",
+            [
+                offset - line_starts[line - 1]
+                for offset, line in zip(start_offsets, start_lines)
+            ],
+        )
+        source_map.start_offsets = array("l", start_offsets)
+        source_map.end_lines = array("l", end_lines)
+        source_map.end_columns = array(
+            "l",
+            [
+                offset - line_starts[line - 1]
+                for offset, line in zip(end_offsets, end_lines)
+            ],
+        )
+        source_map.end_offsets = array("l", end_offsets)
+        return source_map
+
+
+def _line_starts(code: str) -> List[int]:
+    """Returns the offset of the start of each line."""
+    starts = [0]
+    index = code.find("\n")
+    while index != -1:
+        starts.append(index + 1)
+        index = code.find("\n", index + 1)
+    return starts
+
+
+def _byte_column(code: str, line_start: int, offset: int) -> int:
+    text = code[line_start:offset]
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
@@ -0,0 +1,398 @@
+"""
+
+Verifies that source trees round-trip through the decompiler.
+
+    python -m ast_decompiler.verify [options] path ...
+
+Each file is parsed, decompiled and parsed again, and the two trees are compared with
+find_difference(). Files are processed in a pool of worker processes, each file with a time limit.
+Failures are reported with the smallest statement that still fails on its own, and files that
+take much longer to decompile than others of their size are reported as slow.
+
+"""
+
+import argparse
+import ast
+from concurrent.futures import ProcessPoolExecutor
+import json
+import signal
+import statistics
+import sys
+import textwrap
+import threading
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .check import find_difference
+from .decompiler import decompile
+from .files import find_files
+
+# Statuses of a FileReport.
+OK = "ok"
+# the decompiled code does not parse, parses to a different tree, or decompiling raised
+FAILED = "failed"
+# decompiling took longer than the time limit
+TIMEOUT = "timeout"
+# the file could not be read or parsed, so the decompiler was not tested
+SKIPPED = "skipped"
+
+
+class FileReport(NamedTuple):
+    """The result of verifying one file."""
+
+    path: str
+    status: str
+    # description of the failure, or None if the status is OK
+    message: Optional[str]
+    # smallest statement from the file that fails on its own, if one was found
+    snippet: Optional[str]
+    # time spent decompiling the file, in seconds
+    decompile_time: float
+    source_size: int
+
+
+class _Options(NamedTuple):
+    indentation: int
+    line_length: int
+    timeout: Optional[float]
+
+
+class _Timeout(Exception):
+    pass
+
+
+def verify_files(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    timeout: Optional[float] = 60.0,
+    chunksize: int = 16,
+    indentation: int = 4,
+    line_length: int = 100,
+) -> Iterator[FileReport]:
+    """Verifies files in a pool of worker processes, yielding a FileReport for each in order.
+
+    Arguments:
+    - workers: number of worker processes; defaults to the number of CPUs. With a single worker,
+      the files are verified in the current process.
+    - timeout: time limit in seconds for verifying each file, or None for no limit. The limit
+      relies on SIGALRM, so it is not enforced on platforms without it.
+    - chunksize: number of files sent to a worker at a time
+    - the other arguments are the same as for decompile()
+
+    """
+    options = _Options(indentation, line_length, timeout)
+    if workers == 1:
+        for path in paths:
+            yield verify_file(path, options)
+        return
+    paths = list(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            verify_file, paths, [options] * len(paths), chunksize=chunksize
+        )
+
+
+def verify_file(path: str, options: _Options) -> FileReport:
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+        tree = ast.parse(source, filename=path)
+    except Exception as e:
+        # besides files that do not parse, very deeply nested code can raise MemoryError or
+        # RecursionError, which must not end the whole run
+        return FileReport(path, SKIPPED, f"{type(e).__name__}: {e}", None, 0.0, 0)
+
+    start = time.perf_counter()
+    try:
+        with _time_limit(options.timeout):
+            code = decompile(
+                tree, indentation=options.indentation, line_length=options.line_length
+            )
+            decompile_time = time.perf_counter() - start
+            message = _round_trip_error(tree, code)
+    except _Timeout:
+        return FileReport(
+            path,
+            TIMEOUT,
+            f"timed out after {options.timeout} s",
+            None,
+            time.perf_counter() - start,
+            len(source),
+        )
+    except Exception as e:
+        decompile_time = time.perf_counter() - start
+        message = f"{type(e).__name__}: {e}"
+    if message is None:
+        return FileReport(path, OK, None, None, decompile_time, len(source))
+
+    try:
+        with _time_limit(options.timeout):
+            snippet = find_snippet(source.decode("utf-8", "replace"), tree, options)
+    except Exception:
+        # including _Timeout; the failure is still reported without a snippet
+        snippet = None
+    return FileReport(path, FAILED, message, snippet, decompile_time, len(source))
+
+
+def _round_trip_error(tree: ast.AST, code: str) -> Optional[str]:
+    """Returns a description of how the code fails to round-trip, or None if it does."""
+    try:
+        new_tree = ast.parse(code)
+    except SyntaxError as e:
+        return f"decompiled code has a syntax error: {e}"
+    difference = find_difference(tree, new_tree)
+    if difference is None:
+        return None
+    path, old, new = difference
+    return (
+        f"decompiled code differs at {path}: {_short_repr(old)} != {_short_repr(new)}"
+    )
+
+
+def _short_repr(value: object) -> str:
+    if isinstance(value, ast.AST):
+        text = ast.dump(value)
+    else:
+        text = repr(value)
+    return text if len(text) <= 80 else text[:77] + "..."
+
+
+def _failure_kind(statement: ast.stmt, depth: int, options: _Options) -> Optional[str]:
+    """Returns how a statement fails when decompiled on its own, or None if it does not.
+
+    The statement is decompiled at the indentation it has in the whole file, because that
+    changes where lines are broken.
+
+    """
+    module = ast.Module(body=[statement], type_ignores=[])
+    try:
+        code = decompile(
+            module,
+            indentation=options.indentation,
+            line_length=options.line_length,
+            starting_indentation=options.indentation * depth,
+        )
+    except Exception as e:
+        return type(e).__name__
+    # nest the indented code in blocks, so that it parses
+    header = "".join(
+        " " * (options.indentation * level) + "if 1:\n" for level in range(depth)
+    )
+    try:
+        new_body: List[ast.stmt] = ast.parse(header + code).body
+    except SyntaxError:
+        return "SyntaxError"
+    for _ in range(depth):
+        block = new_body[0]
+        assert isinstance(block, ast.If)
+        new_body = block.body
+    if find_difference(module.body, new_body) is not None:
+        return "difference"
+    return None
+
+
+def find_snippet(source: str, tree: ast.Module, options: _Options) -> Optional[str]:
+    """Returns the source of the smallest statement that fails to round-trip on its own.
+
+    Starts from the first failing top-level statement and moves into nested statements as
+    long as one of them fails in the same way.
+
+    """
+    statements: List[Tuple[ast.stmt, int]] = [(statement, 0) for statement in tree.body]
+    failing = None
+    kind = None
+    while True:
+        for statement, depth in statements:
+            statement_kind = _failure_kind(statement, depth, options)
+            if statement_kind is not None and kind in (None, statement_kind):
+                failing = statement
+                kind = statement_kind
+                statements = _child_statements(statement, depth)
+                break
+        else:
+            break
+    if failing is None:
+        return None
+    segment = ast.get_source_segment(source, failing, padded=True)
+    if segment is None:
+        return None
+    return textwrap.dedent(segment) + "\n"
+
+
+def _child_statements(statement: ast.stmt, depth: int) -> List[Tuple[ast.stmt, int]]:
+    """Returns the statements nested in a statement, with their depth of indentation."""
+    children = []
+    stack = [(child, depth + 1) for child in ast.iter_child_nodes(statement)]
+    stack.reverse()
+    while stack:
+        node, child_depth = stack.pop()
+        if isinstance(node, ast.stmt):
+            children.append((node, child_depth))
+            continue
+        if sys.version_info >= (3, 10) and isinstance(node, ast.match_case):
+            # the body of a case is indented below the case
+            child_depth += 1
+        stack.extend(
+            reversed([(child, child_depth) for child in ast.iter_child_nodes(node)])
+        )
+    return children
+
+
+class _time_limit:
+    """Raises _Timeout if the body takes longer than the limit."""
+
+    def __init__(self, seconds: Optional[float]) -> None:
+        # interval timers are not available on Windows, and signals are only delivered to the
+        # main thread
+        self.enabled = (
+            seconds is not None
+            and sys.platform != "win32"
+            and threading.current_thread() is threading.main_thread()
+        )
+        self.seconds = seconds
+
+    def __enter__(self) -> None:
+        if self.enabled:
+            assert self.seconds is not None
+            self.previous_handler = signal.signal(signal.SIGALRM, self._handle)
+            signal.setitimer(signal.ITIMER_REAL, self.seconds)
+
+    def __exit__(self, *args: object) -> None:
+        if self.enabled:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous_handler)
+
+    def _handle(self, signum: int, frame: object) -> None:
+        raise _Timeout
+
+
+def find_slow(
+    reports: Sequence[FileReport], factor: float = 10.0, min_time: float = 0.1
+) -> List[FileReport]:
+    """Returns the reports for files that took much longer to decompile than their size suggests.
+
+    A file is slow if it took at least min_time seconds, and its time per byte of source is
+    more than factor times the median over all files. Timeouts are always included.
+
+    """
+    rates = [
+        report.decompile_time / report.source_size
+        for report in reports
+        if report.status in (OK, FAILED) and report.source_size
+    ]
+    median_rate = statistics.median(rates) if rates else 0.0
+    return [
+        report
+        for report in reports
+        if report.status == TIMEOUT
+        or (
+            report.status in (OK, FAILED)
+            and report.decompile_time >= min_time
+            and report.decompile_time > factor * median_rate * report.source_size
+        )
+    ]
+
+
+def _parse_shard(value: str) -> Tuple[int, int]:
+    index, _, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {value!r}")
+    if not 0 <= shard[0] < shard[1]:
+        raise argparse.ArgumentTypeError(f"shard index out of range: {value!r}")
+    return shard
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m ast_decompiler.verify",
+        description=(
+            "Check that Python files round-trip through the decompiler, and report failures"
+            " and files that are slow to decompile."
+        ),
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="files, directories (searched for .py files), or globs"
+    )
+    parser.add_argument("--line-length", type=int, default=100)
+    parser.add_argument("--indentation", type=int, default=4)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60.0,
+        help="time limit for each file in seconds (default: 60)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_parse_shard,
+        help="only verify every COUNT-th file, starting at INDEX, given as INDEX/COUNT",
+    )
+    parser.add_argument(
+        "--slow-factor",
+        type=float,
+        default=10.0,
+        help=(
+            "report files whose time per byte is more than this many times the median"
+            " (default: 10)"
+        ),
+    )
+    parser.add_argument(
+        "--report", help="file to write a JSON line for each file verified to"
+    )
+    args = parser.parse_args(argv)
+
+    paths = list(find_files(args.paths))
+    if args.shard is not None:
+        index, count = args.shard
+        paths = paths[index::count]
+
+    start = time.perf_counter()
+    reports = []
+    report_file = (
+        open(args.report, "w", encoding="utf-8") if args.report is not None else None
+    )
+    try:
+        for report in verify_files(
+            paths,
+            workers=args.jobs,
+            timeout=args.timeout,
+            indentation=args.indentation,
+            line_length=args.line_length,
+        ):
+            reports.append(report)
+            if report_file is not None:
+                report_file.write(json.dumps(report._asdict()) + "\n")
+            if report.status in (FAILED, TIMEOUT):
+                print(f"{report.path}: {report.status}: {report.message}")
+                if report.snippet is not None:
+                    print(textwrap.indent(report.snippet, "    "), end="")
+    finally:
+        if report_file is not None:
+            report_file.close()
+    elapsed = time.perf_counter() - start
+
+    slow = find_slow(reports, factor=args.slow_factor)
+    for report in slow:
+        print(f"{report.path}: slow: {report.decompile_time:.3f} s")
+    counts = {
+        status: sum(report.status == status for report in reports)
+        for status in (OK, FAILED, TIMEOUT, SKIPPED)
+    }
+    print(
+        f"{len(reports)} files in {elapsed:.2f} s: {counts[OK]} ok, {counts[FAILED]} failed,"
+        f" {counts[TIMEOUT]} timed out, {counts[SKIPPED]} skipped, {len(slow)} slow",
+        file=sys.stderr,
+    )
+    return 1 if counts[FAILED] or counts[TIMEOUT] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""
+
+Benchmarks for ast_decompiler. Run them with:
+
+    python -m benchmarks [--corpus NAME] [--line-length N] [--repeat N] [--size N]
+        [--baseline DIR]
+
+"""
@@ -0,0 +1,155 @@
+"""
+
+Times decompile() and ast.unparse() on the corpora and prints a table.
+
+For each corpus and line length, reports the best time over the repetitions, the throughput in
+nodes and bytes of output per second, and the peak memory allocated during one run. The
+renderers take turns in each repetition, so that changes in the load of the machine affect them
+all alike.
+
+With --baseline, another version of ast_decompiler is timed alongside this one, for example a
+checkout of an earlier commit made with "git worktree add /tmp/baseline <commit>".
+
+"""
+
+import argparse
+import ast
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from ast_decompiler import decompile
+
+from .corpora import CORPORA, Corpus, count_nodes
+
+_Renderer = Callable[[ast.AST], str]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        choices=sorted(CORPORA),
+        help="corpus to run (default: all)",
+    )
+    parser.add_argument(
+        "--line-length",
+        action="append",
+        type=int,
+        help="line length to decompile with (default: 40, 100 and 1000)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--size", type=int, default=1, help="size factor for the corpora"
+    )
+    parser.add_argument(
+        "--baseline",
+        help="directory containing another version of the ast_decompiler package to compare with",
+    )
+    args = parser.parse_args(argv)
+
+    corpus_names = args.corpus or list(CORPORA)
+    line_lengths = args.line_length or [40, 100, 1000]
+    versions = [("decompile", decompile)]
+    if args.baseline is not None:
+        versions.append(("baseline", _load_baseline(args.baseline).decompile))
+    print(
+        f"{'corpus':<16}{'renderer':<20}{'time (s)':>10}{'nodes/s':>12}{'MB/s':>8}"
+        f"{'peak MB':>9}"
+    )
+    for corpus_name in corpus_names:
+        corpus = CORPORA[corpus_name](args.size)
+        num_nodes = sum(count_nodes(tree) for _, tree in corpus)
+        renderers: List[Tuple[str, _Renderer]] = [
+            (
+                f"{version_name}({line_length})",
+                lambda tree, render=render, line_length=line_length: render(
+                    tree, line_length=line_length
+                ),
+            )
+            for line_length in line_lengths
+            for version_name, render in versions
+        ]
+        renderers.append(("ast.unparse", ast.unparse))
+        results = _run(corpus, dict(renderers), args.repeat)
+        for renderer_name, _ in renderers:
+            result = results[renderer_name]
+            if result is None:
+                print(f"{corpus_name:<16}{renderer_name:<20}{'failed':>10}")
+                continue
+            elapsed, output_size, peak_memory = result
+            print(
+                f"{corpus_name:<16}{renderer_name:<20}{elapsed:>10.4f}"
+                f"{num_nodes / elapsed:>12.0f}{output_size / 1e6 / elapsed:>8.2f}"
+                f"{peak_memory / 1e6:>9.2f}"
+            )
+
+
+def _load_baseline(directory: str) -> ModuleType:
+    """Imports the ast_decompiler package in the directory under another name."""
+    package_dir = os.path.join(directory, "ast_decompiler")
+    name = "baseline_ast_decompiler"
+    spec = importlib.util.spec_from_file_location(
+        name,
+        os.path.join(package_dir, "__init__.py"),
+        submodule_search_locations=[package_dir],
+    )
+    if spec is None or spec.loader is None:
+        raise SystemExit(f"no ast_decompiler package in {directory}")
+    module = importlib.util.module_from_spec(spec)
+    # relative imports in the package look it up here
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _run(
+    corpus: Corpus, renderers: Dict[str, _Renderer], repeat: int
+) -> Dict[str, Optional[Tuple[float, int, int]]]:
+    """Returns the best time, the size of the output and the peak memory for each renderer.
+
+    The result is None for a renderer that fails, as ast.unparse() does on very deep trees.
+
+    """
+    best = dict.fromkeys(renderers, float("inf"))
+    output_sizes = dict.fromkeys(renderers, 0)
+    failed = set()
+    for _ in range(repeat):
+        for name, renderer in renderers.items():
+            if name in failed:
+                continue
+            output_size = 0
+            start = time.perf_counter()
+            try:
+                for _, tree in corpus:
+                    output_size += len(renderer(tree).encode("utf-8"))
+            except RecursionError:
+                failed.add(name)
+                continue
+            best[name] = min(best[name], time.perf_counter() - start)
+            output_sizes[name] = output_size
+
+    results: Dict[str, Optional[Tuple[float, int, int]]] = {}
+    for name, renderer in renderers.items():
+        if name in failed:
+            results[name] = None
+            continue
+        # measured separately, because tracing allocations slows everything down
+        tracemalloc.start()
+        try:
+            for _, tree in corpus:
+                renderer(tree)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results[name] = (best[name], output_sizes[name], peak_memory)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+
+Inputs for the benchmarks.
+
+Each corpus is a function taking a size factor and returning a list of (name, tree) pairs.
+
+"""
+
+import ast
+import glob
+import os
+from typing import Callable, Dict, List, Tuple
+
+Corpus = List[Tuple[str, ast.Module]]
+
+
+def stdlib(size: int = 1) -> Corpus:
+    """Modules from the standard library."""
+    directory = os.path.dirname(ast.__file__)
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py")))[: 40 * size]:
+        with open(path, "rb") as f:
+            source = f.read()
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            continue
+        corpus.append((os.path.basename(path), tree))
+    return corpus
+
+
+def wide_literals(size: int = 1) -> Corpus:
+    """Long list, dict and call displays that are broken over many lines."""
+    num_items = 5000 * size
+    items = ", ".join(f"item_{i}" for i in range(num_items))
+    pairs = ", ".join(f"'key_{i}': {i}" for i in range(num_items))
+    return [
+        ("list", ast.parse(f"x = [{items}]")),
+        ("dict", ast.parse(f"x = {{{pairs}}}")),
+        ("call", ast.parse(f"f({items})")),
+    ]
+
+
+def deep_nesting(size: int = 1) -> Corpus:
+    """Lists, calls, dicts and comprehensions nested inside each other.
+
+    The trees are built directly, because the parser limits the nesting depth.
+
+    """
+    depth = 100 * size
+    trees = {}
+
+    node: ast.expr = ast.Name(id="x", ctx=ast.Load())
+    for i in range(depth):
+        node = ast.List(
+            elts=[ast.Name(id=f"a{i}", ctx=ast.Load()), node], ctx=ast.Load()
+        )
+    trees["lists"] = node
+
+    node = ast.Name(id="x", ctx=ast.Load())
+    for i in range(depth):
+        node = ast.Call(
+            func=ast.Name(id=f"f{i}", ctx=ast.Load()),
+            args=[node, ast.Constant(value=i)],
+            keywords=[],
+        )
+    trees["calls"] = node
+
+    node = ast.Name(id="x", ctx=ast.Load())
+    for i in range(depth):
+        node = ast.Dict(keys=[ast.Constant(value=f"k{i}")], values=[node])
+    trees["dicts"] = node
+
+    node = ast.Name(id="x", ctx=ast.Load())
+    for i in range(depth):
+        node = ast.ListComp(
+            elt=node,
+            generators=[
+                ast.comprehension(
+                    target=ast.Name(id=f"y{i}", ctx=ast.Store()),
+                    iter=ast.Name(id=f"ys{i}", ctx=ast.Load()),
+                    ifs=[],
+                    is_async=0,
+                )
+            ],
+        )
+    trees["comprehensions"] = node
+
+    return [
+        (
+            name,
+            ast.fix_missing_locations(
+                ast.Module(
+                    body=[
+                        ast.Assign(
+                            targets=[ast.Name(id="result", ctx=ast.Store())],
+                            value=value,
+                            lineno=1,
+                        )
+                    ],
+                    type_ignores=[],
+                )
+            ),
+        )
+        for name, value in trees.items()
+    ]
+
+
+def shallow(size: int = 1) -> Corpus:
+    """Short statements with calls, attributes and operators, as in most hand-written code.
+
+    The trees are shallow and every line fits, so this measures the cost of each node rather
+    than of the layout.
+
+    """
+    lines = []
+    for i in range(1000 * size):
+        lines.append(f"def handler_{i}(request, *, timeout=None):")
+        lines.append(f"    user = request.session.get('user_{i}')")
+        lines.append(f"    if not user or user.id != {i}:")
+        lines.append("        raise PermissionError(user)")
+        lines.append(f"    result = process(user, data[{i}], key=str(user.id) + 'x')")
+        lines.append("    return format(result.value * 2, width=len(result.name))")
+    return [("shallow", ast.parse("\n".join(lines)))]
+
+
+def long_module(size: int = 1) -> Corpus:
+    """A generated module with many top-level statements."""
+    lines = []
+    for i in range(2000 * size):
+        lines.append(f"def function_{i}(a, b=1, *args, **kwargs):")
+        lines.append(f"    return a + b * {i}")
+        lines.append(f"CONSTANT_{i} = function_{i}({i}, b=[{i}, {i + 1}])")
+    return [("long_module", ast.parse("\n".join(lines)))]
+
+
+def fstrings(size: int = 1) -> Corpus:
+    """Many f-strings with conversions and format specs."""
+    lines = [
+        f"x{i} = f'value {{a{i}!r}} of {{b{i}:>10}} and {{c{i}.d[{i}]:{{width}}}} in {i}'"
+        for i in range(3000 * size)
+    ]
+    return [("fstrings", ast.parse("\n".join(lines)))]
+
+
+def match_statements(size: int = 1) -> Corpus:
+    """Match statements with many kinds of patterns."""
+    cases = [
+        "    case [1, 2, *rest]: pass",
+        "    case {'key': value, **others}: pass",
+        "    case Point(x=0, y=yy) | Point(x=yy, y=0): pass",
+        "    case str() as s if s: pass",
+        "    case (a, b, c): pass",
+        "    case None: pass",
+        "    case _: pass",
+    ]
+    statements = [f"match subject_{i}:\n" + "\n".join(cases) for i in range(500 * size)]
+    return [("match", ast.parse("\n".join(statements)))]
+
+
+CORPORA: Dict[str, Callable[[int], Corpus]] = {
+    "stdlib": stdlib,
+    "wide_literals": wide_literals,
+    "deep_nesting": deep_nesting,
+    "shallow": shallow,
+    "long_module": long_module,
+    "fstrings": fstrings,
+    "match": match_statements,
+}
+
+
+def count_nodes(tree: ast.AST) -> int:
+    # ast.walk() keeps its own queue, so this works for deep trees
+    return sum(1 for _ in ast.walk(tree))
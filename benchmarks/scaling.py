@@ -0,0 +1,184 @@
+"""
+
+Checks how the running time of decompile() grows with the size of its input.
+
+Each family generates trees from a size parameter. The decompiler is timed at a series of sizes
+and a power law t = c * size ** k is fitted to the timings; k close to 1 means linear growth,
+while quadratic and exponential blowups give values of 2 and more. Run with:
+
+    python -m benchmarks.scaling [--family NAME] [--max-exponent K]
+
+"""
+
+import argparse
+import ast
+import math
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from ast_decompiler import decompile
+
+
+class Family(NamedTuple):
+    # builds the tree to decompile for a given size
+    make_tree: Callable[[int], ast.AST]
+    # sizes to time; each should be about twice the previous one
+    sizes: Sequence[int]
+    # line length to decompile with, if it depends on the size
+    line_length: Optional[Callable[[int], int]] = None
+
+
+def _name(id: str) -> ast.Name:
+    return ast.Name(id=id, ctx=ast.Load())
+
+
+def _expression(node: ast.expr) -> ast.Module:
+    return ast.Module(body=[ast.Expr(value=node)], type_ignores=[])
+
+
+def nested_lists(depth: int) -> ast.AST:
+    node: ast.expr = _name("x")
+    for i in range(depth):
+        node = ast.List(elts=[_name(f"a{i}"), node, _name(f"b{i}")], ctx=ast.Load())
+    return _expression(node)
+
+
+def nested_calls(depth: int) -> ast.AST:
+    node: ast.expr = _name("x")
+    for i in range(depth):
+        node = ast.Call(func=_name(f"f{i}"), args=[node, _name("y")], keywords=[])
+    return _expression(node)
+
+
+def nested_dicts(depth: int) -> ast.AST:
+    node: ast.expr = _name("x")
+    for i in range(depth):
+        node = ast.Dict(keys=[ast.Constant(value=f"key{i}")], values=[node])
+    return _expression(node)
+
+
+def nested_comprehensions(depth: int) -> ast.AST:
+    node: ast.expr = _name("x")
+    for i in range(depth):
+        generator = ast.comprehension(
+            target=ast.Name(id=f"y{i}", ctx=ast.Store()),
+            iter=_name(f"ys{i}"),
+            ifs=[],
+            is_async=0,
+        )
+        node = ast.ListComp(elt=node, generators=[generator])
+    return _expression(node)
+
+
+def wide_list(width: int) -> ast.AST:
+    return _expression(
+        ast.List(elts=[_name(f"item{i}") for i in range(width)], ctx=ast.Load())
+    )
+
+
+def many_strings(count: int) -> ast.AST:
+    # strings nested inside a call, so that each one is rendered at some depth
+    strings: List[ast.expr] = [ast.Constant(value=f"string {i}") for i in range(count)]
+    node = ast.Call(
+        func=_name("f"), args=[ast.List(elts=strings, ctx=ast.Load())], keywords=[]
+    )
+    return _expression(node)
+
+
+def many_statements(count: int) -> ast.AST:
+    return ast.parse("\n".join(f"x{i} = f(a, [b, {i}])" for i in range(count)))
+
+
+def binop_chain(length: int) -> ast.AST:
+    node: ast.expr = _name("x")
+    for i in range(length):
+        node = ast.BinOp(left=node, op=ast.Add(), right=_name(f"y{i}"))
+    return _expression(node)
+
+
+FAMILIES: Dict[str, Family] = {
+    "nested_lists": Family(nested_lists, [50, 100, 200, 400]),
+    "nested_calls": Family(nested_calls, [50, 100, 200, 400]),
+    "nested_dicts": Family(nested_dicts, [50, 100, 200, 400]),
+    "nested_comprehensions": Family(nested_comprehensions, [50, 100, 200, 400]),
+    "wide_list": Family(wide_list, [1000, 2000, 4000, 8000]),
+    # narrow lines break the nested lists at every level
+    "narrow_lines": Family(
+        nested_lists, [50, 100, 200, 400], line_length=lambda size: 20
+    ),
+    # long lines keep everything on one line
+    "long_lines": Family(
+        nested_lists, [50, 100, 200, 400], line_length=lambda size: 100 * size
+    ),
+    "many_strings": Family(many_strings, [1000, 2000, 4000, 8000]),
+    "many_statements": Family(many_statements, [250, 500, 1000, 2000]),
+    "binop_chain": Family(binop_chain, [1000, 2000, 4000, 8000]),
+}
+
+
+def time_decompile(tree: ast.AST, line_length: int, repeat: int) -> float:
+    return time_call(lambda: decompile(tree, line_length=line_length), repeat)
+
+
+def time_call(call: Callable[[], object], repeat: int) -> float:
+    best = math.inf
+    for _ in range(repeat):
+        start = time.process_time()
+        call()
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def growth_exponent(
+    family: Family,
+    repeat: int = 3,
+    function: Optional[Callable[[ast.AST], object]] = None,
+) -> float:
+    """Returns the exponent k of the power law t = c * size ** k fitted to the timings.
+
+    If function is given, it is timed on the trees instead of decompile().
+
+    """
+    xs = []
+    ys = []
+    for size in family.sizes:
+        tree = family.make_tree(size)
+        if function is None:
+            line_length = family.line_length(size) if family.line_length else 40
+            elapsed = time_decompile(tree, line_length, repeat)
+        else:
+            elapsed = time_call(lambda: function(tree), repeat)
+        xs.append(math.log(size))
+        ys.append(math.log(max(elapsed, 1e-6)))
+    # least-squares slope of log(time) against log(size)
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return covariance / variance
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.scaling")
+    parser.add_argument("--family", action="append", choices=sorted(FAMILIES))
+    parser.add_argument(
+        "--max-exponent",
+        type=float,
+        default=1.4,
+        help="fail if the running time of a family grows faster than size ** K",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for name in args.family or FAMILIES:
+        exponent = growth_exponent(FAMILIES[name], repeat=args.repeat)
+        ok = exponent <= args.max_exponent
+        failed = failed or not ok
+        print(f"{name:<24}{exponent:>6.2f}{'' if ok else '  super-linear'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
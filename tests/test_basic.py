@@ -1,5 +1,18 @@
 import ast
-from ast_decompiler import decompile
+import codecs
+import gzip
+import io
+import lzma
+from pathlib import Path
+import socket
+import tempfile
+import tracemalloc
+from typing import Any, List
+
+import pytest
+
+from ast_decompiler import decompile, decompile_iter, decompile_to
+from ast_decompiler.decompiler import Decompiler
 from .tests import assert_decompiles, check, skip_before
 
 
@@ -450,3 +463,154 @@ def test_files() -> None:
     with open("ast_decompiler/decompiler.py") as f:
         code = f.read()
     check(code)
+
+
+def test_subclass_override() -> None:
+    class UpperDecompiler(Decompiler):
+        def visit_Name(self, node: ast.Name) -> None:
+            self.write(node.id.upper())
+
+    decompiler = UpperDecompiler(indentation=4, line_length=100, starting_indentation=0)
+    assert decompiler.run(ast.parse("f(x)")) == "F(X)\n"
+    assert Decompiler.visitors[ast.Name] is Decompiler.visit_Name
+
+
+def test_new_node_class() -> None:
+    class Name(ast.Name):
+        pass
+
+    class Unknown(ast.expr):
+        pass
+
+    tree = ast.Expression(body=ast.List(elts=[Name(id="x"), Unknown()]))
+    with pytest.raises(NotImplementedError):
+        decompile(tree)
+    assert decompile(ast.Expression(body=Name(id="x"))) == "x"
+
+
+def test_ancestor_counts() -> None:
+    decompiler = Decompiler(indentation=4, line_length=100, starting_indentation=0)
+    assert decompiler.run(ast.parse("f'{[x, \"a\"]}'")) == "f'{[x, \"a\"]}'\n"
+    assert not any(decompiler.ancestor_counts.values())
+
+    # nested f-strings are not supported
+    tree = ast.parse("f'{x}'")
+    statement = tree.body[0]
+    assert isinstance(statement, ast.Expr)
+    assert isinstance(statement.value, ast.JoinedStr)
+    formatted_value = statement.value.values[0]
+    assert isinstance(formatted_value, ast.FormattedValue)
+    formatted_value.value = ast.JoinedStr(values=[])
+    decompiler = Decompiler(indentation=4, line_length=100, starting_indentation=0)
+    with pytest.raises(NotImplementedError):
+        decompiler.run(tree)
+    assert not any(decompiler.ancestor_counts.values())
+    assert not decompiler.node_stack
+
+
+def test_decompile_iter() -> None:
+    code = """
+import os
+x = [
+    aaaaaaaaaa,
+    bbbbbbbbbb,
+]
+
+def f():
+    return x
+"""
+    tree = ast.parse(code)
+    chunks = list(decompile_iter(tree, line_length=20))
+    assert chunks == [
+        "import os\n",
+        "x = [\n    aaaaaaaaaa,\n    bbbbbbbbbb,\n]\n",
+        "\ndef f():\n    return x\n",
+    ]
+    assert "".join(chunks) == decompile(tree, line_length=20)
+    assert list(decompile_iter(ast.parse("a + b", mode="eval"))) == ["a + b"]
+    assert list(decompile_iter(ast.parse(""))) == []
+
+
+def test_decompile_iter_memory() -> None:
+    # each statement has its own strings, so nothing needs to be kept between statements
+    tree = ast.parse("".join(f"x = '{i:0200}'\n" for i in range(2000)))
+    tracemalloc.start()
+    try:
+        for _ in decompile_iter(tree):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 100_000
+
+
+def test_decompile_to() -> None:
+    tree = ast.parse("import os\nx = 'é'\ndef f():\n    return x\n")
+    expected = decompile(tree)
+
+    text = io.StringIO()
+    decompile_to(tree, text)
+    assert text.getvalue() == expected
+
+    binary = io.BytesIO()
+    decompile_to(tree, binary, buffer_size=1)
+    assert binary.getvalue() == expected.encode("utf-8")
+
+    for module in (gzip, lzma):
+        compressed = io.BytesIO()
+        with module.open(compressed, "wb") as f:
+            decompile_to(tree, f)
+        assert module.decompress(compressed.getvalue()) == expected.encode("utf-8")
+
+    left, right = socket.socketpair()
+    with left, right:
+        decompile_to(tree, left, encoding="latin-1")
+        left.shutdown(socket.SHUT_WR)
+        received = b""
+        while data := right.recv(1024):
+            received += data
+    assert received == expected.encode("latin-1")
+
+
+def test_decompile_to_detects_mode(tmp_path: Path) -> None:
+    tree = ast.parse("x = 'é'\n")
+    expected = decompile(tree)
+
+    # text files that are not io.TextIOBase
+    with tempfile.SpooledTemporaryFile(mode="w+", encoding="utf-8") as f:
+        decompile_to(tree, f)
+        f.seek(0)
+        assert f.read() == expected
+    path = tmp_path / "a.py"
+    with codecs.getwriter("utf-8")(path.open("wb")) as f:
+        decompile_to(tree, f)
+    assert path.read_text(encoding="utf-8") == expected
+
+    # binary files that are not io.BufferedIOBase
+    with tempfile.SpooledTemporaryFile(mode="w+b") as f:
+        decompile_to(tree, f)
+        f.seek(0)
+        assert f.read() == expected.encode("utf-8")
+    with tempfile.NamedTemporaryFile(mode="w+b") as f:
+        decompile_to(tree, f)
+        f.seek(0)
+        assert f.read() == expected.encode("utf-8")
+
+    chunks: List[Any] = []
+
+    class Sink:
+        def write(self, data: Any) -> None:
+            chunks.append(data)
+
+    decompile_to(tree, Sink())
+    decompile_to(tree, Sink(), binary=True)
+    assert chunks == [expected, expected.encode("utf-8")]
+
+
+def test_decompile_to_zstd() -> None:
+    zstd = pytest.importorskip("compression.zstd")
+    tree = ast.parse("x = 1\ny = 2\n")
+    compressed = io.BytesIO()
+    with zstd.open(compressed, "wb") as f:
+        decompile_to(tree, f)
+    assert zstd.decompress(compressed.getvalue()) == decompile(tree).encode("utf-8")
@@ -0,0 +1,65 @@
+import ast
+import os
+from pathlib import Path
+
+import pytest
+
+from ast_decompiler import DecompileCache, cache as cache_module, decompile
+
+
+def test_memory() -> None:
+    cache = DecompileCache(maxsize=2)
+    assert decompile(ast.parse("x = 1"), cache=cache) == "x = 1\n"
+    # positions are ignored
+    assert decompile(ast.parse("x  =  (1)"), cache=cache) == "x = 1\n"
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+    # the options are part of the key
+    tree = ast.parse("f(aaaa, bbbb)")
+    assert decompile(tree, cache=cache) == "f(aaaa, bbbb)\n"
+    assert (
+        decompile(tree, line_length=10, cache=cache) == "f(\n    aaaa,\n    bbbb\n)\n"
+    )
+    assert cache.stats.misses == 3
+    assert cache.stats.evictions == 1
+    assert len(cache) == 2
+    assert cache.stats.hit_ratio == 0.25
+
+    # constants of different types are different
+    assert decompile(ast.parse("x = 1.0"), cache=cache) == "x = 1.0\n"
+    assert decompile(ast.parse("x = True"), cache=cache) == "x = True\n"
+    assert cache.stats.misses == 5
+
+
+def test_directory(tmp_path: Path) -> None:
+    directory = str(tmp_path / "cache")
+    tree = ast.parse("import os")
+    cache = DecompileCache(directory=directory)
+    assert cache.decompile(tree) == "import os\n"
+    assert cache.stats.disk_writes == 1
+
+    # another cache, as in another process, finds the entry on disk
+    other_cache = DecompileCache(directory=directory)
+    assert other_cache.decompile(tree) == "import os\n"
+    assert other_cache.decompile(tree) == "import os\n"
+    assert other_cache.stats.as_dict() == {
+        "hits": 1,
+        "disk_hits": 1,
+        "misses": 0,
+        "evictions": 0,
+        "disk_writes": 0,
+        "hit_ratio": 1.0,
+    }
+    key = cache.key(tree)
+    assert os.listdir(os.path.join(directory, key[:2])) == [key]
+
+
+def test_output_version(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    directory = str(tmp_path / "cache")
+    tree = ast.parse("import os")
+    DecompileCache(directory=directory).decompile(tree)
+    # entries written before the output changed are not used
+    monkeypatch.setattr(cache_module, "OUTPUT_VERSION", cache_module.OUTPUT_VERSION + 1)
+    cache = DecompileCache(directory=directory)
+    assert cache.decompile(tree) == "import os\n"
+    assert (cache.stats.disk_hits, cache.stats.misses) == (0, 1)
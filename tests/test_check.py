@@ -0,0 +1,40 @@
+import ast
+from typing import Any, Tuple
+
+from ast_decompiler.check import find_difference
+
+
+def _difference(left: ast.AST, right: ast.AST) -> Tuple[str, Any, Any]:
+    difference = find_difference(left, right)
+    assert difference is not None
+    return difference
+
+
+def test_same() -> None:
+    assert find_difference(ast.parse("f(a, b=1)"), ast.parse("f(a, b=1)")) is None
+    # positions are ignored
+    assert find_difference(ast.parse("x = (1 +\n 2)"), ast.parse("x = 1 + 2")) is None
+    nan = ast.Constant(value=float("nan"))
+    assert find_difference(nan, ast.Constant(value=float("nan"))) is None
+
+
+def test_difference() -> None:
+    path, left, right = _difference(ast.parse("x = a + b"), ast.parse("x = a + c"))
+    assert path == "body[0].value.right.id"
+    assert (left, right) == ("b", "c")
+
+    path, left, right = _difference(ast.parse("f(a, b)"), ast.parse("f(a, *b)"))
+    assert path == "body[0].value.args[1]"
+    assert isinstance(left, ast.Name)
+    assert isinstance(right, ast.Starred)
+
+    path, left, right = _difference(ast.parse("f(a)"), ast.parse("f(a, b)"))
+    assert path == "body[0].value.args"
+    assert (len(left), len(right)) == (1, 2)
+
+    path, left, right = _difference(ast.Constant(value=0.0), ast.Constant(value=-0.0))
+    assert path == "value"
+
+    # the first difference in source order is reported
+    path, _, _ = _difference(ast.parse("x = 1\ny = 2"), ast.parse("z = 1\ny = 3"))
+    assert path == "body[0].targets[0].id"
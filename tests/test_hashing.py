@@ -0,0 +1,65 @@
+import ast
+import os
+import subprocess
+import sys
+
+from ast_decompiler.hashing import structural_hash, subtree_hashes
+
+CODE = """
+def f(a, b=1):
+    if a:
+        return [a, b]
+    return f(b)
+"""
+
+
+def test_structural_hash() -> None:
+    assert structural_hash(ast.parse("x = [a,\n  b]")) == structural_hash(
+        ast.parse("x = [a, b]")
+    )
+    hashes = {
+        structural_hash(ast.parse(code))
+        for code in ("x = 1", "x = 1.0", "x = True", "x = '1'", "x = b'1'", "y = 1")
+    }
+    assert len(hashes) == 6
+    assert structural_hash(ast.parse("f(a, b)")) != structural_hash(
+        ast.parse("f([a, b])")
+    )
+    assert structural_hash(ast.parse("if a: b\nc")) != structural_hash(
+        ast.parse("if a:\n    b\n    c")
+    )
+    assert len(structural_hash(ast.Load())) == 32
+
+
+def test_stable_across_processes() -> None:
+    code = (
+        "import ast; from ast_decompiler.hashing import structural_hash;"
+        f" print(structural_hash(ast.parse({CODE!r})))"
+    )
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", code],
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for seed in ("1", "2")
+    }
+    assert outputs == {structural_hash(ast.parse(CODE)) + "\n"}
+
+
+def test_subtree_hashes() -> None:
+    tree = ast.parse(CODE)
+    hashes = subtree_hashes(tree)
+    assert hashes[tree] == structural_hash(tree)
+    for node in ast.walk(tree):
+        assert hashes[node] == structural_hash(node)
+    function = tree.body[0]
+    assert isinstance(function, ast.FunctionDef)
+    returns = sorted(
+        (node for node in ast.walk(function) if isinstance(node, ast.Return)),
+        key=lambda node: node.lineno,
+    )
+    assert hashes[returns[0]] == structural_hash(ast.parse("return [a, b]").body[0])
+    assert hashes[returns[0]] != hashes[returns[1]]
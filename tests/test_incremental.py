@@ -0,0 +1,148 @@
+import ast
+from typing import Any, List
+
+import pytest
+
+from ast_decompiler import (
+    IncrementalState,
+    decompile,
+    decompile_incremental,
+    incremental,
+)
+
+CODE = """
+import os
+
+x = [aaaa, bbbb]
+
+
+class C:
+    def f(self):
+        return 1
+
+    def g(self):
+        return 2
+
+
+def h():
+    pass
+"""
+
+
+@pytest.fixture
+def rendered(monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    """Records the code rendered by decompile_incremental()."""
+    rendered = []
+
+    def recording_decompile(tree: ast.AST, **kwargs: Any) -> str:
+        code = decompile(tree, **kwargs)
+        rendered.append(code)
+        return code
+
+    monkeypatch.setattr(incremental, "decompile", recording_decompile)
+    return rendered
+
+
+def test_in_place(rendered: List[str]) -> None:
+    tree = ast.parse(CODE)
+    code = decompile(tree)
+    cls = tree.body[2]
+    assert isinstance(cls, ast.ClassDef)
+    method = cls.body[1]
+    assert isinstance(method, ast.FunctionDef)
+    statement = method.body[0]
+    assert isinstance(statement, ast.Return)
+    assert isinstance(statement.value, ast.Constant)
+    statement.value.value = 3
+    new_code = decompile_incremental(tree, code, tree)
+    assert new_code == decompile(tree)
+    # only the changed statement in the method is rendered
+    assert rendered == ["        return 3\n"]
+
+    rendered.clear()
+    tree.body.insert(0, ast.parse("import sys").body[0])
+    del tree.body[-1]
+    newer_code = decompile_incremental(tree, new_code, tree)
+    assert newer_code == decompile(tree)
+    assert rendered == ["import sys\n"]
+
+
+def test_state(rendered: List[str], monkeypatch: pytest.MonkeyPatch) -> None:
+    tree = ast.parse(CODE)
+    code = decompile(tree)
+    state = IncrementalState()
+    # the first call parses the code
+    assert decompile_incremental(tree, code, tree, state=state) == code
+    assert rendered == []
+
+    def fail(*args: object, **kwargs: object) -> None:
+        raise AssertionError("statements are hashed")
+
+    # later calls that pass the state and the changed statements do not hash statements
+    monkeypatch.setattr(incremental, "subtree_hashes", fail)
+    monkeypatch.setattr(incremental, "structural_hash", fail)
+    cls = tree.body[2]
+    assert isinstance(cls, ast.ClassDef)
+    method = cls.body[0]
+    assert isinstance(method, ast.FunctionDef)
+    [statement] = ast.parse("if x:\n    return 1").body
+    assert isinstance(statement, ast.If)
+    method.body = [statement]
+    code = decompile_incremental(tree, code, tree, state=state, changed=[method])
+    assert code == decompile(tree)
+    # a changed definition is rendered again, but not the rest of the class
+    assert rendered == [
+        "\n    def f(self):\n        pass\n",
+        "        if x:\n            return 1\n",
+    ]
+
+    # a change nested in a statement that is not spliced renders that statement
+    rendered.clear()
+    statement.body.append(ast.Pass())
+    code = decompile_incremental(tree, code, tree, state=state, changed=[statement])
+    assert code == decompile(tree)
+    assert rendered == ["        if x:\n            return 1\n            pass\n"]
+
+    rendered.clear()
+    [new_method] = ast.parse("def k(self): pass").body
+    cls.body.insert(1, new_method)
+    code = decompile_incremental(tree, code, tree, state=state, changed=[cls])
+    assert code == decompile(tree)
+    # the whole class is rendered: its header and each method's header and body
+    assert len(rendered) == 7
+    assert "class C" in rendered[0]
+    assert "def k(self)" in rendered[3]
+
+    # everything in a changed definition is rendered again, even if only a statement in its
+    # body was modified
+    rendered.clear()
+    assert isinstance(statement.test, ast.Name)
+    statement.test.id = "y"
+    code = decompile_incremental(tree, code, tree, state=state, changed=[method])
+    assert code == decompile(tree)
+    assert "if y:" in code
+    assert len(rendered) == 2
+
+    # the state only holds the code for the tree and code it was last updated with
+    with pytest.raises(AssertionError, match="hashed"):
+        decompile_incremental(tree, "\n" + code, tree, state=state, changed=[])
+
+
+def test_new_tree(rendered: List[str]) -> None:
+    old_tree = ast.parse(CODE)
+    code = decompile(old_tree, line_length=10, starting_indentation=4)
+    new_tree = ast.parse(CODE.replace("def g(self)", "def g(self, y)"))
+    new_code = decompile_incremental(
+        old_tree, code, new_tree, line_length=10, starting_indentation=4
+    )
+    assert new_code == decompile(new_tree, line_length=10, starting_indentation=4)
+    # the header of the method changed, so all of it is rendered, but nothing else
+    assert len(rendered) == 2
+    assert "def g(" in rendered[0]
+    assert rendered[1] == "            return 2\n"
+
+
+def test_unparseable_code(rendered: List[str]) -> None:
+    tree = ast.parse(CODE)
+    assert decompile_incremental(tree, "not python code", tree) == decompile(tree)
+    assert "x = [aaaa, bbbb]\n" in rendered
@@ -1,3 +1,9 @@
+import ast
+import copy
+
+from ast_decompiler import decompile
+from ast_decompiler.decompiler import Decompiler, LineBuffer, decompile_with_stats
+
 from .tests import assert_decompiles
 
 
@@ -181,3 +187,152 @@ def test_nesting() -> None:
 """,
         length_reduction=9,
     )
+
+
+def test_nested_display() -> None:
+    assert_decompiles(
+        "x = [a, [b, [c, [d, e]]]]\n",
+        """x = [
+    a,
+    [b, [c, [d, e]]],
+]
+""",
+        line_length=20,
+    )
+    assert_decompiles(
+        "x = [aaaa, [bbbb, [cccc, [dddd, eeee]]]]\n",
+        """x = [
+    aaaa,
+    [
+        bbbb,
+        [
+            cccc,
+            [
+                dddd,
+                eeee,
+            ],
+        ],
+    ],
+]
+""",
+        line_length=20,
+    )
+
+
+def test_deep_nesting() -> None:
+    # Used to take time exponential in the nesting depth.
+    code = "x = " + "[a, " * 100 + "b" + "]" * 100
+    decompiled = decompile(ast.parse(code), line_length=30)
+    assert ast.dump(ast.parse(decompiled)) == ast.dump(ast.parse(code))
+
+
+def test_flat_widths() -> None:
+    for line_length in (100, 5):
+        tree = ast.parse("x = [f(a, [b, c])]")
+        decompiler = Decompiler(
+            indentation=4, line_length=line_length, starting_indentation=0
+        )
+        decompiler.run(tree)
+        statement = tree.body[0]
+        assert isinstance(statement, ast.Assign)
+        assert isinstance(statement.value, ast.List)
+        call = statement.value.elts[0]
+        assert isinstance(call, ast.Call)
+        assert decompiler.flat_widths[call] == len("f(a, [b, c])")
+        assert decompiler.flat_widths[call.args[1]] == len("[b, c]")
+
+
+def test_line_buffer() -> None:
+    buffer = LineBuffer()
+    buffer.write_indentation(4)
+    buffer.write("x = ")
+    assert buffer.column == 8
+    checkpoint = buffer.checkpoint()
+    buffer.write("[")
+    buffer.write_newline()
+    buffer.write_indentation(8)
+    buffer.write("a")
+    assert buffer.column == 9
+    buffer.restore(checkpoint)
+    assert buffer.column == 8
+    buffer.write("[a]")
+    buffer.write_newline()
+    assert buffer.column == 0
+    assert buffer.getvalue() == "    x = [a]\n"
+
+
+def test_render_cache() -> None:
+    shared = ast.parse("f(a, [b, -c])", mode="eval").body
+    tree = ast.Module(
+        body=[ast.Expr(ast.List(elts=[shared] * 3, ctx=ast.Load()))], type_ignores=[]
+    )
+    for line_length in (100, 20, 10):
+        decompiler = Decompiler(
+            indentation=4, line_length=line_length, starting_indentation=0
+        )
+        result = decompiler.run(tree)
+        assert result == decompile(copy.deepcopy(tree), line_length=line_length)
+        # the first rendering of a node is not cached; the second one is
+        assert decompiler.render_cache_hits == 1
+
+
+def test_render_cache_context() -> None:
+    shared = ast.parse("a - b", mode="eval").body
+    code = "[f({}), g({}), h({}), {} - x, x - ({}), x - ({}), -({})]"
+    tree = ast.parse(code.format(*["shared"] * 7), mode="eval")
+    for node in ast.walk(tree):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.Name) and value.id == "shared":
+                setattr(node, field, shared)
+            elif isinstance(value, list):
+                value[:] = [
+                    (
+                        shared
+                        if isinstance(item, ast.Name) and item.id == "shared"
+                        else item
+                    )
+                    for item in value
+                ]
+    decompiler = Decompiler(indentation=4, line_length=100, starting_indentation=0)
+    result = decompiler.run(tree)
+    assert result == code.format(*["a - b"] * 7)
+    assert result == decompile(copy.deepcopy(tree))
+    # the rendering as an argument is reused for any call, and as the right operand for the
+    # same operator, but not as the left operand or as the operand of a unary operator
+    assert decompiler.render_cache_hits == 2
+
+
+def test_deep_tree() -> None:
+    # Rendering does not recurse, so this does not overflow the stack.
+    tree = ast.Name(id="a", ctx=ast.Load())
+    for _ in range(10000):
+        tree = ast.BinOp(
+            left=tree, op=ast.Add(), right=ast.Name(id="b", ctx=ast.Load())
+        )
+    decompiled = decompile(ast.Expression(body=tree))
+    assert decompiled == "a" + " + b" * 10000
+
+
+def test_layout_stats() -> None:
+    shared = ast.parse("f(a, b)", mode="eval").body
+    tree = ast.Module(
+        body=[
+            ast.Expr(ast.List(elts=[shared] * 3, ctx=ast.Load())),
+            ast.Expr(ast.Name(id="x", ctx=ast.Load())),
+        ],
+        type_ignores=[],
+    )
+    code, stats = decompile_with_stats(tree, line_length=10)
+    assert code == decompile(tree, line_length=10)
+    assert code == "[\n    f(a, b),\n    f(a, b),\n    f(a, b),\n]\nx\n"
+    assert stats.multiline_groups == 1
+    assert stats.lines == 6
+    # the second rendering of f(a, b) visits its four nodes again; the third is cached
+    assert stats.render_cache_hits == 1
+    assert stats.nodes_visited == stats.unique_nodes + 4
+    # Module, Expr, List, Call, _CallArgs, Name
+    assert stats.max_depth == 6
+    assert stats.fragments > 0
+
+    _, stats = decompile_with_stats(tree, line_length=100)
+    assert stats.multiline_groups == 0
@@ -0,0 +1,116 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from ast_decompiler import __main__
+from ast_decompiler.__main__ import main
+from ast_decompiler.files import find_files
+
+
+def test_main(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    package = tmp_path / "package"
+    package.mkdir()
+    (package / "a.py").write_text("x = [aaaa, bbbb]\n")
+    (package / "b.py").write_text("import os\n")
+    (package / "notes.txt").write_text("not python\n")
+    broken = tmp_path / "broken.py"
+    broken.write_text("def f(:\n")
+
+    assert main([str(package), "--line-length", "10", "--indentation", "2"]) == 0
+    out, err = capsys.readouterr()
+    assert out == "x = [\n  aaaa,\n  bbbb,\n]\nimport os\n"
+    assert "2 files (0 cached, 0 failed)" in err
+
+    assert main([str(package / "*.py"), str(broken), "--check", "-j", "2"]) == 1
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert f"{broken}: SyntaxError" in err
+    assert "3 files (0 cached, 1 failed)" in err
+
+
+def test_find_files(tmp_path: Path) -> None:
+    for path in ("json/a.py", "json/tool/b.py", "json/c.txt", "jsonx.py", "other/d.py"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+    # directories matched by a glob are searched like directories given directly
+    assert list(find_files([str(tmp_path / "jso*"), str(tmp_path / "missing.py")])) == [
+        str(tmp_path / "json" / "a.py"),
+        str(tmp_path / "json" / "tool" / "b.py"),
+        str(tmp_path / "jsonx.py"),
+        str(tmp_path / "missing.py"),
+    ]
+
+
+def _cache_files(cache_dir: Path) -> int:
+    return sum(len(filenames) for _, _, filenames in os.walk(cache_dir))
+
+
+def test_cache(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    source = tmp_path / "a.py"
+    source.write_text("a = b\n")
+    cache_dir = tmp_path / "cache"
+    for expected in ("0 cached", "1 cached"):
+        assert main([str(source), "--cache-dir", str(cache_dir)]) == 0
+        out, err = capsys.readouterr()
+        assert out == "a = b\n"
+        assert expected in err
+    assert _cache_files(cache_dir) == 1
+
+    # verification results are cached separately, without the code
+    for expected in ("0 cached", "1 cached"):
+        assert main([str(source), "--cache-dir", str(cache_dir), "--check"]) == 0
+        _, err = capsys.readouterr()
+        assert expected in err
+    assert _cache_files(cache_dir) == 2
+
+    # files that fail the check are not cached
+    broken = tmp_path / "broken.py"
+    broken.write_text("def f(:\n")
+    assert main([str(broken), "--cache-dir", str(cache_dir), "--check"]) == 1
+    capsys.readouterr()
+    assert _cache_files(cache_dir) == 2
+
+    # different options or contents are not cached
+    assert main([str(source), "--cache-dir", str(cache_dir), "--line-length", "5"]) == 0
+    capsys.readouterr()
+    source.write_text("a = c\n")
+    assert main([str(source), "--cache-dir", str(cache_dir)]) == 0
+    out, err = capsys.readouterr()
+    assert out == "a = c\n"
+    assert "0 cached" in err
+    assert _cache_files(cache_dir) == 4
+
+
+def test_cache_skips_parsing(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    source = tmp_path / "a.py"
+    source.write_text("a = b\n")
+    cache_dir = tmp_path / "cache"
+    assert main([str(source), "--cache-dir", str(cache_dir), "--check"]) == 0
+    capsys.readouterr()
+
+    def fail(*args: object, **kwargs: object) -> None:
+        raise AssertionError("parsed a cached file")
+
+    monkeypatch.setattr(__main__.ast, "parse", fail)
+    assert main([str(source), "--cache-dir", str(cache_dir), "--check"]) == 0
+    _, err = capsys.readouterr()
+    assert "1 cached" in err
+
+
+def test_cache_output_version(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    source = tmp_path / "a.py"
+    source.write_text("a = b\n")
+    cache_dir = tmp_path / "cache"
+    assert main([str(source), "--cache-dir", str(cache_dir)]) == 0
+    capsys.readouterr()
+    # code cached before the output changed is not used
+    monkeypatch.setattr(__main__, "OUTPUT_VERSION", __main__.OUTPUT_VERSION + 1)
+    assert main([str(source), "--cache-dir", str(cache_dir)]) == 0
+    _, err = capsys.readouterr()
+    assert "0 cached" in err
+    assert _cache_files(cache_dir) == 2
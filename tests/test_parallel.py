@@ -0,0 +1,124 @@
+import ast
+import os
+from pathlib import Path
+import pickle
+import threading
+from typing import Iterator, List
+
+import pytest
+
+from ast_decompiler import DecompileError, decompile, decompile_many, parallel
+from ast_decompiler.parallel import decompile_module
+
+
+def test_decompile_many(tmp_path: Path) -> None:
+    path = tmp_path / "module.py"
+    path.write_text("def f(x):\n    return x + 1\n")
+    sources = [
+        ast.parse("a = b"),
+        str(path),
+        path,
+        b"import os\n",
+        b"def f(:\n",
+        str(tmp_path / "missing.py"),
+    ]
+    expected = [
+        "a = b\n",
+        "\ndef f(x):\n    return x + 1\n",
+        "\ndef f(x):\n    return x + 1\n",
+        "import os\n",
+        None,
+        None,
+    ]
+    for workers in (1, 2):
+        results = list(decompile_many(sources, workers=workers, chunksize=2))
+        assert [result.position for result in results] == list(range(len(sources)))
+        assert [result.code for result in results] == expected
+        errors = [result.error for result in results[4:]]
+        assert [error.type_name for error in errors if error] == [
+            "SyntaxError",
+            "FileNotFoundError",
+        ]
+
+    results = decompile_many(sources, workers=2, ordered=False)
+    by_position = sorted(results, key=lambda result: result.position)
+    assert [result.code for result in by_position] == expected
+
+
+def test_decompile_many_window() -> None:
+    read = []
+
+    def sources() -> Iterator[bytes]:
+        for i in range(100):
+            read.append(i)
+            yield f"x = {i}\n".encode()
+
+    results = decompile_many(sources(), workers=2)
+    assert next(results).code == "x = 0\n"
+    # only the chunks in flight, and the one waiting to be submitted, have been read
+    assert len(read) <= 2 * parallel.MAX_CHUNKS_PER_WORKER + 1
+    assert [result.code for result in results] == [f"x = {i}\n" for i in range(1, 100)]
+
+
+def test_decompile_error(monkeypatch: pytest.MonkeyPatch) -> None:
+    class UnpicklableError(Exception):
+        def __init__(self) -> None:
+            super().__init__("cannot decompile")
+            self.lock = threading.Lock()
+
+    def failing_decompile(tree: ast.AST, **kwargs: object) -> str:
+        raise UnpicklableError
+
+    monkeypatch.setattr(parallel, "decompile", failing_decompile)
+    [result] = decompile_many([b"x = 1\n"], workers=1)
+    result = pickle.loads(pickle.dumps(result))
+    assert isinstance(result.error, DecompileError)
+    assert result.error.type_name == f"{__name__}.{UnpicklableError.__qualname__}"
+    assert str(result.error) == f"{result.error.type_name}: cannot decompile"
+
+
+class _KillingTree(ast.Module):
+    """A tree that kills the worker process it is sent to, as running out of memory would."""
+
+    def __reduce__(self) -> object:
+        return (os._exit, (1,))
+
+
+def test_decompile_many_worker_dies() -> None:
+    sources: List[parallel.Source] = [
+        b"x = 0\n",
+        _KillingTree(body=[], type_ignores=[]),
+    ]
+    sources += [f"x = {i}\n".encode() for i in range(1, 20)]
+    for ordered in (True, False):
+        results = list(decompile_many(sources, workers=2, ordered=ordered))
+        assert sorted(result.position for result in results) == list(range(21))
+        by_position = sorted(results, key=lambda result: result.position)
+        assert by_position[1].error is not None
+        assert by_position[1].error.type_name.endswith("BrokenProcessPool")
+        # inputs submitted after the worker died are decompiled in a new pool
+        assert by_position[-1].code == "x = 19\n"
+
+
+def test_decompile_many_options() -> None:
+    code = b"x = [aaaa, bbbb]\n"
+    [result] = decompile_many([code], workers=2, line_length=10, indentation=2)
+    assert result.code == decompile(ast.parse(code), line_length=10, indentation=2)
+
+
+def test_decompile_module(monkeypatch: pytest.MonkeyPatch) -> None:
+    code = "import os\n" + "".join(
+        f"def f{i}(x):\n    return [x, {i}]\nclass C{i}: pass\ny{i} = {i}\n"
+        for i in range(10)
+    )
+    tree = ast.parse(code)
+    expected = decompile(tree, line_length=20)
+    # too small to be worth rendering in parallel
+    assert decompile_module(tree, workers=2) == decompile(tree)
+
+    monkeypatch.setattr(parallel, "MIN_STATEMENTS_PER_WORKER", 4)
+    for workers in (2, 3, 100):
+        assert decompile_module(tree, workers=workers, line_length=20) == expected
+    assert decompile(tree, workers=2, line_length=20) == expected
+    expression = ast.parse("a + b", mode="eval")
+    assert decompile(expression, workers=2) == "a + b"
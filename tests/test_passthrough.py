@@ -0,0 +1,172 @@
+import ast
+import textwrap
+
+import pytest
+
+from ast_decompiler import ParsedSource, decompile, decompile_with_source
+from ast_decompiler.check import find_difference
+
+SOURCE = """\
+#!/usr/bin/env python
+import os  # for os.path
+import sys
+
+
+class C:
+  # two-space indentation is kept
+  def f(self):
+      x = {'a':1,
+           'b':2}
+      return x
+
+  def g(self): return 2
+
+
+if sys.argv: print("args"); print('twice')
+# the end
+"""
+
+
+def check(tree: ast.AST, source: str, expected: str) -> None:
+    code = decompile_with_source(tree, source)
+    assert code == expected
+    assert find_difference(tree, ast.parse(code)) is None
+
+
+def test_unchanged() -> None:
+    check(ast.parse(SOURCE), SOURCE, SOURCE)
+    check(ast.parse("x = 1"), "x = 1", "x = 1")
+    check(ast.parse("# only a comment\n"), "# only a comment\n", "# only a comment\n")
+
+
+def test_changed_statement() -> None:
+    tree = ast.parse(SOURCE)
+    cls = tree.body[2]
+    assert isinstance(cls, ast.ClassDef)
+    method = cls.body[0]
+    assert isinstance(method, ast.FunctionDef)
+    statement = method.body[1]
+    assert isinstance(statement, ast.Return)
+    assert isinstance(statement.value, ast.Name)
+    statement.value.id = "y"
+    expected = SOURCE.replace("      return x\n", "      return y\n")
+    check(tree, SOURCE, expected)
+
+
+def test_inserted_and_deleted() -> None:
+    tree = ast.parse(SOURCE)
+    cls = tree.body[2]
+    assert isinstance(cls, ast.ClassDef)
+    # the comments before a deleted statement are deleted with it, but the comments at the
+    # start of the module are kept
+    del tree.body[1]
+    del cls.body[0]
+    tree.body.insert(0, ast.parse("import re").body[0])
+    cls.body.append(ast.parse("z = 3").body[0])
+    expected = (
+        "#!/usr/bin/env python\n"
+        "import re\n"
+        "import os  # for os.path\n"
+        "\n"
+        "\n"
+        "class C:\n"
+        "  # two-space indentation is kept\n"
+        "\n"
+        "  def g(self): return 2\n"
+        "  z = 3\n" + SOURCE[SOURCE.index("\n\nif") :]
+    )
+    check(tree, SOURCE, expected)
+
+
+def test_rendered() -> None:
+    tree = ast.parse(SOURCE)
+    # statements that share a line with another are rendered when they change
+    block = tree.body[-1]
+    assert isinstance(block, ast.If)
+    expression = block.body[0]
+    assert isinstance(expression, ast.Expr)
+    assert isinstance(expression.value, ast.Call)
+    argument = expression.value.args[0]
+    assert isinstance(argument, ast.Constant)
+    argument.value = "no args"
+    cls = tree.body[2]
+    assert isinstance(cls, ast.ClassDef)
+    method = cls.body[1]
+    assert isinstance(method, ast.FunctionDef)
+    statement = method.body[0]
+    assert isinstance(statement, ast.Return)
+    assert isinstance(statement.value, ast.Constant)
+    statement.value.value = 3
+    expected = SOURCE.replace(
+        "  def g(self): return 2\n", "  def g(self):\n      return 3\n"
+    ).replace(
+        """if sys.argv: print("args"); print('twice')\n""",
+        "if sys.argv:\n    print('no args')\n    print('twice')\n",
+    )
+    check(tree, SOURCE, expected)
+
+
+def test_moved() -> None:
+    tree = ast.parse(SOURCE)
+    cls = tree.body[2]
+    assert isinstance(cls, ast.ClassDef)
+    # statements moved to another block are rendered, with its indentation; the comments
+    # before the body of a block are part of its header
+    method = cls.body[0]
+    assert isinstance(method, ast.FunctionDef)
+    cls.body.insert(0, method.body.pop())
+    expected = SOURCE.replace("      return x\n", "").replace(
+        "indentation is kept\n", "indentation is kept\n  return x\n"
+    )
+    check(tree, SOURCE, expected)
+
+
+def test_no_trailing_newline() -> None:
+    source = textwrap.dedent(
+        """\
+        def f():
+            return 1"""
+    )
+    tree = ast.parse(source)
+    function = tree.body[0]
+    assert isinstance(function, ast.FunctionDef)
+    function.body.append(ast.parse("return 2").body[0])
+    check(tree, source, "def f():\n    return 1\n    return 2\n")
+
+
+def test_parsed_source(monkeypatch: pytest.MonkeyPatch) -> None:
+    parsed = ParsedSource(SOURCE)
+    trees = [ast.parse(SOURCE) for _ in range(2)]
+    del trees[1].body[0]
+    expected = [decompile_with_source(tree, SOURCE) for tree in trees]
+
+    def fail(source: str) -> ast.Module:
+        raise AssertionError("the source is parsed again")
+
+    # the source is only parsed once, when the ParsedSource is created
+    monkeypatch.setattr(ast, "parse", fail)
+    assert [decompile_with_source(tree, parsed) for tree in trees] == expected
+    monkeypatch.undo()
+
+    tree = ast.parse("x = 1")
+    assert decompile_with_source(tree, ParsedSource("x = (")) == decompile(tree)
+
+
+def test_position_of_another_statement() -> None:
+    source = "import os\n\n# helper for x\nx = 1\n"
+    tree = ast.parse(source)
+    # new statements with the position of a statement of the source do not take its place,
+    # or its comments
+    statement = tree.body[1]
+    new = ast.copy_location(ast.parse("print('hi')").body[0], statement)
+    tree.body.insert(1, new)
+    tree.body.insert(0, ast.parse("import re").body[0])
+    expected = "import re\nimport os\nprint('hi')\n\n# helper for x\nx = 1\n"
+    check(tree, source, expected)
+    # a copy of a statement is only copied from the source once
+    tree.body.append(ast.parse("x = 1").body[0])
+    ast.copy_location(tree.body[-1], statement)
+    check(tree, source, expected + "x = 1\n")
+    # a statement at the position of a deleted one is rendered without its comments
+    del tree.body[-2:]
+    check(tree, source, "import re\nimport os\nprint('hi')\n")
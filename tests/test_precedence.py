@@ -1,3 +1,7 @@
+import ast
+
+from ast_decompiler.decompiler import _CallArgs, needs_parens
+
 from .tests import check
 
 
@@ -71,3 +75,30 @@ def test_Call() -> None:
     check("a.b(c, d)")
     check("f((yield a), b)")
     check("f(a, (yield b))")
+
+
+def test_needs_parens() -> None:
+    binop = ast.parse("(a - b) - (c - d)", mode="eval").body
+    assert isinstance(binop, ast.BinOp)
+    assert not needs_parens(binop.left, binop)
+    assert needs_parens(binop.right, binop)
+    assert not needs_parens(binop, None)
+
+    power = ast.parse("(a ** b) ** c", mode="eval").body
+    assert isinstance(power, ast.BinOp)
+    assert needs_parens(power.left, power)
+
+    attribute = ast.parse("(a or b).c", mode="eval").body
+    assert isinstance(attribute, ast.Attribute)
+    assert needs_parens(attribute.value, attribute)
+    call = ast.parse("f(a or b)", mode="eval").body
+    assert isinstance(call, ast.Call)
+    assert not needs_parens(call.args[0], _CallArgs(call.args))
+
+    assign = ast.parse("x = a, b").body[0]
+    assert isinstance(assign, ast.Assign)
+    assert not needs_parens(assign.value, assign)
+    subscript = ast.parse("x[a, b]", mode="eval").body
+    assert isinstance(subscript, ast.Subscript)
+    assert not needs_parens(subscript.slice, subscript)
+    assert not needs_parens(subscript.value, subscript)
@@ -0,0 +1,59 @@
+import ast
+
+from ast_decompiler import decompile
+from ast_decompiler.decompiler import Decompiler
+
+
+def test_profile() -> None:
+    tree = ast.parse("def f(x):\n    return g(x, 'a', 'b')\n")
+    decompiler = Decompiler(
+        indentation=4, line_length=100, starting_indentation=0, profile=True
+    )
+    assert decompiler.run(tree) == decompile(tree)
+    profile = decompiler.profile
+    assert profile is not None
+
+    stats = profile.as_dict()
+    assert stats["node_types"]["Constant"]["count"] == 2
+    assert stats["methods"]["write_string"]["count"] == 2
+    assert stats["methods"]["write_string"]["bytes_written"] == len("'a''b'")
+    assert stats["node_types"]["Call"]["bytes_written"] == len("g(x, 'a', 'b')")
+    module = stats["node_types"]["Module"]
+    assert module["bytes_written"] == len(decompile(tree))
+    assert 0 <= module["exclusive_time"] <= module["inclusive_time"]
+    call = stats["node_types"]["Call"]
+    assert call["exclusive_time"] < call["inclusive_time"]
+
+    report = profile.report()
+    assert "write_string" in report
+    assert "FunctionDef" in report
+    assert len(profile.report(limit=1).splitlines()) == 5
+
+    # other instances are not affected
+    assert (
+        Decompiler(indentation=4, line_length=100, starting_indentation=0).profile
+        is None
+    )
+    assert Decompiler.visitors[ast.Call] is Decompiler.visit_Call
+
+
+def test_profile_shared_subtree() -> None:
+    shared = ast.parse("f(a, b)", mode="eval").body
+    tree = ast.Module(
+        body=[ast.Expr(ast.List(elts=[shared] * 3, ctx=ast.Load()))], type_ignores=[]
+    )
+    decompiler = Decompiler(
+        indentation=4, line_length=100, starting_indentation=0, profile=True
+    )
+    code = decompiler.run(tree)
+    assert code == decompile(tree) == "[f(a, b), f(a, b), f(a, b)]\n"
+    assert decompiler.render_cache_hits == 1
+    profile = decompiler.profile
+    assert profile is not None
+
+    # the cached rendering counts towards the characters written, but not the count
+    stats = profile.as_dict()["node_types"]
+    assert stats["Call"]["count"] == 2
+    assert stats["Call"]["bytes_written"] == 3 * len("f(a, b)")
+    assert stats["List"]["bytes_written"] == len(code) - 1
+    assert stats["Module"]["bytes_written"] == len(code)
@@ -0,0 +1,22 @@
+"""Tests that the running time of the decompiler grows linearly with the size of the input."""
+
+import pytest
+
+from ast_decompiler.hashing import subtree_hashes
+from benchmarks.scaling import FAMILIES, growth_exponent
+
+# Linear growth gives an exponent of about 1; this leaves room for noisy timings while still
+# catching quadratic growth.
+MAX_EXPONENT = 1.5
+
+
+@pytest.mark.parametrize("name", sorted(FAMILIES))
+def test_linear_growth(name: str) -> None:
+    exponent = growth_exponent(FAMILIES[name])
+    assert exponent <= MAX_EXPONENT, f"{name} grows like size ** {exponent:.2f}"
+
+
+@pytest.mark.parametrize("name", ["binop_chain", "nested_calls", "nested_lists"])
+def test_subtree_hashes_linear_growth(name: str) -> None:
+    exponent = growth_exponent(FAMILIES[name], function=subtree_hashes)
+    assert exponent <= MAX_EXPONENT, f"{name} grows like size ** {exponent:.2f}"
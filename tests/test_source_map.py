@@ -0,0 +1,129 @@
+import ast
+import copy
+from typing import Tuple
+
+from ast_decompiler import decompile, decompile_with_source_map
+from .tests import skip_before
+
+CODE = """\
+import os
+
+
+@decorator
+class A(Base):
+    x: int = (yield)
+
+    def f(self, a, *args, b=3, **kwargs):
+        return -(a + b) * g(x for x in args)
+
+
+for i in range(10):
+    if i and not (i > 3 or i < 1):
+        print(f'{i}', 'caf\\xe9')
+    elif i > 5:
+        continue
+    elif i:
+        break
+    else:
+        pass
+
+
+try:
+    import sys
+except (ImportError, ValueError) as e:
+    raise
+except Exception:
+    pass
+else:
+    x = 1
+finally:
+    y = 2
+"""
+
+
+def _positions(node: ast.AST) -> Tuple[int, int, int, int]:
+    return (
+        getattr(node, "lineno"),
+        getattr(node, "col_offset"),
+        getattr(node, "end_lineno"),
+        getattr(node, "end_col_offset"),
+    )
+
+
+def check_positions(code: str, line_length: int = 100) -> None:
+    """Checks that applying the source map gives the positions that parsing the code gives."""
+    tree = ast.parse(code)
+    new_code, source_map = decompile_with_source_map(tree, line_length=line_length)
+    assert new_code == decompile(tree, line_length=line_length)
+    source_map.apply()
+    parsed = ast.parse(new_code)
+    for node, parsed_node in zip(ast.walk(tree), ast.walk(parsed)):
+        assert type(node) is type(parsed_node)
+        if "lineno" in node._attributes and not isinstance(
+            node, (ast.JoinedStr, ast.FormattedValue)
+        ):
+            assert _positions(node) == _positions(parsed_node), ast.dump(node)
+
+
+def test_positions() -> None:
+    check_positions(CODE)
+    check_positions("x = [1, 2]\n")
+    check_positions("été = 'été' + 1\n")
+
+
+@skip_before((3, 11))
+def test_try_star() -> None:
+    check_positions("try:\n    pass\nexcept* OSError:\n    pass\n")
+
+
+def test_multiline_groups() -> None:
+    check_positions(CODE, line_length=20)
+    check_positions(
+        "x = (aaaaaaaaaa and bbbbbbbbbb) + (cccccccccc or dddddddddd)\n", line_length=30
+    )
+    check_positions(
+        "x = f(aaaaaaaaaa + bbbbbbbbbb for aaaaaaaaaa in cccccccccc)\n", line_length=30
+    )
+
+
+def test_table() -> None:
+    tree = ast.parse("def f():\n    return a + b\n")
+    code, source_map = decompile_with_source_map(tree)
+    assert code == "\ndef f():\n    return a + b\n"
+    assert len(source_map) == len(source_map.start_lines)
+    assert source_map.start_offsets.typecode == "l"
+
+    definition = tree.body[0]
+    assert isinstance(definition, ast.FunctionDef)
+    statement = definition.body[0]
+    assert isinstance(statement, ast.Return)
+    binop = statement.value
+    assert isinstance(binop, ast.BinOp)
+    position = source_map.find(binop)
+    assert position is not None
+    assert position.node is binop
+    assert (position.start_line, position.start_column) == (3, 11)
+    assert (position.end_line, position.end_column) == (3, 16)
+    assert code[position.start_offset : position.end_offset] == "a + b"
+
+    function = source_map.find(tree.body[0])
+    assert function is not None
+    assert code[function.start_offset : function.end_offset] == code.strip()
+    assert list(source_map)[0].node is tree
+    assert source_map.find(ast.Pass()) is None
+
+
+def test_shared_nodes() -> None:
+    name = ast.Name(id="x", ctx=ast.Load())
+    tree = ast.parse("a = y, y\n")
+    assignment = tree.body[0]
+    assert isinstance(assignment, ast.Assign)
+    assert isinstance(assignment.value, ast.Tuple)
+    assignment.value.elts = [name, copy.copy(name), name]
+    code, source_map = decompile_with_source_map(tree)
+    assert code == "a = x, x, x\n"
+    rows = [position for position in source_map if position.node is name]
+    assert [position.start_column for position in rows] == [4, 10]
+    position = source_map.find(name)
+    assert position is not None
+    assert position.start_column == 10
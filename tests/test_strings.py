@@ -0,0 +1,42 @@
+from ast_decompiler.literals import StringRenderer, escape_character
+from .tests import assert_decompiles, check
+
+
+def test_quotes() -> None:
+    assert_decompiles("x = 'it\\'s'", 'x = "it\'s"\n')
+    assert_decompiles("x = '\"a\" \\'b\\''", "x = '\"a\" \\'b\\''\n")
+    assert_decompiles('x = u"isn\'t"', 'x = u"isn\'t"\n')
+
+
+def test_escapes() -> None:
+    for char in "\\\t\n\r\x00\x7f\x80\xe9\u20ac\U0001f600\ud800":
+        expected = char.encode("unicode-escape", "backslashreplace").decode("ascii")
+        assert escape_character(char) == expected
+    assert_decompiles("x = 'caf\\xe9\\t\\U0001f600'", "x = 'caf\\xe9\\t\\U0001f600'\n")
+    check("x = 'a\\x00b\\u2028c'")
+
+
+def test_docstrings() -> None:
+    assert_decompiles(
+        'def f():\n    """Match \\\\n.\n\n    And \\xe9."""\n',
+        '\ndef f():\n    """Match \\\\n.\n\n    And \\xe9."""\n',
+    )
+    assert_decompiles("'ends in \"'", '"""ends in \\""""\n')
+    assert_decompiles('\'has """\'', '\'has """\'\n')
+
+
+def test_f_strings() -> None:
+    assert_decompiles("f'{x} {{}} \\'\\xe9'", "f'{x} {{}} \\'\\xe9'\n")
+    assert_decompiles("f'{x:{\"a\"}}'", "f'{x:{\"a\"}}'\n")
+
+
+def test_memoized() -> None:
+    renderer = StringRenderer()
+    literal = renderer.literal("caf\xe9")
+    assert literal == "'caf\\xe9'"
+    assert renderer.literal("caf\xe9") is literal
+    docstring = renderer.docstring("line\nline")
+    assert docstring == '"""line\nline"""'
+    assert renderer.docstring("line\nline") is docstring
+    assert renderer.docstring('a """ b') is None
+    assert renderer.f_string_part("{}") == "{{}}"
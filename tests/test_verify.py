@@ -0,0 +1,88 @@
+import ast
+import json
+from pathlib import Path
+import time
+from typing import Any
+
+import pytest
+
+from ast_decompiler import decompile, verify
+from ast_decompiler.verify import FileReport, find_slow, main, verify_files
+
+
+def _broken_decompile(tree: ast.AST, **kwargs: Any) -> str:
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    if "bad" in names:
+        raise ValueError("bad name")
+    if "slow" in names:
+        time.sleep(1)
+    return decompile(tree, **kwargs)
+
+
+def test_verify_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(verify, "decompile", _broken_decompile)
+    (tmp_path / "good.py").write_text("x = [a, b]\n")
+    (tmp_path / "invalid.py").write_text("def f(:\n")
+    (tmp_path / "bad.py").write_text(
+        "import os\n\nclass C:\n    def f(self):\n        x = 1\n        return bad\n"
+    )
+    (tmp_path / "slow.py").write_text("x = slow\n")
+    paths = [str(tmp_path / name) for name in ("good.py", "invalid.py", "bad.py")]
+    paths.append(str(tmp_path / "slow.py"))
+
+    reports = list(verify_files(paths, workers=1, timeout=0.1))
+    assert [report.status for report in reports] == [
+        "ok",
+        "skipped",
+        "failed",
+        "timeout",
+    ]
+    assert reports[0].source_size == 11
+    assert reports[2].message == "ValueError: bad name"
+    assert reports[2].snippet == "return bad\n"
+
+
+def test_verify_files_errors(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # parsing this raises MemoryError
+    (tmp_path / "deep.py").write_text("x = " + "-" * 200_000 + "1\n")
+    (tmp_path / "good.py").write_text("x = 1\n")
+    paths = [str(tmp_path / "deep.py"), str(tmp_path / "good.py")]
+    reports = list(verify_files(paths, workers=2))
+    assert [report.status for report in reports] == ["skipped", "ok"]
+
+    def fail(*args: object) -> None:
+        raise RecursionError("too deep")
+
+    # errors while looking for the snippet are not reported as the failure
+    monkeypatch.setattr(verify, "decompile", _broken_decompile)
+    monkeypatch.setattr(verify, "find_snippet", fail)
+    (tmp_path / "bad.py").write_text("x = bad\n")
+    [report] = verify_files([str(tmp_path / "bad.py")], workers=1)
+    assert report.status == "failed"
+    assert report.message == "ValueError: bad name"
+    assert report.snippet is None
+
+
+def test_find_slow() -> None:
+    reports = [
+        FileReport(f"{i}.py", "ok", None, None, 0.1, 1000) for i in range(10)
+    ] + [
+        FileReport("slow.py", "ok", None, None, 2.0, 1000),
+        FileReport("big.py", "ok", None, None, 5.0, 100000),
+        FileReport("timeout.py", "timeout", None, None, 60.0, 10),
+    ]
+    assert [report.path for report in find_slow(reports)] == ["slow.py", "timeout.py"]
+
+
+def test_main(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    for i in range(4):
+        (tmp_path / f"{i}.py").write_text(f"x = {i}\n")
+    report = tmp_path / "report.jsonl"
+    assert (
+        main([str(tmp_path), "-j", "2", "--shard", "1/2", "--report", str(report)]) == 0
+    )
+    _, err = capsys.readouterr()
+    assert "2 files" in err
+    assert "2 ok, 0 failed" in err
+    lines = [json.loads(line) for line in report.read_text().splitlines()]
+    assert [Path(line["path"]).name for line in lines] == ["1.py", "3.py"]